@@ -0,0 +1,3 @@
+"""
+Benchmarks of the worklist generators, run with python -m benchmarks.run
+"""
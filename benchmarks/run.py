@@ -0,0 +1,233 @@
+"""
+Benchmarks of the worklist generators on synthetic runs of increasing size.
+
+Each case is run for every scale (number of plates) and timed stage by stage:
+
+    parse       loading each input file with the generator's schema
+    setup       building the generator, which parses the files again and
+                fills the plates
+    transfers   building the transfer table
+    format_*    making the files for each equipment format in memory
+    layout      making the plate layout data
+    write       making the Mosquito and other files in a file store on disk
+
+Stage times are the best of --repeat runs. Peak memory of each stage is
+measured with tracemalloc in a separate run, as tracing slows the code down.
+
+Results are saved as JSON. Given a baseline (an earlier results file) every
+stage that is slower by more than the threshold, and by more than
+--min-seconds, is reported as a regression and the exit status is 1.
+
+    python -m benchmarks.run -s 1,10,100 -o results.json
+    python -m benchmarks.run -o new.json --baseline results.json --threshold 0.2
+"""
+import io
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+from toolbox.filestore import DiskFileStore
+from toolbox.generators.formatters import FORMATS
+from toolbox.generators.partpooling import PartPoolingGenerator
+from toolbox.generators.librarypooling import LibraryPoolingGenerator
+from toolbox.generators.matrix import PlateMatrixGenerator
+from toolbox.loader import load_csv
+from .synthetic import partpooling_inputs, librarypooling_inputs, matrix_inputs
+
+
+# Case name -> (generator class, input function)
+CASES = {
+    'partpooling': (PartPoolingGenerator, partpooling_inputs),
+    'librarypooling': (LibraryPoolingGenerator, librarypooling_inputs),
+    'matrix': (PlateMatrixGenerator, matrix_inputs),
+}
+
+DEFAULT_SCALES = (1, 10, 100)
+
+
+class Stages(object):
+    """
+    Time, and optionally trace the peak memory of, the stages of a run
+    """
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.seconds = {}
+        self.peak_bytes = {}
+
+    @contextmanager
+    def stage(self, name):
+        if self.trace:
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        yield
+        self.seconds[name] = time.perf_counter() - started
+        if self.trace:
+            self.peak_bytes[name] = tracemalloc.get_traced_memory()[1] - start_bytes
+
+
+def open_files(files):
+    return {key: io.StringIO(text) for key, text in files.items()}
+
+
+def run_once(GeneratorClass, files, parameters, stages, directory):
+    with stages.stage('parse'):
+        for key, text in files.items():
+            if key in GeneratorClass.FILE_SCHEMAS:
+                load_csv(io.StringIO(text), GeneratorClass.FILE_SCHEMAS[key])
+    with stages.stage('setup'):
+        generator = GeneratorClass(supplied_files=open_files(files), **parameters)
+    with stages.stage('transfers'):
+        generator.transfers
+    for equipment_format in sorted(FORMATS):
+        with stages.stage('format_{}'.format(equipment_format)):
+            generator.make_outputs(equipment_format)
+    with stages.stage('layout'):
+        generator.make_plate_layout_data()
+    generator.write_to = DiskFileStore(directory)
+    generator.run = generator.write_to.new_run()
+    with stages.stage('write'):
+        generator.make_outputs('mosquito')
+        generator.make_other_files()
+
+
+def run_case(name, plates, repeat=3, memory=True, seed=0):
+    """
+    Benchmark one case at one scale, returning the stage times in seconds,
+    the peak memory of each stage in bytes and the size of the run
+    """
+    GeneratorClass, make_inputs = CASES[name]
+    files, parameters = make_inputs(plates, seed=seed)
+    directory = tempfile.mkdtemp(prefix='toolbox-benchmark-')
+    try:
+        best = {}
+        for i in range(repeat):
+            stages = Stages()
+            run_once(GeneratorClass, files, parameters, stages, directory)
+            for stage, seconds in stages.seconds.items():
+                best[stage] = min(seconds, best.get(stage, seconds))
+        peak_bytes = {}
+        if memory:
+            stages = Stages(trace=True)
+            tracemalloc.start()
+            try:
+                run_once(GeneratorClass, files, parameters, stages, directory)
+            finally:
+                tracemalloc.stop()
+            peak_bytes = stages.peak_bytes
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {
+        'plates': plates,
+        'input_bytes': sum(len(text) for text in files.values()),
+        'seconds': {stage: round(seconds, 6) for stage, seconds in best.items()},
+        'total_seconds': round(sum(best.values()), 6),
+        'peak_bytes': peak_bytes,
+    }
+
+
+def run_benchmarks(cases, scales, repeat=3, memory=True, seed=0, progress=None):
+    results = {}
+    for name in cases:
+        for plates in scales:
+            key = '{}/{}'.format(name, plates)
+            results[key] = run_case(name, plates, repeat=repeat, memory=memory, seed=seed)
+            if progress:
+                progress(key, results[key])
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'created': time.time(),
+        'repeat': repeat,
+        'seed': seed,
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold=0.2, min_seconds=0.005):
+    """
+    Stages slower than in the baseline by more than the threshold (a
+    fraction) and by more than min_seconds, as (case, stage, baseline
+    seconds, new seconds). Cases or stages missing from either are skipped.
+    """
+    regressions = []
+    for key, result in sorted(results['results'].items()):
+        old = baseline['results'].get(key)
+        if old is None:
+            continue
+        for stage, seconds in sorted(result['seconds'].items()):
+            old_seconds = old['seconds'].get(stage)
+            if old_seconds is None:
+                continue
+            if seconds > old_seconds * (1 + threshold) and seconds - old_seconds > min_seconds:
+                regressions.append((key, stage, old_seconds, seconds))
+    return regressions
+
+
+def print_result(key, result):
+    stages = ', '.join('{} {:.3f}s'.format(stage, seconds)
+                       for stage, seconds in result['seconds'].items())
+    peak = max(result['peak_bytes'].values()) if result['peak_bytes'] else None
+    line = '{:20} {:.3f}s ({})'.format(key, result['total_seconds'], stages)
+    if peak is not None:
+        line += ' peak {:.1f}MB'.format(peak / 1024 / 1024)
+    print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the worklist generators')
+    parser.add_argument('-c', '--cases', default=','.join(CASES),
+                        help='Comma separated cases to run (default: all)')
+    parser.add_argument('-s', '--scales', default=','.join(map(str, DEFAULT_SCALES)),
+                        help='Comma separated numbers of plates (default: 1,10,100)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Runs of each case to take the best time of')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Skip measuring peak memory')
+    parser.add_argument('-o', '--output', default='benchmark.json',
+                        help='File to save the results to')
+    parser.add_argument('-b', '--baseline', default=None,
+                        help='Earlier results to compare with')
+    parser.add_argument('-t', '--threshold', type=float, default=0.2,
+                        help='Slowdown, as a fraction, counted as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help='Smallest slowdown in seconds counted as a regression')
+    args = parser.parse_args(argv)
+
+    cases = [case.strip() for case in args.cases.split(',') if case.strip()]
+    for case in cases:
+        if case not in CASES:
+            parser.error('Unknown case {}'.format(case))
+    scales = [int(scale) for scale in args.scales.split(',') if scale.strip()]
+
+    results = run_benchmarks(cases, scales, repeat=args.repeat, memory=not args.no_memory,
+                             seed=args.seed, progress=print_result)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        for key, stage, old_seconds, seconds in regressions:
+            print('REGRESSION {} {}: {:.3f}s -> {:.3f}s ({:+.0%})'.format(
+                key, stage, old_seconds, seconds, seconds / old_seconds - 1))
+        if regressions:
+            return 1
+        print('No regressions against {}'.format(args.baseline))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
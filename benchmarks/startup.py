@@ -0,0 +1,152 @@
+"""
+Benchmarks of how long the command line takes to start.
+
+Each command is run as a new Python process --repeat times and the median wall
+time kept, which is what a pipeline calling "python -m toolbox" once per
+worklist pays. Importing the web app is timed alongside for comparison. The
+command line must not import Flask, which is checked from -X importtime.
+
+Results are saved in the same form as benchmarks.run, so a baseline can be
+compared the same way.
+
+    python -m benchmarks.startup -o startup.json
+    python -m benchmarks.startup -o new.json --baseline startup.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import subprocess
+from statistics import median
+
+from .synthetic import partpooling_inputs
+from .run import compare
+
+
+def commands(directory):
+    """
+    Name -> arguments to python of each command timed, writing any input
+    files to the directory
+    """
+    files, parameters = partpooling_inputs(1)
+    file_arguments = []
+    for key, text in files.items():
+        path = os.path.join(directory, '{}.csv'.format(key))
+        with open(path, 'w', newline='') as f:
+            f.write(text)
+        file_arguments.extend(['-f', '{}={}'.format(key, path)])
+    parameter_arguments = []
+    for name, value in parameters.items():
+        parameter_arguments.extend(['-p', '{}={}'.format(name, value)])
+    return {
+        'python': ['-c', 'pass'],
+        'help': ['-m', 'toolbox', '--help'],
+        'list': ['-m', 'toolbox', 'list'],
+        'generate': ['-m', 'toolbox', 'generate', 'partpooling'] + file_arguments +
+                    parameter_arguments + ['-o', os.path.join(directory, 'outputs')],
+        'app_import': ['-c', 'import toolbox.app'],
+    }
+
+
+def run_command(arguments, environment):
+    started = time.perf_counter()
+    subprocess.run([sys.executable] + arguments, env=environment, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def imported_modules(arguments, environment):
+    """
+    Top level packages imported by a command, from -X importtime
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + arguments, env=environment,
+                             check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+    modules = set()
+    for line in process.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            modules.add(line.rsplit('|', 1)[1].strip().split('.')[0])
+    return modules
+
+
+def run_benchmarks(repeat=10, progress=None):
+    directory = tempfile.mkdtemp(prefix='toolbox-startup-')
+    environment = dict(os.environ)
+    # Run the toolbox in this tree, wherever the benchmark is run from
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment['PYTHONPATH'] = os.pathsep.join(
+        path for path in [root, environment.get('PYTHONPATH')] if path)
+    try:
+        results = {}
+        for name, arguments in commands(directory).items():
+            # One run to warm the file system cache and write bytecode
+            run_command(arguments, environment)
+            seconds = [run_command(arguments, environment) for i in range(repeat)]
+            key = 'startup/{}'.format(name)
+            results[key] = {
+                'seconds': {'wall': round(median(seconds), 6)},
+                'min_seconds': round(min(seconds), 6),
+            }
+            if progress:
+                progress(key, results[key])
+        list_arguments = ['-m', 'toolbox', 'list']
+        flask_imported = 'flask' in imported_modules(list_arguments, environment)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'created': time.time(),
+        'repeat': repeat,
+        'flask_imported': flask_imported,
+        'results': results,
+    }
+
+
+def print_result(key, result):
+    print('{:20} {:.3f}s (best {:.3f}s)'.format(key, result['seconds']['wall'],
+                                                 result['min_seconds']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the start up of the command line')
+    parser.add_argument('-r', '--repeat', type=int, default=10,
+                        help='Runs of each command to take the median time of')
+    parser.add_argument('-o', '--output', default='startup.json',
+                        help='File to save the results to')
+    parser.add_argument('-b', '--baseline', default=None,
+                        help='Earlier results to compare with')
+    parser.add_argument('-t', '--threshold', type=float, default=0.2,
+                        help='Slowdown, as a fraction, counted as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.01,
+                        help='Smallest slowdown in seconds counted as a regression')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(repeat=args.repeat, progress=print_result)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    status = 0
+    if results['flask_imported']:
+        print('The command line imports Flask')
+        status = 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        for key, stage, old_seconds, seconds in regressions:
+            print('REGRESSION {} {}: {:.3f}s -> {:.3f}s ({:+.0%})'.format(
+                key, stage, old_seconds, seconds, seconds / old_seconds - 1))
+        if regressions:
+            status = 1
+        else:
+            print('No regressions against {}'.format(args.baseline))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Seeded synthetic inputs for the worklist generators.
+
+Each function returns the input files of a run as a dict of file key (as the
+generator expects it) to CSV text, together with the form parameters the run
+needs, scaled by the number of destination plates (or source plates for
+library pooling). The same seed always gives the same files.
+
+The files can be written out to use with the web app or the batch runner:
+
+    python -m benchmarks.synthetic partpooling 10 inputs/
+"""
+import os
+import sys
+import random
+import argparse
+
+from toolbox.generators.headers import CONSTRUCTS_CSV, PARTS_CSV, PARTS_LOCATION_CSV, \
+    VOLUMES_CSV, SOURCES_CSV
+from toolbox.generators.wells import WellIndex
+
+
+def csv_text(headers, rows):
+    lines = [','.join(headers)]
+    lines.extend(','.join(str(value) for value in row) for row in rows)
+    return '\n'.join(lines) + '\n'
+
+
+def partpooling_inputs(plates, number_of_wells=96, seed=0, parts_per_slot=12):
+    """
+    A constructs file filling the given number of destination plates, and a
+    parts catalogue with parts_per_slot parts for each slot on one plate
+    """
+    rng = random.Random(seed)
+    slots = [slot for slot in CONSTRUCTS_CSV if slot != 'Master Mix']
+    parts = {slot: ['{}_{}'.format(slot, i) for i in range(parts_per_slot)] for slot in slots}
+    names = WellIndex.get(number_of_wells).names
+    if len(slots) * parts_per_slot > len(names):
+        raise Exception('The parts do not fit on one {} well plate'.format(number_of_wells))
+
+    part_rows = []
+    location_rows = []
+    for slot, slot_parts in parts.items():
+        for name in slot_parts:
+            barcode = 'BC{}'.format(len(part_rows))
+            # Concentrations that keep every transfer above the smallest volume
+            concentration = rng.choice([100, 150, 200]) if slot == 'Backbone' else \
+                rng.choice([50, 100, 150, 200])
+            part_rows.append((name, concentration, barcode, 1000))
+            location_rows.append((names[len(location_rows)], barcode))
+
+    construct_rows = []
+    for i in range(plates * number_of_wells):
+        row = []
+        for slot in slots:
+            # Promoter, CDS and Backbone are always used, other slots at random
+            if slot in ('Promoter', 'CDS', 'Backbone') or rng.random() > 0.3:
+                row.append(rng.choice(parts[slot]))
+            else:
+                row.append('')
+        row.append(2)
+        construct_rows.append(row)
+
+    files = {
+        'constructs_file': csv_text(CONSTRUCTS_CSV, construct_rows),
+        'parts_file': csv_text(PARTS_CSV, part_rows),
+        'parts_location_file': csv_text(PARTS_LOCATION_CSV, location_rows),
+    }
+    return files, {'number_of_wells': number_of_wells}
+
+
+def librarypooling_inputs(plates, number_of_wells=96, seed=0, pool_size=2):
+    """
+    A volumes file with a full plate of samples on each of the given number
+    of source plates, pooling the samples of pool_size source plates into
+    each pooling plate
+    """
+    rng = random.Random(seed)
+    names = WellIndex.get(number_of_wells).names
+    rows = []
+    for plate in range(plates):
+        for well in names:
+            rows.append((plate + 1, well, 'S{}_{}'.format(plate + 1, well),
+                         round(rng.uniform(0.5, 3), 2), rng.choice(names),
+                         plate // pool_size + 1))
+    pools = (plates + pool_size - 1) // pool_size
+    # Pools go in the positions after the source plates
+    pooling_locations = ','.join(str(plates + 1 + i) for i in range(pools))
+    files = {'volumes': csv_text(VOLUMES_CSV + ['destination plate'], rows)}
+    return files, {'number_of_wells': number_of_wells, 'pooling_locations': pooling_locations}
+
+
+def matrix_inputs(plates, number_of_wells=384, seed=0, substances=40):
+    """
+    A sources file with the given number of substances and a mix, and a
+    stacked plate matrix of the given number of plates with a fifth of the
+    wells left empty
+    """
+    rng = random.Random(seed)
+    index = WellIndex.get(number_of_wells)
+    source_rows = [(1 + i // number_of_wells, index.names[i % number_of_wells], 'C{}'.format(i))
+                   for i in range(substances)]
+    source_rows.append((2 + substances // number_of_wells, index.names[0], 'MIX'))
+    lines = []
+    for plate in range(plates):
+        if plate:
+            lines.append('')
+        for row in range(index.rows):
+            cells = []
+            for column in range(index.columns):
+                if rng.random() < 0.2:
+                    cells.append('')
+                else:
+                    cells.append('C{}{}'.format(rng.randrange(substances),
+                                                '(MIX)' if rng.random() < 0.5 else ''))
+            lines.append(','.join(cells))
+    files = {
+        'sources': csv_text(SOURCES_CSV, source_rows),
+        'matrix': '\n'.join(lines) + '\n',
+    }
+    return files, {'number_of_wells': number_of_wells}
+
+
+INPUTS = {
+    'partpooling': partpooling_inputs,
+    'librarypooling': librarypooling_inputs,
+    'matrix': matrix_inputs,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write synthetic generator input files')
+    parser.add_argument('generator', choices=sorted(INPUTS))
+    parser.add_argument('plates', type=int, help='Number of plates to scale the run to')
+    parser.add_argument('directory', help='Directory to write the files to')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    files, parameters = INPUTS[args.generator](args.plates, seed=args.seed)
+    os.makedirs(args.directory, exist_ok=True)
+    for key, text in files.items():
+        with open(os.path.join(args.directory, '{}.csv'.format(key)), 'w', newline='') as f:
+            f.write(text)
+    print('Parameters: {}'.format(parameters))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
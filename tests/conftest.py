@@ -0,0 +1,18 @@
+import io
+
+import pytest
+
+from benchmarks.synthetic import partpooling_inputs
+
+
+def open_files(files):
+    return {key: io.StringIO(text) for key, text in files.items()}
+
+
+@pytest.fixture
+def partpooling_files():
+    """
+    Constructs, parts and part locations files for one plate of constructs
+    """
+    files, parameters = partpooling_inputs(1, seed=1)
+    return files
@@ -0,0 +1,89 @@
+import io
+import time
+from functools import partial
+
+import pytest
+
+import toolbox.app as app_module
+from toolbox.cache import ResultCache, make_key
+from toolbox.filestore import MemoryFileStore
+from toolbox.inventory import PartInventory
+from toolbox.jobs import MemoryJobQueue, QUEUED, RUNNING, DONE, run_worklist
+
+
+@pytest.fixture
+def app(tmpdir, monkeypatch):
+    """
+    The app with an inventory, and a file store, job queue and result cache
+    of its own
+    """
+    store = MemoryFileStore()
+    inventory = PartInventory(str(tmpdir.join('inventory.sqlite')))
+    cache = ResultCache(validate=lambda result: True)
+    queue = MemoryJobQueue(partial(run_worklist, write_to=store, inventory=inventory),
+                           workers=1, cache=cache)
+    monkeypatch.setattr(app_module, 'FILE_STORE', store)
+    monkeypatch.setattr(app_module, 'INVENTORY', inventory)
+    monkeypatch.setattr(app_module, 'RESULT_CACHE', cache)
+    monkeypatch.setattr(app_module, 'JOB_QUEUE', queue)
+    return app_module.app.test_client()
+
+
+def submit(client, files, **form):
+    data = {key: (io.BytesIO(text.encode('utf-8')), '{}.csv'.format(key))
+            for key, text in files.items()}
+    data.update(form)
+    response = client.post('/worklists/partpooling/', data=data)
+    assert response.status_code == 302
+    job_id = response.location.rstrip('/').split('/')[-1]
+    for i in range(100):
+        job = app_module.JOB_QUEUE.get(job_id)
+        if job['status'] not in (QUEUED, RUNNING):
+            break
+        time.sleep(0.05)
+    assert job['status'] == DONE, job['error']
+    return job
+
+
+def test_resubmitting_with_parts_files_hits_the_cache(app, partpooling_files):
+    for i in range(3):
+        submit(app, partpooling_files)
+    stats = app_module.RESULT_CACHE.stats()
+    assert (stats['hits'], stats['misses']) == (2, 1)
+    assert app_module.INVENTORY.version() == 0
+
+
+def test_resubmitting_from_the_inventory_hits_the_cache(app, partpooling_files):
+    submit(app, partpooling_files, update_inventory='on')
+    constructs = {'constructs_file': partpooling_files['constructs_file']}
+    for i in range(3):
+        submit(app, constructs)
+    stats = app_module.RESULT_CACHE.stats()
+    assert (stats['hits'], stats['misses']) == (2, 2)
+
+
+def test_runs_updating_the_inventory_are_not_reused(app, partpooling_files):
+    for i in range(3):
+        submit(app, partpooling_files, update_inventory='on')
+    stats = app_module.RESULT_CACHE.stats()
+    assert (stats['hits'], stats['misses']) == (0, 3)
+    barcode = app_module.INVENTORY.parts(['Promoter_0'])['Promoter_0']['Barcode']
+    assert len(app_module.INVENTORY.history(barcode)) == 3
+
+
+def test_keys_ignore_whitespace_and_default_equipment():
+    hashes = {'constructs_file': 'a' * 64}
+    assert make_key('partpooling', {'number_of_wells': ' 96 '}, hashes) == \
+        make_key('partpooling', {'number_of_wells': '96', 'equipment': 'mosquito'}, hashes)
+    assert make_key('partpooling', {}, hashes) != make_key('partpooling', {}, {'x': 'a' * 64})
+
+
+def test_least_recently_used_results_are_evicted():
+    cache = ResultCache(max_entries=2)
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    assert cache.get('a') == {'n': 1}
+    cache.put('c', {'n': 3})
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ({'n': 1}, {'n': 3})
+    assert cache.stats()['evictions'] == 1
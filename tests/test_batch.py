@@ -0,0 +1,70 @@
+import os
+import re
+import json
+
+import pytest
+
+from toolbox.batch import load_manifest, run_batch, main
+
+from test_parity import DATA, GENERATORS, read
+
+
+def write_manifest(tmpdir, jobs):
+    path = str(tmpdir.join('manifest.json'))
+    with open(path, 'w') as f:
+        json.dump({'jobs': jobs}, f)
+    return path
+
+
+def parity_job(name, equipment):
+    GeneratorClass, files, parameters = GENERATORS[name]
+    return {'name': '{}-{}'.format(name, equipment), 'generator': name, 'equipment': equipment,
+            'parameters': parameters,
+            'files': {key: os.path.join(DATA, file_name) for key, file_name in files.items()}}
+
+
+def test_failing_jobs_do_not_stop_the_others(tmpdir):
+    jobs = [parity_job('librarypooling', 'echo'),
+            dict(parity_job('librarypooling', 'mosquito'), name='missing-file',
+                 files={'volumes': 'missing.csv'}),
+            parity_job('partpooling', 'all'),
+            parity_job('matrix', 'felix')]
+    output = str(tmpdir.join('outputs'))
+    summary = run_batch(load_manifest(write_manifest(tmpdir, jobs)), output, workers=2)
+    assert (summary['succeeded'], summary['failed']) == (3, 1)
+    reports = summary['jobs']
+    assert [report['name'] for report in reports] == [job['name'] for job in jobs]
+    assert [report['status'] for report in reports] == ['ok', 'failed', 'ok', 'ok']
+    assert 'missing.csv' in reports[1]['error']
+    with open(os.path.join(output, 'report.json')) as f:
+        assert json.load(f) == summary
+    written = {os.path.relpath(path, output) for report in reports for path in report['files']}
+    assert 'partpooling-all/echo_worklist.csv' in written
+    assert 'partpooling-all/new_volumes.csv' in written
+    for path in written:
+        job, file_name = os.path.split(path)
+        name, equipment = job.split('-')
+        golden = '{}_{}'.format(name, file_name) if equipment == 'all' else \
+            '{}_{}_{}'.format(name, equipment, file_name)
+        if file_name == 'new_volumes.csv':
+            golden = 'partpooling_new_volumes.csv'
+        with open(os.path.join(output, path), newline='') as f:
+            assert f.read() == read(golden)
+
+
+def test_manifests_are_checked(tmpdir):
+    with pytest.raises(Exception, match='unknown generator: nothing'):
+        load_manifest(write_manifest(tmpdir, [{'generator': 'nothing'}]))
+    job = parity_job('librarypooling', 'echo')
+    with pytest.raises(Exception, match='used more than once'):
+        load_manifest(write_manifest(tmpdir, [job, job]))
+
+
+def test_main_fails_when_a_job_fails(tmpdir, capsys):
+    jobs = [parity_job('librarypooling', 'echo'),
+            dict(parity_job('librarypooling', 'echo'), name='bad', files={})]
+    output = str(tmpdir.join('outputs'))
+    assert main([write_manifest(tmpdir, jobs), '-o', output, '-j', '1']) == 1
+    out = capsys.readouterr().out
+    assert 'failed bad' in out and 'Missing volumes file' in out
+    assert re.search(r'^1 succeeded, 1 failed in [\d.]+s$', out, re.MULTILINE)
@@ -0,0 +1,86 @@
+import hashlib
+import threading
+
+import numpy as np
+
+from toolbox.cache import CatalogueCache
+from toolbox.generators.partpooling import PartPoolingGenerator
+
+from conftest import open_files
+
+
+def loader(value, calls=None):
+    def load():
+        if calls is not None:
+            calls.append(value)
+        return np.full(100, value, dtype=np.float64)
+    return load
+
+
+def test_least_recently_used_files_are_evicted():
+    # Room for three arrays of 800 bytes
+    cache = CatalogueCache(max_bytes=2400)
+    for digest in 'abc':
+        cache.get('parts_file', digest, loader(ord(digest)))
+    cache.get('parts_file', 'a', loader(0))
+    cache.get('parts_file', 'd', loader(ord('d')))
+    assert len(cache) == 3
+    calls = []
+    assert cache.get('parts_file', 'a', loader(0, calls))[0] == ord('a')
+    assert cache.get('parts_file', 'b', loader(0, calls))[0] == 0
+    assert calls == [0]
+    assert cache.stats()['evictions'] == 2
+    assert cache.stats()['bytes'] == 2400
+
+
+def test_files_larger_than_the_cache_are_not_kept():
+    cache = CatalogueCache(max_bytes=400)
+    cache.get('parts_file', 'a', loader(1))
+    assert len(cache) == 0
+
+
+def test_changed_files_are_parsed_again(partpooling_files):
+    cache = CatalogueCache()
+
+    def run(files):
+        hashes = {key: hashlib.sha256(text.encode('utf-8')).hexdigest()
+                  for key, text in files.items()}
+        generator = PartPoolingGenerator(supplied_files=open_files(files), file_hashes=hashes,
+                                         catalogues=cache)
+        # The volume of a part used depends on its concentration
+        promoter = generator.substances['Promoter_0']
+        return sum(plate.substance_usage().get(promoter, 0)
+                   for plate in generator.plates.destinations)
+
+    used = run(partpooling_files)
+    assert used > 0
+    assert run(partpooling_files) == used
+    assert cache.stats()['hits'] == 2
+    changed = dict(partpooling_files)
+    changed['parts_file'] = changed['parts_file'].replace(',100,', ',50,', 1)
+    assert run(changed) == 2 * used
+    # Only the changed file is parsed again, and both versions are kept
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (3, 3)
+    assert len(cache) == 3
+
+
+def test_concurrent_lookups():
+    cache = CatalogueCache(max_bytes=8 * 800)
+    errors = []
+
+    def look_up(thread):
+        for i in range(200):
+            digest = (thread * 7 + i) % 12
+            value = cache.get('parts_file', digest, loader(digest))
+            if value[0] != digest:
+                errors.append((digest, value[0]))
+    threads = [threading.Thread(target=look_up, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    stats = cache.stats()
+    assert stats['hits'] + stats['misses'] == 8 * 200
+    assert stats['entries'] <= 8
+    assert stats['bytes'] == 800 * stats['entries']
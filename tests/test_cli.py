@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from toolbox.__main__ import main
+
+from test_parity import DATA, read
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parity_file(name):
+    return os.path.join(DATA, name)
+
+
+def test_generate_writes_the_worklists(tmpdir):
+    layout = str(tmpdir.join('layout.json'))
+    assert main(['generate', 'partpooling', '-e', 'echo', '-o', str(tmpdir), '--layout', layout,
+                 '-f', 'constructs_file={}'.format(parity_file('constructs.csv')),
+                 '-f', 'parts_file={}'.format(parity_file('parts.csv')),
+                 '-f', 'parts_location_file={}'.format(parity_file('locations.csv'))]) == 0
+    written = sorted(os.listdir(str(tmpdir)))
+    assert 'new_volumes.csv' in written and 'layout.json' in written
+    for name in written:
+        if name.endswith('.csv'):
+            with open(str(tmpdir.join(name)), newline='') as f:
+                expected = read('partpooling_new_volumes.csv') if name == 'new_volumes.csv' \
+                    else read('partpooling_echo_{}'.format(name))
+                assert f.read() == expected
+    with open(layout) as f:
+        assert json.load(f)['plates']
+
+
+def test_one_output_goes_to_standard_output(capsys):
+    assert main(['generate', 'librarypooling', '-f',
+                 'volumes={}'.format(parity_file('volumes.csv'))]) == 0
+    assert capsys.readouterr().out == read('librarypooling_mosquito_worklist.csv')
+
+
+def test_convert(tmpdir, capsys):
+    path = str(tmpdir.join('list.csv'))
+    with open(path, 'w') as f:
+        f.write('well,substance\nA1,S1\nB2,S2\n')
+    assert main(['convert', 'listtoplate', '-f', 'list={}'.format(path)]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[:3] == [',1,2,3,4,5,6,7,8,9,10,11,12', 'A,S1' + ',' * 11, 'B,,S2' + ',' * 10]
+
+
+def test_errors_are_reported(capsys):
+    assert main(['generate', 'librarypooling', '-f', 'volumes']) == 1
+    assert capsys.readouterr().err == 'error: --file takes key=value, not volumes\n'
+    with pytest.raises(SystemExit):
+        main(['generate', 'unknown'])
+
+
+def test_flask_is_not_imported():
+    code = ('import sys\n'
+            'from toolbox.__main__ import main\n'
+            'main(["generate", "librarypooling", "-f", "volumes={}"])\n'
+            'sys.exit("flask" in sys.modules)\n').format(parity_file('volumes.csv'))
+    process = subprocess.run([sys.executable, '-c', code], cwd=ROOT, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+    assert process.returncode == 0, process.stderr.decode('utf-8')
+    assert process.stdout.decode('utf-8') == read('librarypooling_mosquito_worklist.csv')
@@ -0,0 +1,40 @@
+import pytest
+
+from toolbox.generators.combinatorial import CombinatorialDesign
+from toolbox.generators.partpooling import PartPoolingGenerator
+
+from conftest import open_files
+
+
+def make_design(candidates=5):
+    return CombinatorialDesign([('Promoter', ['P{}'.format(i) for i in range(candidates)]),
+                                ('CDS', ['C{}'.format(i) for i in range(candidates)]),
+                                ('Master Mix', [2.0])])
+
+
+def test_sample_has_no_repeats():
+    design = make_design()
+    sample = [tuple(c.values()) for c in design.constructs(sample_size=20, seed=1)]
+    assert len(sample) == 20
+    assert len(set(sample)) == 20
+    # The same seed gives the same sample
+    assert sample == [tuple(c.values()) for c in design.constructs(sample_size=20, seed=1)]
+
+
+def test_sample_runs_out_after_every_combination():
+    design = make_design()
+    exclusions = [frozenset(['P0']), frozenset(['C1', 'P2'])]
+    sample = list(design.constructs(sample_size=24, seed=2, exclusions=exclusions))
+    # 5 with P0 and 1 with P2 and C1 are left out, so only 19 can be made
+    assert len(sample) == 19
+    assert sorted(map(str, sample)) == \
+        sorted(map(str, design.constructs(exclusions=exclusions)))
+
+
+def test_exclusions_need_a_design_file():
+    files = {'constructs_file': 'Promoter,RBS,N-Tag,CDS,C-Tag,Terminator,Backbone,Master Mix\n',
+             'parts_file': 'Part Name,Concentration,Barcode,Volume\n',
+             'parts_location_file': 'location,barcode\n',
+             'exclusions_file': 'P0\n'}
+    with pytest.raises(Exception, match='design file'):
+        PartPoolingGenerator(supplied_files=open_files(files))
@@ -0,0 +1,51 @@
+import random
+import tempfile
+
+import pytest
+
+from toolbox.generators.formatters import external_sort
+
+from test_parity import make_generator, read
+
+
+@pytest.fixture
+def spilled(monkeypatch):
+    """
+    Temporary files made by external_sort
+    """
+    files = []
+
+    def temporary_file(*args, **kwargs):
+        f = make_temporary_file(*args, **kwargs)
+        files.append(f)
+        return f
+    make_temporary_file = tempfile.TemporaryFile
+    monkeypatch.setattr(tempfile, 'TemporaryFile', temporary_file)
+    return files
+
+
+@pytest.mark.parametrize('buffer_size', [2, 3])
+def test_spilled_sort_is_sorted_and_stable(spilled, buffer_size):
+    rng = random.Random(buffer_size)
+    # Few keys so that many rows are equal, numbered to tell them apart
+    rows = [(rng.randrange(5), i) for i in range(50)]
+    key = lambda row: row[0]
+    assert list(external_sort(rows, key, buffer_size)) == sorted(rows, key=key)
+    assert len(spilled) == -(-50 // buffer_size)
+    # Spill files are removed once they have been read back
+    assert all(f.closed for f in spilled)
+
+
+def test_small_inputs_are_not_spilled(spilled):
+    assert list(external_sort([3, 1, 2], None, 4)) == [1, 2, 3]
+    assert spilled == []
+
+
+@pytest.mark.parametrize('equipment', ['mosquito', 'echo'])
+def test_spilled_worklists_match(spilled, equipment):
+    generator = make_generator('librarypooling', sort_buffer=2)
+    output_files, other_files, layout_data = generator.generate(equipment)
+    assert spilled
+    assert all(f.closed for f in spilled)
+    for file_name, f in output_files.items():
+        assert f.getvalue() == read('librarypooling_{}_{}.csv'.format(equipment, file_name))
@@ -0,0 +1,70 @@
+import time
+
+from toolbox.filestore import MemoryFileStore, DiskFileStore
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def write(store, text, run=None):
+    with store.create(run) as f:
+        f.write(text)
+    return f.name
+
+
+def test_runs_are_removed_after_their_time_to_live():
+    clock = FakeClock()
+    store = MemoryFileStore(ttl=60, clock=clock)
+    old = write(store, 'old')
+    clock.now += 30
+    new = write(store, 'new')
+    clock.now += 31
+    assert store.evict() == 1
+    assert not store.exists(old) and store.exists(new)
+    clock.now += 30
+    assert store.evict() == 1
+    assert not store.exists(new)
+
+
+def test_oldest_runs_are_removed_to_keep_within_quota():
+    clock = FakeClock()
+    store = MemoryFileStore(max_bytes=10, clock=clock)
+    keys = []
+    for text in ['aaaa', 'bbbb', 'cccc', 'dd']:
+        keys.append(write(store, text))
+        clock.now += 1
+    # A run is sized by all of its files, and aged by the last written
+    run = keys[1].split('/')[1]
+    keys.append(write(store, 'bb', run))
+    assert store.evict() == 2
+    assert [store.exists(key) for key in keys] == [False, True, False, True, True]
+    assert store.evict() == 0
+
+
+def test_disk_runs_are_removed_with_their_shard(tmpdir):
+    store = DiskFileStore(str(tmpdir), ttl=60, clock=lambda: time.time() + 61)
+    key = write(store, 'text')
+    assert store.exists(key)
+    assert store.evict() == 1
+    assert not store.exists(key)
+    assert tmpdir.listdir() == []
+
+
+def test_sweeper_evicts_in_the_background():
+    clock = FakeClock()
+    store = MemoryFileStore(ttl=60, sweep_interval=0.01, clock=clock)
+    key = write(store, 'text')
+    time.sleep(0.05)
+    assert store.exists(key)
+    clock.now += 61
+    for i in range(200):
+        if not store.exists(key):
+            break
+        time.sleep(0.01)
+    assert not store.exists(key)
@@ -0,0 +1,97 @@
+import pytest
+
+from toolbox.inventory import PartInventory
+from toolbox.loader import load_csv
+from toolbox.generators.headers import PARTS_SCHEMA, PARTS_LOCATION_SCHEMA
+from toolbox.generators.partpooling import PartPoolingGenerator
+
+from conftest import open_files
+
+
+@pytest.fixture
+def inventory(tmpdir):
+    return PartInventory(str(tmpdir.join('inventory.sqlite')))
+
+
+def load_parts(files):
+    parts = open_files(files)
+    return (load_csv(parts['parts_file'], PARTS_SCHEMA),
+            load_csv(parts['parts_location_file'], PARTS_LOCATION_SCHEMA))
+
+
+def test_import_never_resets_volumes(inventory, partpooling_files):
+    inventory.import_parts(*load_parts(partpooling_files))
+    barcode = inventory.parts(['Promoter_0'])['Promoter_0']['Barcode']
+    inventory.deduct('run', {barcode: 5})
+    inventory.import_parts(*load_parts(partpooling_files))
+    assert inventory.parts(['Promoter_0'])['Promoter_0']['Volume'] == 995
+    assert [change for run, change, volume, created in inventory.history(barcode)] == [-5]
+
+
+def test_import_adds_new_parts_and_updates_concentration(inventory):
+    parts = {'parts_file': 'Part Name,Concentration,Barcode,Volume\nA,100,BC1,30\n',
+             'parts_location_file': 'location,barcode\nA1,BC1\n'}
+    inventory.import_parts(*load_parts(parts))
+    parts['parts_file'] = 'Part Name,Concentration,Barcode,Volume\nA,50,BC1,10\nB,20,BC2,8\n'
+    parts['parts_location_file'] = 'location,barcode\nA1,BC1\nA2,BC2\n'
+    inventory.import_parts(*load_parts(parts))
+    found = inventory.parts(['A', 'B'])
+    assert (found['A']['Concentration'], found['A']['Volume']) == (50, 30)
+    assert (found['B']['Volume'], found['B']['location']) == (8, 'A2')
+
+
+def test_record_run_is_one_transaction(inventory, partpooling_files):
+    parts, locations = load_parts(partpooling_files)
+    version = inventory.version()
+    with pytest.raises(Exception):
+        inventory.record_run('run', {'missing': 1}, parts, locations)
+    assert len(inventory) == 0
+    assert inventory.version() == version
+
+
+def run_partpooling(files, inventory, **kwargs):
+    generator = PartPoolingGenerator(supplied_files=open_files(files), inventory=inventory,
+                                     **kwargs)
+    generator.generate('mosquito')
+    return generator
+
+
+def test_runs_leave_inventory_alone_unless_asked(inventory, partpooling_files):
+    run_partpooling(partpooling_files, inventory)
+    assert len(inventory) == 0
+    assert inventory.version() == 0
+
+
+def test_runs_asked_to_update_deduct_each_time(inventory, partpooling_files):
+    stamps = set()
+    for run in range(3):
+        run_partpooling(partpooling_files, inventory, update_inventory='on')
+        stamps.add(inventory.stamp())
+    assert len(stamps) == 3
+    generator = run_partpooling({'constructs_file': partpooling_files['constructs_file']},
+                                inventory)
+    barcode = inventory.parts(['Promoter_0'])['Promoter_0']['Barcode']
+    history = inventory.history(barcode)
+    assert len(history) == 3
+    assert history[-1][2] == pytest.approx(1000 + 3 * history[0][1])
+    # Reading from the inventory does not change it
+    assert len(inventory.history(barcode)) == 3
+    assert inventory.stamp() in stamps
+    assert generator.other_files['new_volumes']
+
+
+def test_failed_runs_leave_inventory_alone(inventory, partpooling_files):
+    files = dict(partpooling_files)
+    # A part too dilute to pipette fails the run during setup
+    files['parts_file'] = files['parts_file'].replace(',100,', ',10000,')
+    with pytest.raises(Exception):
+        run_partpooling(files, inventory, update_inventory='on')
+    assert len(inventory) == 0
+    assert inventory.version() == 0
+
+
+def test_stamps_tell_databases_apart(tmpdir, inventory):
+    other = PartInventory(str(tmpdir.join('other.sqlite')))
+    assert inventory.stamp() != other.stamp()
+    # Opening a database again keeps its stamp
+    assert PartInventory(inventory.path).stamp() == inventory.stamp()
@@ -0,0 +1,99 @@
+import time
+import threading
+
+import pytest
+
+from toolbox.jobs import MemoryJobQueue, SQLiteJobQueue, QueueFull, QUEUED, RUNNING, DONE, \
+    FAILED
+
+
+def run(payload):
+    if payload['form'].get('fail'):
+        raise Exception('Failed on purpose')
+    if 'wait' in payload['form']:
+        payload['form']['wait'].wait(5)
+    return {'value': payload['form']['value']}
+
+
+def make_payload(value=1, **form):
+    form['value'] = value
+    return {'function': 'test', 'form': form, 'files': {}}
+
+
+def wait_for(queue, job_id, *statuses):
+    for i in range(500):
+        job = queue.get(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError('Job {} is still {}'.format(job_id, job['status']))
+
+
+def test_full_queues_turn_jobs_away():
+    release = threading.Event()
+    queue = MemoryJobQueue(run, workers=1, max_queue=2)
+    running = queue.submit(make_payload(wait=release))
+    wait_for(queue, running, RUNNING)
+    waiting = [queue.submit(make_payload(i)) for i in range(2)]
+    with pytest.raises(QueueFull):
+        queue.submit(make_payload())
+    release.set()
+    assert [wait_for(queue, job_id, DONE)['result'] for job_id in waiting] == \
+        [{'value': 0}, {'value': 1}]
+    # There is room again once the jobs have run
+    assert wait_for(queue, queue.submit(make_payload(2)), DONE)['result'] == {'value': 2}
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('jobs.sqlite'))
+
+
+def test_sqlite_jobs_are_run(path):
+    queue = SQLiteJobQueue(path, run, workers=2)
+    done = queue.submit(make_payload(3))
+    failed = queue.submit(make_payload(fail=True))
+    job = wait_for(queue, done, DONE, FAILED)
+    assert (job['status'], job['result'], job['error']) == (DONE, {'value': 3}, None)
+    job = wait_for(queue, failed, DONE, FAILED)
+    assert (job['status'], job['result'], job['error']) == (FAILED, None, 'Failed on purpose')
+    # Uploads are forgotten once a job has run
+    assert 'files' not in job['payload']
+    assert queue.get('missing') is None
+
+
+def test_sqlite_queues_turn_jobs_away(path):
+    queue = SQLiteJobQueue(path, run, workers=0, max_queue=1)
+    queue.submit(make_payload())
+    with pytest.raises(QueueFull):
+        queue.submit(make_payload())
+
+
+def test_running_jobs_are_queued_again_on_restart(path):
+    queue = SQLiteJobQueue(path, run, workers=0)
+    first = queue.submit(make_payload(1))
+    second = queue.submit(make_payload(2))
+    assert queue._claim()[0] == first
+    assert queue.get(first)['status'] == RUNNING
+    # Processes started independently leave each other's jobs running
+    assert SQLiteJobQueue(path, run, workers=0, requeue=False).get(first)['status'] == RUNNING
+    restarted = SQLiteJobQueue(path, run, workers=1)
+    assert restarted.get(first)['status'] == QUEUED
+    restarted._start()
+    assert wait_for(restarted, first, DONE)['result'] == {'value': 1}
+    assert wait_for(restarted, second, DONE)['result'] == {'value': 2}
+
+
+def test_finished_jobs_are_deleted_when_jobs_are_claimed(path):
+    queue = SQLiteJobQueue(path, run, workers=0, keep_for=60 * 60)
+    old, recent, waiting = [queue.submit(make_payload(i)) for i in range(3)]
+    for job_id in (old, recent):
+        assert queue._claim()[0] == job_id
+        queue._finish(job_id, DONE, make_payload(), result={'value': 0})
+    db = queue._connect()
+    db.execute('UPDATE jobs SET updated = updated - 2 * 60 * 60 WHERE id = ?', (old,))
+    db.close()
+    assert queue.get(old) is not None
+    assert queue._claim()[0] == waiting
+    assert queue.get(old) is None
+    assert queue.get(recent)['status'] == DONE
@@ -0,0 +1,57 @@
+import gzip
+import json
+
+import pytest
+
+import toolbox.app as app_module
+from toolbox.generators.partpooling import PartPoolingGenerator
+
+from conftest import open_files
+from test_app_cache import app, submit
+
+
+def fetch(client, url, **headers):
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    body = response.data
+    if response.headers.get('Content-Encoding') == 'gzip':
+        body = gzip.decompress(body)
+    return response, json.loads(body.decode('utf-8'))
+
+
+def named(plate, substances):
+    """
+    A plate layout with its substances named rather than numbered
+    """
+    plate = dict(plate)
+    plate['substances'] = [substances[i] for i in plate['substances']]
+    return plate
+
+
+def test_plate_layouts_match_the_generator(app, partpooling_files):
+    job = submit(app, partpooling_files)
+    generator = PartPoolingGenerator(supplied_files=open_files(partpooling_files))
+    # As JSON, where the tuples are lists
+    expected = json.loads(json.dumps(generator.make_plate_layout_data()))
+    response, status = fetch(app, '/api/jobs/{}/'.format(job['id']))
+    summary = app_module.layout_summary(status['result']['plates'])
+    assert len(summary['plates']) == len(expected['plates']) > 1
+    for number, plate in enumerate(expected['plates']):
+        response, layout = fetch(app, '/api/jobs/{}/plates/{}/'.format(job['id'], number))
+        assert named(layout, summary['substances']) == named(plate, expected['substances'])
+        assert len(layout['offsets']) == len(layout['wells']) + 1
+        assert len(layout['totals']) == len(layout['wells'])
+    assert app.get('/api/jobs/{}/plates/{}/'.format(job['id'], number + 1)).status_code == 404
+
+
+@pytest.mark.parametrize('accept,encoded', [('gzip, deflate', True), ('', False)])
+def test_layouts_are_compressed_when_accepted(app, partpooling_files, accept, encoded):
+    job = submit(app, partpooling_files)
+    # The constructs plate, which is large enough to be worth compressing
+    plates = job['result']['plates']['plates']
+    number = max(range(len(plates)), key=lambda i: len(plates[i]['wells']))
+    response, layout = fetch(app, '/api/jobs/{}/plates/{}/'.format(job['id'], number),
+                             **{'Accept-Encoding': accept})
+    assert (response.headers.get('Content-Encoding') == 'gzip') == encoded
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert len(layout['wells']) == 96
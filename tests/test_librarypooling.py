@@ -0,0 +1,39 @@
+import io
+
+import pytest
+
+from toolbox.generators.librarypooling import LibraryPoolingGenerator
+
+
+VOLUMES = '''source plate,source well,sample ID,volume,destination well,destination plate
+1,A1,S1,1,A1,
+1,A2,S2,2,A1,2
+1,A3,S3,1.5,B1,
+1,A4,S4,1,A1, 1
+'''
+
+
+def pools(generator):
+    return {(plate.label, plate.location): {'{}{}'.format(*coord): sorted(
+                a.substance.name for a in well.contents)
+            for coord, well in plate.get_filled_wells().items()}
+            for plate in generator.plates.destinations}
+
+
+def test_blank_destination_plates_are_the_first():
+    generator = LibraryPoolingGenerator(supplied_files={'volumes': io.StringIO(VOLUMES)},
+                                        pooling_locations='3,4')
+    assert pools(generator) == {('Pools', 3): {'A1': ['S1', 'S4'], 'B1': ['S3']},
+                                ('Pools 2', 4): {'A1': ['S2']}}
+
+
+def test_destination_plates_need_a_location():
+    with pytest.raises(Exception, match='No locations left'):
+        LibraryPoolingGenerator(supplied_files={'volumes': io.StringIO(VOLUMES)},
+                                pooling_locations='3')
+
+
+def test_bad_destination_plates_are_reported():
+    volumes = VOLUMES.replace('S2,2,A1,2', 'S2,2,A1,two')
+    with pytest.raises(Exception, match='line 3: destination plate "two"'):
+        LibraryPoolingGenerator(supplied_files={'volumes': io.StringIO(volumes)})
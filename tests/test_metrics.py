@@ -0,0 +1,86 @@
+import re
+
+import pytest
+
+import toolbox.app as app_module
+from toolbox.filestore import MemoryFileStore
+from toolbox.metrics import Metrics, record, stage, count, server_timing
+
+
+TIMING = re.compile(r'^[\w-]+;dur=\d+\.\d$')
+
+
+def run(metrics, name, seconds, rows):
+    with record(name, metrics=metrics) as recorder:
+        # Given its time so that the bucket it falls in is known
+        with stage('parse'):
+            pass
+        recorder.stages['parse'] = seconds
+        count('rows_parsed', rows)
+
+
+def samples(text):
+    """
+    Metric lines of the Prometheus text format as {name and labels: value}
+    """
+    found = {}
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            series, value = line.rsplit(' ', 1)
+            found[series] = float(value)
+    return found
+
+
+def test_counters_and_histograms_are_rendered():
+    metrics = Metrics()
+    run(metrics, 'partpooling', 0.001, 10)
+    run(metrics, 'partpooling', 0.03, 5)
+    with pytest.raises(Exception):
+        with record('partpooling', metrics=metrics):
+            raise Exception('Failed')
+    text = metrics.render()
+    assert '# TYPE toolbox_runs_total counter' in text
+    assert '# TYPE toolbox_stage_seconds histogram' in text
+    assert '# TYPE toolbox_rows_parsed_total counter' in text
+    found = samples(text)
+    assert found['toolbox_runs_total{name="partpooling",status="done"}'] == 2
+    assert found['toolbox_runs_total{name="partpooling",status="failed"}'] == 1
+    assert found['toolbox_rows_parsed_total{name="partpooling"}'] == 15
+    labels = 'name="partpooling",stage="parse"'
+    assert found['toolbox_stage_seconds_count{{{}}}'.format(labels)] == 2
+    assert found['toolbox_stage_seconds_sum{{{}}}'.format(labels)] == pytest.approx(0.031)
+    # Buckets count the runs at or under their bound
+    assert found['toolbox_stage_seconds_bucket{{{},le="0.005"}}'.format(labels)] == 1
+    assert found['toolbox_stage_seconds_bucket{{{},le="0.025"}}'.format(labels)] == 1
+    assert found['toolbox_stage_seconds_bucket{{{},le="+Inf"}}'.format(labels)] == 2
+    buckets = [value for series, value in found.items() if '_bucket{' in series]
+    assert buckets == sorted(buckets)
+
+
+def test_server_timing_names_are_tokens():
+    assert server_timing({'parse': 0.0123, 'new volumes': 0.002}, prefix='job-') == \
+        'job-parse;dur=12.3, job-new_volumes;dur=2.0'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app_module, 'FILE_STORE', MemoryFileStore())
+    return app_module.app.test_client()
+
+
+def test_responses_have_server_timing(client):
+    response = client.get('/worklists/partpooling/')
+    assert response.status_code == 200
+    timings = response.headers['Server-Timing'].split(', ')
+    assert all(TIMING.match(timing) for timing in timings)
+    assert timings[-1].startswith('total;dur=')
+
+
+def test_metrics_are_served_locally(client):
+    client.get('/worklists/partpooling/')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    found = samples(response.get_data(as_text=True))
+    assert found['toolbox_runs_total{name="request_worklists",status="done"}'] >= 1
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code == 404
@@ -0,0 +1,51 @@
+import io
+import csv
+from itertools import groupby
+
+import pytest
+
+from toolbox.generators.librarypooling import LibraryPoolingGenerator
+from toolbox.generators.formatters import FORMATS
+
+
+# Volumes over 1200 nl are split over several Mosquito rows, and A10 sorts
+# before A2 in Echo well names
+VOLUMES = '''source plate,source well,sample ID,volume,destination well
+1,A2,S1,1,A1
+1,A10,S2,3,B1
+2,A1,S3,0.5,A2
+1,B1,S4,2.5,C1
+'''
+
+
+def make_generator(**kwargs):
+    return LibraryPoolingGenerator(supplied_files={'volumes': io.StringIO(VOLUMES)}, **kwargs)
+
+
+def worklist_rows(output_files, skip):
+    return [row for row in csv.reader(io.StringIO(output_files['worklist'].getvalue()))][skip:]
+
+
+@pytest.mark.parametrize('equipment,skip', [('mosquito', 2), ('echo', 1)])
+def test_fixed_order_is_written_order(equipment, skip):
+    generator = make_generator()
+    output_files, other_files, layout_data = generator.generate(equipment)
+    f = FORMATS[equipment](generator.plates, generator.substances, ordering=generator.ordering,
+                           transfers=generator.transfers, write=False)
+    transfers = list(generator.transfers)
+    order = f.fixed_order()
+    # A transfer is listed once for each of its rows, which are together
+    rows = [[str(value) for value in row] for i, group in groupby(order)
+            for row in f.transfer_rows(*transfers[i])]
+    assert rows == worklist_rows(output_files, skip)
+    assert len(order) == len(rows)
+
+
+@pytest.mark.parametrize('equipment,skip', [('mosquito', 2), ('echo', 1)])
+def test_optimised_rows_match(equipment, skip):
+    fixed, other_files, layout_data = make_generator().generate(equipment)
+    generator = make_generator(optimise='time')
+    optimised, other_files, layout_data = generator.generate(equipment)
+    assert sorted(worklist_rows(optimised, skip)) == sorted(worklist_rows(fixed, skip))
+    estimate = generator.estimates[equipment]
+    assert estimate['after'] <= estimate['before']
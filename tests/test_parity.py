@@ -0,0 +1,107 @@
+"""
+Worklists and plate layouts made from the files in data/parity, compared
+with those the generators made before they were rewritten around the plate
+store and transfer tables.
+"""
+import io
+import os
+import json
+
+import pytest
+
+from toolbox.generators.partpooling import PartPoolingGenerator
+from toolbox.generators.librarypooling import LibraryPoolingGenerator
+from toolbox.generators.matrix import PlateMatrixGenerator
+from toolbox.generators.wells import WellIndex
+
+
+DATA = os.path.join(os.path.dirname(__file__), 'data', 'parity')
+
+GENERATORS = {
+    'partpooling': (PartPoolingGenerator, {'constructs_file': 'constructs.csv',
+                                           'parts_file': 'parts.csv',
+                                           'parts_location_file': 'locations.csv'}, {}),
+    'librarypooling': (LibraryPoolingGenerator, {'volumes': 'volumes.csv'}, {}),
+    'matrix': (PlateMatrixGenerator, {'sources': 'sources.csv', 'matrix': 'matrix.csv'},
+               {'default_mix': 'MIX', 'number_of_wells': 96, 'amount_mix': '1'}),
+}
+
+
+def read(file_name):
+    with open(os.path.join(DATA, file_name), newline='') as f:
+        return f.read()
+
+
+def make_generator(name, **kwargs):
+    GeneratorClass, files, parameters = GENERATORS[name]
+    supplied_files = {key: io.StringIO(read(file_name)) for key, file_name in files.items()}
+    return GeneratorClass(supplied_files=supplied_files, **parameters, **kwargs)
+
+
+def well_contents(layout_data):
+    """
+    The filled wells of each plate as (coordinate, contents, total), as the
+    layout data used to list them
+    """
+    substances = layout_data['substances']
+    plates = []
+    for plate in layout_data['plates']:
+        names = WellIndex.get(plate['well_count']).names
+        offsets = plate['offsets']
+        wells = []
+        for i, well in enumerate(plate['wells']):
+            entries = range(offsets[i], offsets[i + 1])
+            wells.append([names[well],
+                          [[plate['amounts'][e], substances[plate['substances'][e]]]
+                           for e in entries],
+                          plate['totals'][i]])
+        plates.append({'label': plate['label'], 'location': plate['location'],
+                       'function': plate['function'], 'wells': wells})
+    return plates
+
+
+@pytest.mark.parametrize('name', sorted(GENERATORS))
+@pytest.mark.parametrize('equipment', ['mosquito', 'echo', 'felix'])
+def test_worklists_match(name, equipment):
+    output_files, other_files, layout_data = make_generator(name).generate(equipment)
+    assert output_files
+    for file_name, f in output_files.items():
+        assert f.getvalue() == read('{}_{}_{}.csv'.format(name, equipment, file_name))
+
+
+def test_new_volumes_match():
+    output_files, other_files, layout_data = make_generator('partpooling').generate('echo')
+    # Old volumes are echoed as they were written in the parts file
+    assert dict(other_files)['new_volumes'].getvalue() == read('partpooling_new_volumes.csv')
+
+
+@pytest.mark.parametrize('name', sorted(GENERATORS))
+def test_layouts_match(name):
+    output_files, other_files, layout_data = make_generator(name).generate('mosquito')
+    # Compared as JSON text so that 10 and 10.0 differ
+    assert json.dumps(well_contents(layout_data)) == read('{}_layout.json'.format(name))
+
+
+def test_directory_outputs_are_paths(tmp_path):
+    generator = make_generator('librarypooling', write_to=str(tmp_path))
+    output_files, other_files, layout_data = generator.generate('mosquito')
+    # Files written under a directory are named by path, as they were before
+    # the file stores
+    path = output_files['worklist']
+    assert path.startswith(str(tmp_path)) and os.path.isfile(path)
+    with open(path, newline='') as f:
+        assert f.read() == read('librarypooling_mosquito_worklist.csv')
+
+
+@pytest.mark.parametrize('name', sorted(GENERATORS))
+def test_generate_all_matches_each_format(name):
+    outputs, all_other_files, all_layout = make_generator(name).generate_all()
+    assert sorted(outputs) == ['echo', 'felix', 'mosquito']
+    for equipment, equipment_files in outputs.items():
+        output_files, other_files, layout_data = make_generator(name).generate(equipment)
+        assert sorted(equipment_files) == sorted(output_files)
+        for file_name, f in equipment_files.items():
+            assert f.getvalue() == output_files[file_name].getvalue()
+        assert [(n, f.getvalue()) for n, f in all_other_files] == \
+            [(n, f.getvalue()) for n, f in other_files]
+        assert all_layout == layout_data
@@ -0,0 +1,36 @@
+import pytest
+
+from toolbox.generators.generators import PlateRegistry
+
+
+def test_locations_hold_one_plate():
+    plates = PlateRegistry()
+    source = plates.create(96, 'Source 1', 1)
+    with pytest.raises(Exception, match='Location 1 already has the Source 1 plate on it'):
+        plates.create(384, 'Pools', '1', function='destination')
+    # The failed plate is not half registered
+    assert list(plates) == [source]
+    assert plates.labelled('Pools') == () and plates.destinations == ()
+
+
+def test_get_or_create_is_idempotent():
+    plates = PlateRegistry()
+    first = plates.get_or_create(96, 'Source 1', '1')
+    assert plates.get_or_create(96, 'Source 1', 1) is first
+    # A plate already at the location is returned whatever else is asked for
+    assert plates.get_or_create(384, 'Other', '1', function='destination') is first
+    assert len(plates) == 1
+    assert plates.get(1) is plates.get('1') is first
+    assert plates.labelled('Source 1') == (first,) and plates.sources == (first,)
+    assert plates.get(2) is None
+
+
+def test_plates_are_indexed_in_creation_order():
+    plates = PlateRegistry()
+    created = [plates.create(96, 'Source', 1), plates.create(96, 'Pools', 3, 'destination'),
+               plates.create(96, 'Source', 2), plates.create(96, 'Pools 2', 4, 'destination')]
+    assert list(plates) == created and plates[2] is created[2]
+    assert plates.sources == (created[0], created[2])
+    assert plates.destinations == (created[1], created[3])
+    assert plates.labelled('Source') == (created[0], created[2])
+    assert plates.with_function('other') == ()
@@ -0,0 +1,84 @@
+import io
+
+import numpy as np
+import pytest
+
+from toolbox.converters.plates import PlateGrids, read_list, read_grid, read_matrix, \
+    write_matrix
+from toolbox.loader import CSVErrors, iter_matrices
+from toolbox.generators.wells import WellIndex
+
+
+def test_empty_rows_inside_a_plate_are_rows():
+    lines = [['', ''], ['a', ''], [], ['', ''], ['', ''], ['', 'b'], ['', '']]
+    assert list(iter_matrices(lines, 3)) == [[['', ''], ['a', '']],
+                                             [['', ''], ['', ''], ['', 'b']]]
+
+
+def test_empty_rows_after_a_full_plate_separate_plates():
+    # As a spreadsheet saves plates separated by blank rows
+    lines = [['a', ''], ['', 'b'], ['', ''], ['', ''], ['c', ''], ['', '']]
+    assert list(iter_matrices(lines, 2)) == [[['a', ''], ['', 'b']], [['c', '']]]
+
+
+def test_matrix_round_trip():
+    well_index = WellIndex.get(96)
+    values = np.full((3, well_index.rows, well_index.columns), '', dtype=object)
+    # Plates with empty first and middle rows, and an empty plate between them
+    values[0, 1, 2] = 'S1'
+    values[0, 5, 0] = 'S2(MIX)'
+    values[2, 7, 11] = 'S3'
+    out = io.StringIO()
+    write_matrix(PlateGrids(well_index, values), out)
+    read = read_matrix(io.StringIO(out.getvalue()), 96)
+    assert read.values.tolist() == values.tolist()
+
+
+def read_list_text(text, well_count=None):
+    return read_list(io.StringIO(text), well_count)
+
+
+def test_list_wells_may_only_be_given_once():
+    with pytest.raises(Exception, match='Well B2 of plate 2 is given more than once'):
+        read_list_text('plate,well,substance\n1,B2,S1\n2,B2,S2\n2,b02,S3\n')
+    # Empty wells do not count
+    grids = read_list_text('plate,well,substance\n1,A1,S1\n1,A1,\n')
+    assert grids.values[0, 0, 0] == 'S1'
+
+
+def test_list_wells_off_the_plate():
+    with pytest.raises(Exception, match='Well I1 of plate 1 is not on a 96 well plate'):
+        read_list_text('well,substance\nA1,S1\nI1,S2\n', 96)
+    # Without a format the smallest that fits is used
+    assert read_list_text('well,substance\nA1,S1\nP24,S2\n').well_index.well_count == 384
+    with pytest.raises(Exception, match='No plate format has 33 rows'):
+        read_list_text('well,substance\nAG1,S1\n')
+
+
+def test_list_errors_are_listed_by_line():
+    with pytest.raises(CSVErrors) as raised:
+        read_list_text('plate,well,substance\n1,A1,S1\n0,A2,S2\n1,1A,S3\n1,A0,S4\n')
+    assert raised.value.errors == ['line 3: plate "0" is not a plate number from 1',
+                                   'line 4: "1A" is not a well',
+                                   'line 5: "A0" is not a well']
+
+
+def read_grid_text(lines, well_count=None):
+    return read_grid(io.StringIO('\n'.join(lines) + '\n'), well_count)
+
+
+def test_grids_are_read_by_row_label():
+    grids = read_grid_text([',1,2,3', 'C,,x,', 'A,y,,', '', ',1,2', 'B,,z'], 96)
+    assert len(grids) == 2
+    assert grids.values[0, 2, 1] == 'x' and grids.values[0, 0, 0] == 'y'
+    assert grids.values[1, 1, 1] == 'z'
+    assert (grids.values != '').sum() == 3
+
+
+def test_malformed_grids():
+    with pytest.raises(Exception, match='Plate 1 has more columns than a 96 well plate'):
+        read_grid_text([',' + ','.join(map(str, range(1, 14))), 'A' + ',x' * 13], 96)
+    with pytest.raises(Exception, match='Plate 2 has a row "I" that is not on a 96 well plate'):
+        read_grid_text([',1', 'A,x', '', ',1', 'I,y'])
+    with pytest.raises(Exception, match='Plate 1 has more columns than a 384 well plate'):
+        read_matrix(io.StringIO(',' * 24 + 'x\n'), 384)
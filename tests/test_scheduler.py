@@ -0,0 +1,100 @@
+import io
+import csv
+from collections import defaultdict
+
+import pytest
+
+from toolbox.generators.librarypooling import LibraryPoolingGenerator
+from toolbox.generators.scheduler import schedule_loads
+
+from benchmarks.synthetic import librarypooling_inputs
+from conftest import open_files
+
+
+# Pool wells drawing on source plates 1 and 2 (A1), 4 (B1) and 1 and 4 (C1)
+VOLUMES = '''source plate,source well,sample ID,volume,destination well
+1,A1,S1,1,A1
+2,A1,S2,1,A1
+4,A1,S3,1,B1
+4,A2,S4,1,C1
+1,A2,S5,1,C1
+'''
+
+
+def make_generator(volumes=VOLUMES, **kwargs):
+    return LibraryPoolingGenerator(supplied_files={'volumes': io.StringIO(volumes)}, **kwargs)
+
+
+def check_loads(table, loads, positions):
+    """
+    Invariants every schedule keeps
+    """
+    source_plate = table.column('source_plate')
+    destination_plate = table.column('destination_plate')
+    made = [i for load in loads for i in load.transfers.tolist()]
+    # Every transfer is made exactly once
+    assert sorted(made) == list(range(len(table)))
+    for load in loads:
+        # The plates of a load fit on the deck, one to a position
+        assert len(load.plates) <= positions
+        assert sorted(load.locations.values()) == sorted(set(load.locations.values()))
+        assert set(load.locations.values()) <= set(range(1, positions + 1))
+        # Every plate a transfer uses is on the deck
+        used = set(source_plate[load.transfers].tolist()) | \
+            set(destination_plate[load.transfers].tolist())
+        assert used - {-1} <= set(load.plates)
+
+
+def well_loads(table, loads):
+    destination_plate = table.column('destination_plate')
+    destination_well = table.column('destination_well')
+    wells = defaultdict(set)
+    for load in loads:
+        for i in load.transfers.tolist():
+            wells[(destination_plate[i], destination_well[i])].add(load.number)
+    return wells
+
+
+@pytest.mark.parametrize('positions', [3, 4, 6])
+@pytest.mark.parametrize('keep_wells_together', [False, True])
+def test_schedule_invariants(positions, keep_wells_together):
+    files, parameters = librarypooling_inputs(6, pool_size=3, seed=2)
+    generator = LibraryPoolingGenerator(supplied_files=open_files(files), **parameters)
+    table = generator.transfers
+    if keep_wells_together and positions < 5:
+        # Pool wells draw on three source plates
+        with pytest.raises(Exception):
+            schedule_loads(table, range(1, positions + 1), keep_wells_together=True)
+        return
+    loads = schedule_loads(table, range(1, positions + 1), keep_wells_together)
+    check_loads(table, loads, positions)
+    if keep_wells_together:
+        assert all(len(numbers) == 1 for numbers in well_loads(table, loads).values())
+
+
+def test_source_loads_split_wells_but_kept_loads_do_not():
+    table = make_generator().transfers
+    loads = schedule_loads(table, range(1, 4))
+    check_loads(table, loads, 3)
+    assert max(len(numbers) for numbers in well_loads(table, loads).values()) == 2
+
+    loads = schedule_loads(table, range(1, 4), keep_wells_together=True)
+    check_loads(table, loads, 3)
+    assert len(loads) == 2
+    assert all(len(numbers) == 1 for numbers in well_loads(table, loads).values())
+
+
+def test_felix_reactions_are_whole_in_every_load():
+    generator = make_generator(deck_positions=3)
+    outputs = generator.make_outputs('felix')
+    reactions = [row for name, f in outputs.items() if name.startswith('reactions')
+                 for row in list(csv.reader(io.StringIO(f.getvalue())))[1:]]
+    totals = [float(row[2]) for row in reactions if row[1] == 'REACTION']
+    # One reaction for each pool well, holding all of its samples
+    assert sorted(totals) == [1000, 2000, 2000]
+    assert 'load_plan_felix' in generator.other_files
+
+
+def test_too_few_positions_for_a_reaction():
+    with pytest.raises(Exception, match='needs 2 source plates'):
+        make_generator(deck_positions=2).make_outputs('felix')
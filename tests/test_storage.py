@@ -0,0 +1,122 @@
+import io
+import csv
+import random
+from itertools import count
+from collections import defaultdict
+
+import pytest
+
+from toolbox.generators.generators import PlateRegistry, PlateSeries, Substance
+from toolbox.generators.partpooling import PartPoolingGenerator
+from toolbox.generators.storage import Occupancy
+from toolbox.generators.wells import WellIndex
+
+from conftest import open_files
+
+
+@pytest.fixture
+def plates(partpooling_files):
+    return PartPoolingGenerator(supplied_files=open_files(partpooling_files)).plates
+
+
+def dict_contents(plate):
+    """
+    Totals by well and usage by substance, added up well by well from the
+    Well views
+    """
+    totals = {}
+    usage = defaultdict(float)
+    for coord, well in plate.get_filled_wells().items():
+        totals[coord] = sum(amount.amount for amount in well.contents)
+        for amount in well.contents:
+            usage[amount.substance] += amount.amount
+    return totals, usage
+
+
+def test_totals_match_the_wells(plates):
+    for plate in plates:
+        totals, usage = dict_contents(plate)
+        array_totals = plate.totals()
+        for index, coord in enumerate(plate.coords):
+            assert array_totals[index] == pytest.approx(totals.get(coord, 0))
+
+
+def test_filled_mask_matches_the_filled_wells(plates):
+    for plate in plates:
+        totals, usage = dict_contents(plate)
+        mask = plate.filled_mask()
+        assert set(coord for coord, filled in zip(plate.coords, mask) if filled) == set(totals)
+
+
+def test_usage_and_matrix_match_the_wells(plates):
+    for plate in plates:
+        totals, usage = dict_contents(plate)
+        assert plate.substance_usage() == pytest.approx(dict(usage))
+        matrix = plate.store.matrix()
+        assert matrix.sum(axis=1) == pytest.approx(plate.totals())
+        assert dict(zip(plate.store.substances, matrix.sum(axis=0))) == pytest.approx(dict(usage))
+
+
+def naive_first_free(order, filled, start_position):
+    for index in order[start_position:]:
+        if index not in filled:
+            return index
+    return None
+
+
+@pytest.mark.parametrize('placement', ['row', 'column'])
+def test_first_free_matches_a_scan(placement):
+    well_index = WellIndex.get(96)
+    order, positions = well_index.placement_order(placement)
+    occupancy = Occupancy(order, positions)
+    rng = random.Random(1)
+    filled = set()
+    for i in range(80):
+        index = rng.randrange(96)
+        occupancy.fill(index)
+        filled.add(index)
+        start = rng.randrange(96)
+        assert occupancy.first_free(start) == naive_first_free(order, filled, positions[start])
+        assert occupancy.first_free() == naive_first_free(order, filled, 0)
+    assert list(occupancy) == [index for index in order if index in filled]
+
+
+def test_series_passes_over_filled_wells():
+    plates = PlateRegistry()
+    series = PlateSeries(plates, 96, 'Pools', count(3), start='A1')
+    water = Substance('Water')
+    plate = series.plate(1)
+    plate.add_amount('A2', 1, water)
+    names = []
+    for i in range(96):
+        well = series.next_well()
+        well.add(1, water)
+        names.append(series.current_well)
+    assert names[:3] == ['A1', 'A3', 'A4']
+    assert [p.location for p in series.plates] == [3, 4]
+    assert plate.filled_count() == 96
+    with pytest.raises(Exception, match='No free wells'):
+        plate.get_first_free_well()
+    assert series.plates[1].get_first_free_well()[1] == 'A2'
+
+
+def test_column_placement_orders_the_output_down_columns(partpooling_files):
+    # Wells are filled and written in placement order, so with column
+    # placement Felix reactions are numbered down the columns, where the
+    # original code numbered them across the rows whatever the placement
+    generator = PartPoolingGenerator(supplied_files=open_files(partpooling_files),
+                                     placement='column')
+    output_files, other_files, layout_data = generator.generate('felix')
+    constructs = generator.plates.labelled('Constructs')[0]
+    filled = constructs.get_filled_wells()
+    assert list(filled)[:3] == [('A', 1), ('B', 1), ('C', 1)]
+    assert list(filled) == sorted(filled, key=lambda coord: (coord[1], coord[0]))
+    reactions = defaultdict(list)
+    for number, name, volume in list(csv.reader(io.StringIO(
+            output_files['reactions'].getvalue())))[1:]:
+        if name not in ('REACTION', 'MIX'):
+            reactions[int(number)].append(name)
+    for number, well in enumerate(filled.values(), 1):
+        parts = [a.substance.name for a in well.contents
+                 if a.substance.name not in ('Water', 'Master Mix')]
+        assert sorted(reactions[number]) == sorted(parts)
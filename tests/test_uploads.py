@@ -0,0 +1,68 @@
+import io
+import os
+
+import pytest
+
+import toolbox.app as app_module
+from toolbox.filestore import MemoryFileStore
+from toolbox.uploads import UploadTooLarge, UploadBudget, spool_upload
+
+
+class CountingStream(io.BytesIO):
+    """
+    Stream that remembers the most read from it at once
+    """
+
+    largest = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.largest = max(self.largest, len(data))
+        return data
+
+    def readline(self, size=-1):
+        data = super().readline(size)
+        self.largest = max(self.largest, len(data))
+        return data
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app_module, 'FILE_STORE', MemoryFileStore())
+    monkeypatch.setattr(app_module, 'MAX_FILE_SIZE', 100)
+    return app_module.app.test_client()
+
+
+def post_list(client, text):
+    return client.post('/converters/listtoplate/',
+                       data={'list': (io.BytesIO(text.encode('utf-8')), 'list.csv')})
+
+
+def test_converter_uploads_over_the_limit_are_refused(client):
+    response = post_list(client, 'plate,well,substance\n' + '1,A1,S1\n' * 20)
+    assert response.status_code == 413
+    assert b'larger than the 100 byte limit' in response.data
+
+
+def test_converter_uploads_under_the_limit_are_converted(client):
+    response = post_list(client, 'plate,well,substance\n1,A1,S1\n')
+    assert response.status_code == 200
+
+
+def test_first_line_is_read_no_further_than_the_limit():
+    stream = CountingStream(b'x' * 10000)
+    with pytest.raises(UploadTooLarge):
+        spool_upload(stream, limit=100)
+    assert stream.largest == 101
+
+
+def test_first_line_is_read_no_further_than_the_budget(tmpdir):
+    budget = UploadBudget(150)
+    path, digest = spool_upload(io.BytesIO(b'a,b\n' + b'x' * 100), budget=budget,
+                                directory=str(tmpdir))
+    stream = CountingStream(b'y' * 10000)
+    with pytest.raises(UploadTooLarge):
+        spool_upload(stream, budget=budget, directory=str(tmpdir))
+    assert stream.largest == 47
+    # Only the file that fitted is left
+    assert tmpdir.listdir() == [tmpdir.join(os.path.basename(path))]
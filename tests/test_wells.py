@@ -0,0 +1,86 @@
+import pytest
+
+from toolbox.generators.wells import WellIndex, PLATE_FORMATS, row_label
+
+
+@pytest.mark.parametrize('well_count', sorted(PLATE_FORMATS))
+def test_names_and_indices_round_trip(well_count):
+    well_index = WellIndex.get(well_count)
+    assert WellIndex.get(well_count) is well_index
+    assert len(well_index) == well_count == well_index.rows * well_index.columns
+    for i, name in enumerate(well_index.names):
+        row, column = well_index.row_of[i], well_index.column_of[i]
+        assert well_index.index(name) == i
+        assert well_index.at(row, column) == i
+        assert well_index.coord_index[well_index.coords[i]] == i
+        assert name == '{}{}'.format(well_index.row_labels[row], column + 1)
+        assert well_index.row_numbers[well_index.row_labels[row]] == row
+    assert well_index.names[-1] == '{}{}'.format(row_label(well_index.rows - 1),
+                                                 well_index.columns)
+
+
+def test_rows_after_z_are_double_letters():
+    well_index = WellIndex.get(1536)
+    assert well_index.row_labels[24:] == ('Y', 'Z', 'AA', 'AB', 'AC', 'AD', 'AE', 'AF')
+    assert well_index.index('AA1') == 26 * 48
+    assert well_index.index('AF48') == 1535
+    assert well_index.coords[1535] == ('AF', 48)
+    assert [row_label(r) for r in (0, 25, 26, 51, 52, 701, 702)] == \
+        ['A', 'Z', 'AA', 'AZ', 'BA', 'ZZ', 'AAA']
+
+
+def naive_next(well_index, placement):
+    """
+    Walk the plate across the rows or down the columns
+    """
+    if placement == 'column':
+        walk = [(row, column) for column in range(well_index.columns)
+                for row in range(well_index.rows)]
+    else:
+        walk = [(row, column) for row in range(well_index.rows)
+                for column in range(well_index.columns)]
+    following = [None] * well_index.well_count
+    for (row, column), after in zip(walk, walk[1:]):
+        following[well_index.at(row, column)] = well_index.at(*after)
+    return following
+
+
+@pytest.mark.parametrize('well_count', sorted(PLATE_FORMATS))
+@pytest.mark.parametrize('placement', ['row', 'column'])
+def test_next_wells_walk_the_plate(well_count, placement):
+    well_index = WellIndex.get(well_count)
+    following = well_index.next_wells(placement, 1)
+    assert list(following) == naive_next(well_index, placement)
+    order, positions = well_index.placement_order(placement)
+    walked = [order[0]]
+    while following[walked[-1]] is not None:
+        walked.append(following[walked[-1]])
+    assert tuple(walked) == order
+    assert [positions[i] for i in order] == list(range(well_count))
+
+
+def test_spaced_wells_skip_rows_and_columns():
+    well_index = WellIndex.get(96)
+    following = well_index.next_wells('row', 2)
+    name = 'A2'
+    names = [name]
+    for i in range(7):
+        name = well_index.names[following[well_index.index(name)]]
+        names.append(name)
+    assert names == ['A2', 'A4', 'A6', 'A8', 'A10', 'A12', 'C2', 'C4']
+    # As before wells were indexed, a row that does not end on the last
+    # column runs off the plate
+    assert following[well_index.index('A11')] is None
+    assert following[well_index.index('G12')] is None
+
+
+def test_wells_off_the_plate():
+    well_index = WellIndex.get(96)
+    for name in ('I1', 'A13', 'A0', 'a1', ''):
+        with pytest.raises(KeyError):
+            well_index.index(name)
+    for row, column in ((8, 0), (0, 12), (-1, 0), (0, -1)):
+        with pytest.raises(KeyError):
+            well_index.at(row, column)
+    with pytest.raises(Exception, match='Plates with 100 wells are not supported'):
+        WellIndex.get(100)
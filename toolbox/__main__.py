@@ -0,0 +1,160 @@
+"""
+Run the worklist generators and converters on local files, without the web
+app.
+
+    python -m toolbox list
+    python -m toolbox generate partpooling -f constructs_file=constructs.csv \
+        -f parts_file=parts.csv -f parts_location_file=locations.csv \
+        -p number_of_wells=384 -e echo -o outputs/
+    python -m toolbox convert listtoplate -f list=list.csv
+    python -m toolbox convert plateformat -f plates=screen.csv -p input_format=matrix \
+        -p output_format=list -p number_of_wells=1536 -o outputs/
+
+Files are given as key=path with the keys of the web forms, and a path of -
+reads standard input. Output files are written to the output directory as
+<name>.csv, or to standard output if no directory is given. Only the modules
+of the chosen generator or converter are imported, so the command starts
+quickly enough to be run for every worklist.
+"""
+import os
+import sys
+import json
+import argparse
+
+from toolbox.registry import VALID_WORKLIST_FUNCTIONS, VALID_CONVERTER_FUNCTIONS, load_class
+
+
+def key_values(values, option):
+    """
+    Parse key=value arguments into a dict
+    """
+    parsed = {}
+    for value in values or []:
+        key, equals, rest = value.partition('=')
+        if not equals or not key:
+            raise Exception('{} takes key=value, not {}'.format(option, value))
+        parsed[key] = rest
+    return parsed
+
+
+def open_inputs(paths):
+    return {key: sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+            for key, path in paths.items()}
+
+
+def close_inputs(files):
+    for f in files.values():
+        if f is not sys.stdin:
+            f.close()
+
+
+def write_outputs(outputs, directory=None):
+    """
+    Write (name, text) outputs to name.csv files in a directory, or to
+    standard output with a heading for each file if there is more than one
+    """
+    if directory is None:
+        for name, text in outputs:
+            if len(outputs) > 1:
+                sys.stdout.write('==> {} <==\n'.format(name))
+            sys.stdout.write(text)
+        return
+    os.makedirs(directory, exist_ok=True)
+    for name, text in outputs:
+        path = os.path.join(directory, '{}.csv'.format(name))
+        with open(path, 'w', newline='') as f:
+            f.write(text)
+        print(path, file=sys.stderr)
+
+
+def generate(args):
+    GeneratorClass = load_class(VALID_WORKLIST_FUNCTIONS[args.function])
+    parameters = key_values(args.param, '--param')
+    if args.update_inventory:
+        parameters['update_inventory'] = 'yes'
+    files = open_inputs(key_values(args.file, '--file'))
+    try:
+        generator = GeneratorClass(supplied_files=files, inventory=args.inventory, **parameters)
+        if args.equipment == 'all':
+            outputs, other_files, layout = generator.generate_all()
+            output_files = [('{}_{}'.format(equipment, fn), f)
+                            for equipment, equipment_files in outputs.items()
+                            for fn, f in equipment_files.items()]
+        else:
+            outputs, other_files, layout = generator.generate(args.equipment)
+            output_files = list(outputs.items())
+    finally:
+        close_inputs(files)
+    write_outputs([(name, f.getvalue()) for name, f in output_files + list(other_files)],
+                  args.output)
+    if args.layout:
+        with open(args.layout, 'w') as f:
+            json.dump(layout, f)
+    for equipment, estimate in generator.estimates.items():
+        print('Estimated {} run time {}s, down from {}s'.format(equipment, estimate['after'],
+                                                                estimate['before']),
+              file=sys.stderr)
+
+
+def convert(args):
+    ConverterClass = load_class(VALID_CONVERTER_FUNCTIONS[args.function])
+    files = open_inputs(key_values(args.file, '--file'))
+    try:
+        converted = ConverterClass(files=files, **key_values(args.param, '--param')).generate()
+    finally:
+        close_inputs(files)
+    write_outputs([(name, f.getvalue()) for name, f in converted['output_files'].items()],
+                  args.output)
+
+
+def list_functions(args):
+    print('Generators: {}'.format(', '.join(sorted(VALID_WORKLIST_FUNCTIONS))))
+    print('Converters: {}'.format(', '.join(sorted(VALID_CONVERTER_FUNCTIONS))))
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog='python -m toolbox',
+                                     description='Make worklists from local files')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    list_parser = commands.add_parser('list', help='List the generators and converters')
+    list_parser.set_defaults(run=list_functions)
+
+    for name, functions, run, help_text in [
+            ('generate', VALID_WORKLIST_FUNCTIONS, generate, 'Run a worklist generator'),
+            ('convert', VALID_CONVERTER_FUNCTIONS, convert, 'Run a converter')]:
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('function', choices=sorted(functions))
+        command.add_argument('-f', '--file', action='append', metavar='KEY=PATH',
+                             help='Input file, as given in the web form')
+        command.add_argument('-p', '--param', action='append', metavar='NAME=VALUE',
+                             help='Setting, as given in the web form')
+        command.add_argument('-o', '--output', default=None,
+                             help='Directory to write files to (default: standard output)')
+        command.set_defaults(run=run)
+        if name == 'generate':
+            command.add_argument('-e', '--equipment', default='mosquito',
+                                 help='Equipment to make files for, or "all"')
+            command.add_argument('--inventory', default=None,
+                                 help='Part inventory database to read parts from')
+            command.add_argument('--update-inventory', action='store_true',
+                                 help='Add the parts files to the inventory and take the '
+                                      'volumes used off once the worklist is made')
+            command.add_argument('--layout', default=None,
+                                 help='File to write the plate layout JSON to')
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    try:
+        args.run(args)
+    except Exception as e:
+        print('error: {}'.format(e), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
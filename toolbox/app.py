@@ -1,27 +1,175 @@
-import io
-from importlib import import_module
-from tempfile import NamedTemporaryFile
-import traceback
+import os
+import gzip
+import json
+import tempfile
+from functools import partial
 
-from flask import Flask, request, abort, redirect, render_template, send_from_directory
+from flask import Flask, Response, request, abort, redirect, render_template, send_file, \
+    url_for, jsonify, g
 
+from toolbox.registry import VALID_WORKLIST_FUNCTIONS, VALID_CONVERTER_FUNCTIONS, load_class
+from toolbox.jobs import MemoryJobQueue, QueueFull, QUEUED, run_worklist
+from toolbox.cache import ResultCache, CatalogueCache
+from toolbox.filestore import DiskFileStore
+from toolbox.loader import Schema
+from toolbox.generators.generators import layout_summary
+from toolbox.metrics import METRICS, Recorder, stage, count, server_timing
+from toolbox.uploads import UploadTooLarge, UploadBudget, open_upload, spool_upload, \
+    discard_uploads
 
-VALID_WORKLIST_FUNCTIONS = {
-    'partpooling': 'toolbox.generators.partpooling.PartPoolingGenerator',
-    'librarypooling': 'toolbox.generators.librarypooling.LibraryPoolingGenerator',
-    'matrix': 'toolbox.generators.matrix.PlateMatrixGenerator',
-}
 
-VALID_CONVERTER_FUNCTIONS = {
-    'listtoplate': 'toolbox.converters.listtoplate.ListToPlateConverter',
-}
+# Generated files are kept for a week, up to 1GB, and swept every 10 minutes,
+# under TOOLBOX_FILE_STORE or a directory in the system temp directory
+FILE_STORE = DiskFileStore(os.environ.get('TOOLBOX_FILE_STORE',
+                                          os.path.join(tempfile.gettempdir(), 'toolbox-files')),
+                           ttl=7 * 24 * 60 * 60, max_bytes=1024 ** 3, sweep_interval=10 * 60)
+#FILE_STORE = MemoryFileStore(ttl=60 * 60, sweep_interval=60)
 
 
-FILE_STORE = '/Users/thomas/Projects/Toolbox/files/'
-#FILE_STORE = 'files/'
+# Part inventory that runs can read parts from, and take the volumes they use
+# off when asked to. None to run from uploaded parts files only.
+INVENTORY = None
+#INVENTORY = PartInventory('inventory.sqlite')
+
+
+def outputs_exist(result):
+    """
+    Check the files of a cached result are still in the file store
+    """
+    files = list(result['output_files'].values()) + list(result['other_files'].values())
+    return all(FILE_STORE.exists(f) for f in files)
+
+# Results of previous runs, reused when the same files and settings are submitted
+RESULT_CACHE = ResultCache(max_entries=256, max_bytes=64 * 1024 * 1024, max_age=24 * 60 * 60,
+                           validate=outputs_exist)
+
+# Parsed parts catalogues, reused by runs that upload the same files
+CATALOGUE_CACHE = CatalogueCache(max_bytes=256 * 1024 * 1024)
+
+# Worklists are generated in the background by a small pool of workers
+JOB_QUEUE = MemoryJobQueue(partial(run_worklist, write_to=FILE_STORE, inventory=INVENTORY,
+                                   catalogues=CATALOGUE_CACHE),
+                           workers=2, max_queue=50, cache=RESULT_CACHE)
+#JOB_QUEUE = SQLiteJobQueue('jobs.sqlite',
+#                           partial(run_worklist, write_to=FILE_STORE, inventory=INVENTORY,
+#                                   catalogues=CATALOGUE_CACHE),
+#                           workers=2, max_queue=50, cache=RESULT_CACHE)
+
+# Largest upload allowed per file and per request, in bytes
+MAX_FILE_SIZE = 200 * 1024 * 1024
+MAX_REQUEST_SIZE = 500 * 1024 * 1024
+# Where uploads wait for their job to run. None for the system temp directory.
+UPLOAD_DIR = None
+# JSON responses smaller than this are not worth compressing, in bytes
+GZIP_MIN_SIZE = 1024
+# Addresses allowed to read the metrics
+METRICS_ADDRESSES = ('127.0.0.1', '::1')
 
 app = Flask(__name__)
 app.debug = True
+# Requests that say they are too large are refused before anything is read
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_SIZE
+
+def make_job_payload(function, GeneratorClass):
+    """
+    Spool the uploaded files to disk for the job, checking their headers as
+    they arrive
+    """
+    files = {}
+    file_hashes = {}
+    budget = UploadBudget(MAX_REQUEST_SIZE)
+    try:
+        with stage('upload'):
+            for key, f in request.files.items():
+                # File inputs left empty are still sent, without a file name
+                if not f.filename:
+                    continue
+                schema = GeneratorClass.FILE_SCHEMAS.get(key, Schema(key, []))
+                files[key], file_hashes[key] = spool_upload(f.stream, MAX_FILE_SIZE, schema,
+                                                            budget, directory=UPLOAD_DIR)
+                count('bytes_uploaded', os.path.getsize(files[key]))
+    except Exception:
+        discard_uploads(files.values())
+        raise
+    if GeneratorClass.USES_INVENTORY and INVENTORY is not None:
+        # Runs reading or changing different stock are not the same run, but
+        # runs that neither read nor change the inventory do not depend on it
+        reads = not set(GeneratorClass.INVENTORY_FILES) <= set(files)
+        if reads or request.form.get('update_inventory'):
+            file_hashes['inventory'] = INVENTORY.stamp()
+    return {
+        'function': function,
+        'form': request.form.to_dict(),
+        'files': files,
+        'file_hashes': file_hashes,
+        # ?profile=1 captures a cProfile of the run
+        'profile': bool(request.args.get('profile')),
+    }
+
+@app.context_processor
+def inventory_enabled():
+    return {'inventory_enabled': INVENTORY is not None}
+
+@app.before_request
+def start_timing():
+    if request.endpoint != 'static':
+        g.recorder = Recorder('request_{}'.format(request.endpoint)).start()
+
+@app.after_request
+def add_server_timing(response):
+    """
+    Send the stage times of the request, and of the job it shows, as a
+    Server-Timing header
+    """
+    recorder = g.get('recorder')
+    if recorder is None:
+        return response
+    timings = [server_timing(recorder.stages)]
+    if g.get('job_timings'):
+        timings.append(server_timing(g.job_timings, prefix='job-'))
+    recorder.finish('done' if response.status_code < 500 else 'failed',
+                    path=request.path, status_code=response.status_code)
+    timings.append('total;dur={:.1f}'.format(recorder.seconds * 1000))
+    response.headers['Server-Timing'] = ', '.join(t for t in timings if t)
+    return response
+
+@app.teardown_request
+def finish_timing(exception):
+    recorder = g.get('recorder')
+    if recorder is not None and recorder.status is None:
+        recorder.finish('failed', path=request.path)
+
+def job_timings(job):
+    """
+    Remember the stage times of a job for the Server-Timing header
+    """
+    if job['result'] and job['result'].get('timings'):
+        g.job_timings = job['result']['timings']['stages']
+
+def gzip_json(data):
+    """
+    JSON response, gzip compressed if the client accepts it
+    """
+    body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    headers = {'Vary': 'Accept-Encoding'}
+    if len(body) >= GZIP_MIN_SIZE and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        body = gzip.compress(body)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(body, mimetype='application/json', headers=headers)
+
+def page_results(job):
+    """
+    Results of a job as shown on its page; the plates are summarised and
+    their layouts are fetched separately
+    """
+    results = dict(job['result'] or {})
+    # Profiles are served on their own
+    results.pop('profile', None)
+    if results.get('plates'):
+        results['plates'] = layout_summary(results['plates'])
+        for number, plate in enumerate(results['plates']['plates']):
+            plate['url'] = url_for('plate_layout', job_id=job['id'], number=number)
+    return results
 
 @app.route('/')
 def index():
@@ -34,39 +182,96 @@ def redirect_to_default():
 @app.route('/worklists/<function>/', methods=['GET', 'POST'])
 def worklists(function):
     data = {}
-    results = {}
     error = None
     if function in VALID_WORKLIST_FUNCTIONS:
         if request.method == 'POST':
             data = request.form.to_dict()
-            data['supplied_files'] = {}
-            for key, f in request.files.items():
-                tf = io.StringIO(f.read().decode('utf-8'))
-                data['supplied_files'][key] = tf
-            module, class_name = VALID_WORKLIST_FUNCTIONS[function].rsplit('.', 1)
-            GeneratorClass = getattr(import_module(module), class_name)
+            GeneratorClass = load_class(VALID_WORKLIST_FUNCTIONS[function])
             try:
-                m = GeneratorClass(**data, write_to=FILE_STORE)
-                generated_data = m.generate(data.get('equipment', 'mosquito'))
-                results['output_files'] = {fn: f.split('/')[-1] for fn, f in \
-                                           generated_data[0].items()}
-                results['plates'] = generated_data[2]
-                results['other_files'] = {fn: f.split('/')[-1] for fn, f in generated_data[1]}
+                job_id = JOB_QUEUE.submit(make_job_payload(function, GeneratorClass))
+            except QueueFull as e:
+                return render_template('{}.html'.format(function), data=data, results={},
+                                       error=e), 503
+            except UploadTooLarge as e:
+                return render_template('{}.html'.format(function), data=data, results={},
+                                       error=e), 413
             except Exception as e:
-                print(e)
-                traceback.print_exc()
-                error = e
-        return render_template('{}.html'.format(function), data=data, results=results, error=error)
+                return render_template('{}.html'.format(function), data=data, results={},
+                                       error=e), 400
+            return redirect(url_for('worklist_job', function=function, job_id=job_id))
+        return render_template('{}.html'.format(function), data=data, results={}, error=error)
     else:
         abort(404)
 
-@app.route('/worklists/download/<filename>/<download_as>/', methods=['GET'])
-def get_worklist_file(filename, download_as):
+@app.route('/worklists/<function>/jobs/<job_id>/', methods=['GET'])
+def worklist_job(function, job_id):
+    job = JOB_QUEUE.get(job_id)
+    if job is None or job['payload']['function'] != function:
+        abort(404)
+    job_timings(job)
+    return render_template('{}.html'.format(function), data=job['payload']['form'],
+                           results=page_results(job), error=job['error'], job=job)
+
+@app.route('/api/worklists/<function>/jobs/', methods=['POST'])
+def submit_worklist_job(function):
+    if function not in VALID_WORKLIST_FUNCTIONS:
+        abort(404)
+    GeneratorClass = load_class(VALID_WORKLIST_FUNCTIONS[function])
     try:
-        return send_from_directory(FILE_STORE, filename, as_attachment=True,
-                                   attachment_filename='{}.csv'.format(download_as))
+        job_id = JOB_QUEUE.submit(make_job_payload(function, GeneratorClass))
+    except QueueFull as e:
+        return jsonify({'error': str(e)}), 503
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
     except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'id': job_id, 'status': QUEUED,
+                    'url': url_for('worklist_job_status', job_id=job_id)}), 202
+
+@app.route('/api/jobs/<job_id>/', methods=['GET'])
+def worklist_job_status(job_id):
+    job = JOB_QUEUE.get(job_id)
+    if job is None:
+        abort(404)
+    job_timings(job)
+    return gzip_json({'id': job['id'], 'status': job['status'], 'error': job['error'],
+                      'result': job['result']})
+
+@app.route('/api/jobs/<job_id>/plates/<int:number>/', methods=['GET'])
+def plate_layout(job_id, number):
+    job = JOB_QUEUE.get(job_id)
+    if job is None or not job['result']:
+        abort(404)
+    plates = job['result']['plates']['plates']
+    if number >= len(plates):
         abort(404)
+    return gzip_json(plates[number])
+
+@app.route('/api/jobs/<job_id>/profile/', methods=['GET'])
+def job_profile(job_id):
+    job = JOB_QUEUE.get(job_id)
+    if job is None or not job['result'] or not job['result'].get('profile'):
+        abort(404)
+    return Response(job['result']['profile'], mimetype='text/plain')
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if request.remote_addr not in METRICS_ADDRESSES:
+        abort(404)
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache/', methods=['GET'])
+def cache_stats():
+    stats = RESULT_CACHE.stats()
+    stats['catalogues'] = CATALOGUE_CACHE.stats()
+    return jsonify(stats)
+
+@app.route('/worklists/download/<download_as>/<path:filename>', methods=['GET'])
+def get_worklist_file(filename, download_as):
+    if not FILE_STORE.exists(filename):
+        abort(404)
+    return send_file(FILE_STORE.open(filename), mimetype='text/csv', as_attachment=True,
+                     attachment_filename='{}.csv'.format(download_as))
 
 @app.route('/converters/<function>/', methods=['GET', 'POST'])
 def converters(function):
@@ -76,17 +281,20 @@ def converters(function):
         if request.method == 'POST':
             data = request.form.to_dict()
             data['files'] = {}
-            for key, f in request.files.items():
-                tf = io.StringIO(f.read().decode('utf-8'))
-                data['files'][key] = tf
-            module, class_name = VALID_CONVERTER_FUNCTIONS[function].rsplit('.', 1)
-            ConverterClass = getattr(import_module(module), class_name)
+            budget = UploadBudget(MAX_REQUEST_SIZE)
+            ConverterClass = load_class(VALID_CONVERTER_FUNCTIONS[function])
             try:
+                for key, f in request.files.items():
+                    data['files'][key] = open_upload(f.stream, MAX_FILE_SIZE, key, budget)
                 m = ConverterClass(**data, write_to=FILE_STORE)
                 generated = m.generate()
                 results['output'] = generated
+            except UploadTooLarge as e:
+                return render_template('{}.html'.format(function), results={}, error=e,
+                                       data=request.form), 413
             except Exception as e:
                 error = e
-        return render_template('{}.html'.format(function), results=results, error=error)
+        return render_template('{}.html'.format(function), results=results, error=error,
+                               data=request.form)
     else:
         abort(404)
@@ -0,0 +1,171 @@
+"""
+Run many worklist generator jobs in parallel without the web interface.
+
+Jobs are described in a JSON manifest:
+
+    {"jobs": [
+        {"name": "run-1",
+         "generator": "partpooling",
+         "equipment": "mosquito",
+         "parameters": {"number_of_wells": 96, "placement": "column"},
+         "files": {"constructs_file": "constructs.csv",
+                   "parts_file": "parts.csv",
+                   "parts_location_file": "locations.csv"}}
+    ]}
+
+Relative file paths are taken from the directory of the manifest. Part
+pooling jobs may leave out the parts files and read their parts from a part
+inventory given with --inventory, which a job only changes if its parameters
+set "update_inventory". Equipment may be "all" to produce the files for every
+supported format. The outputs of each job are written to a directory named
+after the job, and a report of the status and timing of every job is written
+to report.json.
+
+    python -m toolbox.batch manifest.json -o outputs/ -j 8 --inventory inventory.sqlite
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from toolbox.registry import VALID_WORKLIST_FUNCTIONS, load_class
+from toolbox.metrics import Recorder
+
+
+def load_manifest(manifest_path):
+    """
+    Read a manifest, checking every job refers to a known generator and
+    resolving input file paths
+    """
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    names = set()
+    for i, job in enumerate(manifest.get('jobs', [])):
+        name = str(job.get('name', 'job-{}'.format(i + 1)))
+        if name in names:
+            raise Exception('Job name {} is used more than once'.format(name))
+        names.add(name)
+        if job.get('generator') not in VALID_WORKLIST_FUNCTIONS:
+            raise Exception('Job {} has an unknown generator: {}'
+                            .format(name, job.get('generator')))
+        jobs.append({
+            'name': name,
+            'generator': job['generator'],
+            'equipment': job.get('equipment', 'mosquito'),
+            'parameters': job.get('parameters', {}),
+            'files': {key: os.path.join(base, path) for key, path in job.get('files', {}).items()},
+        })
+    return jobs
+
+
+def write_output(directory, file_name, output):
+    path = os.path.join(directory, '{}.csv'.format(file_name))
+    with open(path, 'w', newline='') as f:
+        f.write(output.getvalue())
+    return path
+
+
+def run_job(job, output_dir, inventory=None):
+    """
+    Run a single job, writing its files to a directory of its own. Returns a
+    status report for the job, with the time taken by each stage; failures
+    are reported rather than raised.
+    """
+    started = time.perf_counter()
+    report = {'name': job['name'], 'generator': job['generator'],
+              'equipment': job['equipment'], 'files': []}
+    supplied_files = {}
+    recorder = Recorder(job['generator']).start()
+    try:
+        GeneratorClass = load_class(VALID_WORKLIST_FUNCTIONS[job['generator']])
+        # Input files are read as they are parsed rather than all at once
+        for key, path in job['files'].items():
+            supplied_files[key] = open(path, encoding='utf-8', newline='')
+        generator = GeneratorClass(supplied_files=supplied_files, inventory=inventory,
+                                   **job['parameters'])
+        if job['equipment'] == 'all':
+            outputs, other_files, plate_data = generator.generate_all()
+            output_files = {'{}_{}'.format(equipment, fn): f for equipment, files in outputs.items()
+                            for fn, f in files.items()}
+        else:
+            output_files, other_files, plate_data = generator.generate(job['equipment'])
+        job_dir = os.path.join(output_dir, job['name'])
+        os.makedirs(job_dir, exist_ok=True)
+        for file_name, output in list(output_files.items()) + list(other_files):
+            report['files'].append(write_output(job_dir, file_name, output))
+        report['estimates'] = generator.estimates
+        report['status'] = 'ok'
+    except Exception as e:
+        report['status'] = 'failed'
+        report['error'] = str(e)
+        report['traceback'] = traceback.format_exc()
+    finally:
+        for f in supplied_files.values():
+            f.close()
+        recorder.finish('done' if report.get('status') == 'ok' else 'failed', job=job['name'])
+    report['timings'] = recorder.as_dict()
+    report['seconds'] = round(time.perf_counter() - started, 4)
+    return report
+
+
+def run_batch(jobs, output_dir, workers=None, progress=None, inventory=None):
+    """
+    Run jobs across a pool of processes. Reports are returned in manifest
+    order; progress, if given, is called with each report as jobs finish.
+    Jobs read parts from the inventory database at the given path, if any.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    reports = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, job, output_dir, inventory): i
+                   for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            report = future.result()
+            if progress:
+                progress(report)
+            reports[futures[future]] = report
+    summary = {
+        'jobs': reports,
+        'succeeded': sum(1 for r in reports if r['status'] == 'ok'),
+        'failed': sum(1 for r in reports if r['status'] != 'ok'),
+        'seconds': round(time.perf_counter() - started, 4),
+    }
+    with open(os.path.join(output_dir, 'report.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def print_report(report):
+    line = '{status:6} {name} ({seconds}s)'.format(**report)
+    if report['status'] != 'ok':
+        line += ': {}'.format(report['error'])
+    print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a batch of worklist generator jobs')
+    parser.add_argument('manifest', help='JSON manifest describing the jobs')
+    parser.add_argument('-o', '--output', default='outputs',
+                        help='Directory to write job outputs and report to')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--inventory', default=None,
+                        help='Part inventory database to read parts from')
+    args = parser.parse_args(argv)
+
+    jobs = load_manifest(args.manifest)
+    summary = run_batch(jobs, args.output, workers=args.workers, progress=print_report,
+                        inventory=args.inventory)
+    print('{} succeeded, {} failed in {}s'.format(summary['succeeded'], summary['failed'],
+                                                 summary['seconds']))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
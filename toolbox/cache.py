@@ -0,0 +1,217 @@
+"""
+Cache of generated worklist results, keyed on the content of the request.
+
+The key is a hash of the generator function, the normalised form parameters
+(including the equipment format) and the hashes of the uploaded files, so
+resubmitting the same files with the same settings returns the results of
+the earlier run instead of generating everything again.
+
+Parsed input files that are uploaded again and again, such as the parts
+catalogue, are kept in a CatalogueCache keyed on the hash of their content,
+so that a run with a different construct list can reuse them without
+parsing them again.
+"""
+import sys
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def make_key(function, form, file_hashes, default_equipment='mosquito'):
+    """
+    Hash a generator request, given the SHA-256 hex digest of each uploaded
+    file. Form values are stripped of surrounding whitespace and the
+    equipment defaults as it does when generating.
+    """
+    form = {key: str(value).strip() for key, value in form.items()}
+    form.setdefault('equipment', default_equipment)
+    digest = hashlib.sha256()
+    digest.update(json.dumps([function, sorted(form.items())]).encode('utf-8'))
+    for key in sorted(file_hashes):
+        digest.update(key.encode('utf-8'))
+        digest.update(file_hashes[key].encode('ascii'))
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    Thread safe least recently used cache of results.
+
+    Entries older than max_age seconds are dropped, and the least recently
+    used entries are evicted to keep within max_entries and max_bytes (the
+    size of an entry is the size of its JSON encoding). If validate is given
+    it is called with a cached result before it is returned and the entry is
+    dropped if it returns False, e.g. when the files it refers to are gone.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, max_age=24 * 60 * 60,
+                 validate=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.validate = validate
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, size, result = entry
+                if time.time() - created > self.max_age or \
+                        (self.validate and not self.validate(result)):
+                    self._remove(key)
+                    self.evictions += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        size = len(json.dumps(result))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (time.time(), size, result)
+            self._bytes += size
+            self._evict()
+
+    def _remove(self, key):
+        created, size, result = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        now = time.time()
+        for key, (created, size, result) in list(self._entries.items()):
+            if now - created > self.max_age:
+                self._remove(key)
+                self.evictions += 1
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+
+def approximate_size(value):
+    """
+    Rough number of bytes of memory used by a parsed file; containers,
+    strings, numbers and NumPy arrays are counted, shared objects once
+    """
+    seen = set()
+    size = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, np.ndarray):
+            size += item.nbytes
+            continue
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, '__dict__'):
+            stack.append(item.__dict__)
+    return size
+
+
+class CatalogueCache(object):
+    """
+    Thread safe least recently used cache of parsed files, keyed on the
+    kind of file and the hash of its content.
+
+    Entries are evicted to keep the approximate memory used within
+    max_bytes. Cached values are shared between runs, so they must not be
+    changed by the code using them.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, kind, digest, load):
+        """
+        Get the parsed file, calling load to parse it if it is not cached
+        """
+        key = (kind, digest)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        # Parsed outside the lock so that other files can be looked up
+        # meanwhile; a file parsed by two runs at once is cached once.
+        value = load()
+        size = approximate_size(value)
+        with self._lock:
+            if key not in self._entries and size <= self.max_bytes:
+                self._entries[key] = (size, value)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    old_size, old = self._entries.popitem(last=False)[1]
+                    self._bytes -= old_size
+                    self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+            }
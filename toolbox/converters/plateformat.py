@@ -0,0 +1,72 @@
+import csv
+
+from .converters import Converter
+from .plates import FORMATS, READERS, WRITERS
+
+
+# Plates returned for showing on the page, the rest are only in the file
+SHOWN_PLATES = 10
+
+
+class PlateFormatConverter(Converter):
+    """
+    Convert plates between the list, grid and matrix formats
+    """
+
+    # Form key of the input file
+    FILE_KEY = 'plates'
+    # Formats of converters that only convert one way
+    INPUT_FORMAT = None
+    OUTPUT_FORMAT = None
+
+    def setup(self, **kwargs):
+        self.input_format = self.INPUT_FORMAT or kwargs.get('input_format', 'list')
+        self.output_format = self.OUTPUT_FORMAT or kwargs.get('output_format', 'grid')
+        for chosen in (self.input_format, self.output_format):
+            if chosen not in FORMATS:
+                raise Exception('Unknown plate format {}'.format(chosen))
+        # Plate format, or None to work it out from the file
+        number_of_wells = kwargs.get('number_of_wells')
+        self.number_of_wells = int(number_of_wells) if number_of_wells not in (None, '', 'auto') \
+            else None
+        # Write matrix cells as separate substance and mix columns of a list
+        self.split_mix = str(kwargs.get('split_mix', '')).lower() in ('1', 'on', 'true', 'yes')
+
+    def read(self):
+        if self.FILE_KEY not in self.input_files:
+            raise Exception('Missing {} file'.format(self.FILE_KEY))
+        try:
+            return READERS[self.input_format](self.input_files[self.FILE_KEY],
+                                              self.number_of_wells)
+        except csv.Error:
+            raise Exception('The {} file is not a valid CSV file'.format(self.FILE_KEY))
+
+    def write(self, grids):
+        """
+        Write the plates in the output format, returning the file, or its
+        key if written to a file store
+        """
+        output_file = self.get_file(self.write_to)
+        if self.output_format == 'list':
+            WRITERS['list'](grids, output_file, split_mix=self.split_mix)
+        else:
+            WRITERS[self.output_format](grids, output_file)
+        if self.write_to:
+            output_file.close()
+            return output_file.name
+        return output_file
+
+    def generate(self):
+        grids = self.read()
+        plates, wells, values = grids.filled()
+        return {
+            'number_of_wells': grids.well_index.well_count,
+            'plates': len(grids),
+            'filled': len(wells),
+            'letters': list(grids.well_index.row_labels),
+            'columns': grids.well_index.columns,
+            'grids': grids.values[:SHOWN_PLATES].tolist(),
+            'output_files': {
+                'plates_{}'.format(self.output_format): self.write(grids),
+            },
+        }
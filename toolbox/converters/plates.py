@@ -0,0 +1,344 @@
+"""
+Conversion of plate contents between file formats.
+
+    list     one row per filled well, with a header row naming the columns.
+             The well column is "well" (or the first column), the plate
+             column "plate" (or every well is on plate 1) and the contents
+             "value" or "substance" (or the first other column). A "mix"
+             column is written into the contents as "substance(mix)".
+    grid     each plate as a labelled grid: a row of column numbers, then a
+             row for each plate row starting with its letter(s), with a
+             blank line between plates
+    matrix   bare grids stacked one under another, as read by the plate
+             matrix generator
+
+Plates are held as one array of shape (plates, rows, columns) for any plate
+format. Lists are read a chunk of rows at a time into NumPy arrays of plate
+number, well index and contents, each different well name is parsed only
+once, and every plate is filled in one assignment. Grids and matrices are
+read a plate at a time as the lines come in, and files are written out a
+plate at a time.
+"""
+import re
+import csv
+from itertools import islice
+
+import numpy as np
+
+from ..generators.wells import PLATE_FORMATS, WellIndex, row_label
+from ..loader import CHUNK_ROWS, CSVErrors, iter_matrices, parse_cell
+
+
+FORMATS = ('list', 'grid', 'matrix')
+
+# Plate format the plate matrix generator reads by default
+DEFAULT_MATRIX_WELLS = 384
+
+WELL_PATTERN = re.compile(r'^([A-Z]+)0*(\d+)$')
+
+ROW_LABEL_PATTERN = re.compile(r'^[A-Z]{1,2}$')
+
+
+def row_number(label):
+    """
+    Row of a row label, counting from 0 (A) and carrying on from Z to AA
+    """
+    number = 0
+    for letter in label:
+        number = number * 26 + ord(letter) - 64
+    return number - 1
+
+
+def plate_format(rows, columns):
+    """
+    Smallest plate format with at least the given rows and columns
+    """
+    for well_count, (format_columns, format_rows) in sorted(PLATE_FORMATS.items()):
+        if rows <= format_rows and columns <= format_columns:
+            return well_count
+    raise Exception('No plate format has {} rows and {} columns'.format(rows, columns))
+
+
+class PlateGrids(object):
+    """
+    Contents of a series of plates of one format, numbered from 1, as an
+    array of shape (plates, rows, columns) with '' for empty wells
+    """
+
+    def __init__(self, well_index, values):
+        self.well_index = well_index
+        self.values = values
+
+    @classmethod
+    def from_wells(cls, well_index, plates, wells, values):
+        """
+        Build the plates from arrays of the plate number, well index and
+        contents of each filled well
+        """
+        grids = np.full((int(plates.max()) if len(plates) else 1,
+                         well_index.rows * well_index.columns), '', dtype=object)
+        grids[plates - 1, wells] = values
+        return cls(well_index, grids.reshape(-1, well_index.rows, well_index.columns))
+
+    def __len__(self):
+        return len(self.values)
+
+    def filled(self):
+        """
+        Plate numbers, well indices and contents of the filled wells, in
+        plate then well order
+        """
+        flat = self.values.reshape(len(self), -1)
+        plates, wells = np.nonzero(flat != '')
+        return plates + 1, wells, flat[plates, wells]
+
+
+def well_positions(names, line_numbers, errors):
+    """
+    Rows and columns, counting from 0, of an array of well names such as
+    "A1" or "A01". Names that are not wells are reported in errors and given
+    row and column -1.
+    """
+    unique, inverse = np.unique(names, return_inverse=True)
+    positions = np.full((len(unique), 2), -1, dtype=np.int64)
+    for i, name in enumerate(unique):
+        match = WELL_PATTERN.match(name.strip().upper())
+        if match and int(match.group(2)) > 0:
+            positions[i] = row_number(match.group(1)), int(match.group(2)) - 1
+    bad = positions[inverse, 0] < 0
+    for i in np.flatnonzero(bad):
+        errors.append('line {}: "{}" is not a well'.format(line_numbers[i], names[i]))
+    return positions[inverse, 0], positions[inverse, 1]
+
+
+def find_column(headers, names, default=None):
+    for name in names:
+        if name in headers:
+            return headers.index(name)
+    return default
+
+
+def read_list(file_object, well_count=None, chunk_rows=CHUNK_ROWS):
+    """
+    Read plates from a list file. The plate format is the smallest that fits
+    every well if well_count is not given.
+    """
+    reader = csv.reader(file_object)
+    headers = [header.strip().lower() for header in next(reader, [])]
+    if not headers:
+        raise Exception('The list file is invalid; No headers present.')
+    well_column = find_column(headers, ['well'], 0)
+    plate_column = find_column(headers, ['plate'])
+    mix_column = find_column(headers, ['mix'])
+    value_column = find_column(headers, ['value', 'substance'])
+    if value_column is None:
+        others = [i for i in range(len(headers)) if i not in (well_column, plate_column)]
+        if not others:
+            raise Exception('The list file has no column of well contents')
+        value_column = others[0]
+
+    width = max(well_column, value_column, plate_column or 0, mix_column or 0) + 1
+    errors = []
+    plates, rows, columns, values = [], [], [], []
+    while True:
+        chunk = []
+        line_numbers = []
+        for row in islice(reader, chunk_rows):
+            chunk.append(row + [''] * (width - len(row)))
+            line_numbers.append(reader.line_num)
+        if not chunk:
+            break
+        line_numbers = np.array(line_numbers)
+        contents = np.array([row[value_column].strip() for row in chunk], dtype=object)
+        if mix_column is not None:
+            mixes = np.array([row[mix_column].strip() for row in chunk], dtype=object)
+            with_mix = mixes != ''
+            contents[with_mix] = contents[with_mix] + '(' + mixes[with_mix] + ')'
+        # Wells left empty are skipped
+        keep = np.flatnonzero(contents != '')
+        if not len(keep):
+            continue
+        chunk = [chunk[i] for i in keep]
+        line_numbers = line_numbers[keep]
+        if plate_column is None:
+            chunk_plates = np.ones(len(chunk), dtype=np.int64)
+        else:
+            numbers = [row[plate_column].strip() for row in chunk]
+            try:
+                chunk_plates = np.array(numbers, dtype=np.int64)
+            except ValueError:
+                chunk_plates = np.zeros(len(chunk), dtype=np.int64)
+                for i, number in enumerate(numbers):
+                    try:
+                        chunk_plates[i] = int(number)
+                    except ValueError:
+                        pass
+            for i in np.flatnonzero(chunk_plates < 1):
+                errors.append('line {}: plate "{}" is not a plate number from 1'
+                              .format(line_numbers[i], chunk[i][plate_column].strip()))
+        well_rows, well_columns = well_positions(
+            np.array([row[well_column] for row in chunk], dtype=object), line_numbers, errors)
+        plates.append(chunk_plates)
+        rows.append(well_rows)
+        columns.append(well_columns)
+        values.append(contents[keep])
+    if errors:
+        raise CSVErrors('list', errors)
+
+    plates = np.concatenate(plates) if plates else np.zeros(0, dtype=np.int64)
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    columns = np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64)
+    values = np.concatenate(values) if values else np.zeros(0, dtype=object)
+    if well_count is None:
+        well_count = plate_format(rows.max() + 1, columns.max() + 1) if len(rows) else 96
+    well_index = WellIndex.get(well_count)
+    outside = np.flatnonzero((rows >= well_index.rows) | (columns >= well_index.columns))
+    if len(outside):
+        first = outside[0]
+        raise Exception('Well {}{} of plate {} is not on a {} well plate'
+                        .format(row_label(rows[first]), columns[first] + 1, plates[first],
+                                well_count))
+    wells = rows * well_index.columns + columns
+    # Each well may only be given once
+    keys = (plates - 1) * well_count + wells
+    unique, counts = np.unique(keys, return_counts=True)
+    if len(unique) < len(keys):
+        key = unique[counts > 1][0]
+        raise Exception('Well {} of plate {} is given more than once'
+                        .format(well_index.names[key % well_count], key // well_count + 1))
+    return PlateGrids.from_wells(well_index, plates, wells, values)
+
+
+def read_grids(matrices, well_index, labelled):
+    """
+    Fill plates from a series of matrices, one for each plate, of rows of
+    cells either starting with the row label or not
+    """
+    start = 1 if labelled else 0
+    width = start + well_index.columns
+    grids = []
+    for number, matrix in enumerate(matrices, 1):
+        grid = np.full((well_index.rows, well_index.columns), '', dtype=object)
+        if len(matrix) > well_index.rows:
+            raise Exception('Plate {} has more rows than a {} well plate'
+                            .format(number, well_index.well_count))
+        for row, line in enumerate(matrix):
+            if len(line) > width and any(c.strip() for c in line[width:]):
+                raise Exception('Plate {} has more columns than a {} well plate'
+                                .format(number, well_index.well_count))
+            if labelled:
+                label = line[0].strip().upper()
+                if label not in well_index.row_numbers:
+                    raise Exception('Plate {} has a row "{}" that is not on a {} well plate'
+                                    .format(number, line[0], well_index.well_count))
+                row = well_index.row_numbers[label]
+            cells = [cell.strip() for cell in line[start:width]]
+            grid[row, :len(cells)] = cells
+        grids.append(grid)
+    if not grids:
+        grids.append(np.full((well_index.rows, well_index.columns), '', dtype=object))
+    return PlateGrids(well_index, np.stack(grids))
+
+
+def iter_grids(lines):
+    """
+    Split the lines of a grid file into one grid per plate, as the lines are
+    read. Each plate starts with its row of column numbers, headed by an
+    empty cell or the plate's name, and each row after that starts with its
+    row label.
+    """
+    grid = None
+    for line in lines:
+        if not any(cell.strip() for cell in line):
+            continue
+        if grid is not None and ROW_LABEL_PATTERN.match(line[0].strip().upper()):
+            grid.append(line)
+            continue
+        if grid:
+            yield grid
+        grid = [line]
+    if grid:
+        yield grid
+
+
+def read_grid(file_object, well_count=None):
+    """
+    Read plates from a grid file. The plate format is the smallest that fits
+    the first plate if well_count is not given.
+    """
+    grids = iter_grids(csv.reader(file_object))
+    first = next(grids, None)
+    if well_count is None:
+        if first is None:
+            well_count = 96
+        else:
+            columns = sum(1 for cell in first[0][1:] if cell.strip())
+            rows = max(row_number(line[0].strip().upper()) for line in first[1:]) + 1 \
+                if len(first) > 1 else 1
+            well_count = plate_format(rows, columns)
+    well_index = WellIndex.get(well_count)
+
+    def matrices():
+        if first is not None:
+            yield first[1:]
+            for grid in grids:
+                yield grid[1:]
+    return read_grids(matrices(), well_index, True)
+
+
+def read_matrix(file_object, well_count=None):
+    """
+    Read plates from a stacked plate matrix
+    """
+    well_index = WellIndex.get(well_count or DEFAULT_MATRIX_WELLS)
+    return read_grids(iter_matrices(csv.reader(file_object), well_index.rows),
+                      well_index, False)
+
+
+def write_list(grids, file_object, split_mix=False):
+    """
+    Write the filled wells as a list, with the contents split into substance
+    and mix columns if split_mix is set
+    """
+    writer = csv.writer(file_object)
+    plates, wells, values = grids.filled()
+    names = grids.well_index.names
+    if split_mix:
+        writer.writerow(['plate', 'well', 'substance', 'mix'])
+        writer.writerows((plate, names[well]) + parse_cell(value)
+                         for plate, well, value in zip(plates.tolist(), wells.tolist(), values))
+    else:
+        writer.writerow(['plate', 'well', 'value'])
+        writer.writerows(zip(plates.tolist(), (names[well] for well in wells.tolist()), values))
+
+
+def write_grid(grids, file_object):
+    writer = csv.writer(file_object)
+    header = [''] + list(range(1, grids.well_index.columns + 1))
+    for number, grid in enumerate(grids.values):
+        if number:
+            writer.writerow([])
+        writer.writerow(header)
+        writer.writerows([label] + row for label, row in zip(grids.well_index.row_labels,
+                                                               grid.tolist()))
+
+
+def write_matrix(grids, file_object):
+    writer = csv.writer(file_object)
+    for number, grid in enumerate(grids.values):
+        if number:
+            writer.writerow([])
+        writer.writerows(grid.tolist())
+
+
+READERS = {
+    'list': read_list,
+    'grid': read_grid,
+    'matrix': read_matrix,
+}
+
+WRITERS = {
+    'list': write_list,
+    'grid': write_grid,
+    'matrix': write_matrix,
+}
@@ -0,0 +1,260 @@
+"""
+Stores for the files produced by generators, formatters and converters.
+
+Files are grouped by run, and are referred to by a key of the form
+"<shard>/<run>/<file>", where the shard is taken from the start of the run id
+so that no one directory grows too large. Whole runs are evicted once they
+are older than the time to live, or, oldest first, when the store holds more
+than its size quota. Eviction happens in a background thread every
+sweep_interval seconds once the store is first written to.
+
+DiskFileStore keeps the files under a directory, MemoryFileStore keeps them in
+memory for tests and short lived runs. Generators and converters given the
+path of a directory rather than a store write to a DiskFileStore under it,
+and name their files by path as they did before stores were added.
+"""
+import io
+import os
+import re
+import time
+import shutil
+import logging
+import threading
+
+
+logger = logging.getLogger('toolbox.filestore')
+
+
+KEY_PATTERN = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{32}/[0-9a-f]{32}\.csv$')
+
+
+def as_store(write_to):
+    """
+    Get the store for a write_to argument, which may be a store, None or the
+    path of a directory to store files under. Files written under a directory
+    are named by their path rather than their key.
+    """
+    if write_to is None or isinstance(write_to, FileStore):
+        return write_to
+    return DiskFileStore(write_to, keyed=False)
+
+
+class FileStore(object):
+
+    def __init__(self, ttl=None, max_bytes=None, sweep_interval=None, clock=time.time):
+        # Seconds to keep a run for, and the total size allowed. None for no limit.
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        # Time now in seconds, which runs are aged by
+        self.clock = clock
+        self._sweeper = None
+        self._lock = threading.Lock()
+
+    def new_run(self):
+        # Random 32 digit hex ids, as uuid4().hex without importing uuid
+        return os.urandom(16).hex()
+
+    def make_key(self, run):
+        return '{}/{}/{}.csv'.format(run[:2], run, os.urandom(16).hex())
+
+    def valid_key(self, key):
+        return KEY_PATTERN.match(key) is not None
+
+    def create(self, run=None):
+        """
+        Create a new text file in a run, named by its key (or its path if a
+        DiskFileStore is not keyed)
+        """
+        self._start_sweeper()
+        return self._create(self.make_key(run or self.new_run()))
+
+    def _start_sweeper(self):
+        if not self.sweep_interval or self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep, daemon=True,
+                                                 name='file-store-eviction')
+                self._sweeper.start()
+
+    def _sweep(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.evict()
+            except Exception:
+                logger.exception('File store eviction failed')
+
+    def evict(self):
+        """
+        Remove runs past their time to live, then the oldest runs until the
+        store is within its size quota. Returns the number of runs removed.
+        """
+        runs = sorted(self.runs(), key=lambda run: run[1])
+        removed = 0
+        total = sum(size for run, modified, size in runs)
+        now = self.clock()
+        for run, modified, size in runs:
+            expired = self.ttl is not None and now - modified > self.ttl
+            over_quota = self.max_bytes is not None and total > self.max_bytes
+            if not (expired or over_quota):
+                continue
+            self.remove_run(run)
+            total -= size
+            removed += 1
+        return removed
+
+    def _create(self, key):
+        raise NotImplementedError
+
+    def open(self, key):
+        """
+        Open a stored file for reading as bytes
+        """
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def runs(self):
+        """
+        List the runs in the store as (run, last modified, size in bytes)
+        """
+        raise NotImplementedError
+
+    def remove_run(self, run):
+        raise NotImplementedError
+
+
+class DiskFileStore(FileStore):
+
+    def __init__(self, root, ttl=None, max_bytes=None, sweep_interval=None, keyed=True,
+                 clock=time.time):
+        super().__init__(ttl, max_bytes, sweep_interval, clock)
+        self.root = root
+        # Name created files by their key, or by their path
+        self.keyed = keyed
+
+    def path(self, key):
+        if not self.valid_key(key):
+            raise KeyError(key)
+        return os.path.join(self.root, key)
+
+    def _create(self, key):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, mode='w', newline='')
+        if not self.keyed:
+            return f
+        # Files are known by their key rather than their full path
+        return _KeyedFile(f, key)
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def exists(self, key):
+        try:
+            return os.path.isfile(self.path(key))
+        except KeyError:
+            return False
+
+    def runs(self):
+        runs = []
+        if not os.path.isdir(self.root):
+            return runs
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for run in os.scandir(shard.path):
+                if not run.is_dir():
+                    continue
+                modified = run.stat().st_mtime
+                size = 0
+                for f in os.scandir(run.path):
+                    stat = f.stat()
+                    size += stat.st_size
+                    modified = max(modified, stat.st_mtime)
+                runs.append((run.name, modified, size))
+        return runs
+
+    def remove_run(self, run):
+        shard = os.path.join(self.root, run[:2])
+        shutil.rmtree(os.path.join(shard, run), ignore_errors=True)
+        try:
+            os.rmdir(shard)
+        except OSError:
+            pass
+
+
+class _KeyedFile(object):
+    """
+    Wrap a file object so that its name is a store key
+    """
+
+    def __init__(self, f, key):
+        self._file = f
+        self.name = key
+
+    def __getattr__(self, attr):
+        return getattr(self._file, attr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._file.close()
+
+
+class MemoryFileStore(FileStore):
+
+    def __init__(self, ttl=None, max_bytes=None, sweep_interval=None, clock=time.time):
+        super().__init__(ttl, max_bytes, sweep_interval, clock)
+        # key -> (time written, contents)
+        self._files = {}
+
+    def _create(self, key):
+        return _MemoryFile(self, key)
+
+    def _save(self, key, contents):
+        with self._lock:
+            self._files[key] = (self.clock(), contents.encode('utf-8'))
+
+    def open(self, key):
+        try:
+            return io.BytesIO(self._files[key][1])
+        except KeyError:
+            raise FileNotFoundError(key)
+
+    def exists(self, key):
+        return key in self._files
+
+    def runs(self):
+        runs = {}
+        with self._lock:
+            for key, (written, contents) in self._files.items():
+                run = key.split('/')[1]
+                modified, size = runs.get(run, (0, 0))
+                runs[run] = (max(modified, written), size + len(contents))
+        return [(run, modified, size) for run, (modified, size) in runs.items()]
+
+    def remove_run(self, run):
+        with self._lock:
+            for key in [k for k in self._files if k.split('/')[1] == run]:
+                del self._files[key]
+
+
+class _MemoryFile(io.StringIO):
+    """
+    Text file kept in a MemoryFileStore, saved to the store when closed
+    """
+
+    def __init__(self, store, key):
+        super().__init__(newline='')
+        self.store = store
+        self.name = key
+
+    def close(self):
+        if not self.closed:
+            self.store._save(self.name, self.getvalue())
+        super().close()
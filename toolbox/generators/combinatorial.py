@@ -0,0 +1,122 @@
+"""
+Combinatorial construct libraries for part pooling.
+
+A design file has the same columns as a constructs file, but each column lists
+the candidate parts for that slot down its rows rather than each row being a
+construct. Every combination of one candidate per slot is a construct. The
+combinations are produced one at a time as they are needed, so a library can
+be far larger than could be written out as a constructs file.
+
+A random sample of the combinations may be taken instead of all of them, and
+exclusion rules (sets of parts that must not be used together) drop any
+construct that contains every part of a rule.
+"""
+import csv
+import random
+from itertools import product
+
+
+class CombinatorialDesign(object):
+
+    def __init__(self, slots):
+        # (slot name, candidates) in the order of the design file
+        self.slots = slots
+        self.size = 1
+        for name, candidates in slots:
+            self.size *= len(candidates)
+
+    @classmethod
+    def from_table(cls, table):
+        """
+        Build the design from a loaded design file. Empty slots are left
+        empty in every construct; Master Mix candidates are volumes.
+        """
+        slots = []
+        for name, column in table.columns.items():
+            candidates = list(dict.fromkeys(value for value in column if value != ''))
+            if name == 'Master Mix':
+                if not candidates:
+                    raise Exception('The Design file has no Master Mix volume')
+                try:
+                    candidates = [float(value) for value in candidates]
+                except ValueError:
+                    raise Exception('The Design file has a Master Mix volume that is not a number')
+            slots.append((name, candidates or ['']))
+        return cls(slots)
+
+    def __len__(self):
+        return self.size
+
+    def construct(self, index):
+        """
+        The construct at a position in the full list of combinations
+        """
+        values = []
+        for name, candidates in reversed(self.slots):
+            index, choice = divmod(index, len(candidates))
+            values.append(candidates[choice])
+        return dict(zip((name for name, candidates in self.slots), reversed(values)))
+
+    def _all(self):
+        names = [name for name, candidates in self.slots]
+        for values in product(*(candidates for name, candidates in self.slots)):
+            yield dict(zip(names, values))
+
+    def _sample(self, rng):
+        # Draw combinations at random without repeating any, rather than
+        # shuffling the whole list or remembering what has been drawn
+        for index in _permutation(self.size, rng):
+            yield self.construct(index)
+
+    def constructs(self, sample_size=None, seed=None, exclusions=()):
+        """
+        Iterate over the constructs of the design as dicts of slot to part,
+        leaving out any that match an exclusion rule. If sample_size is given
+        at most that many constructs are chosen at random.
+        """
+        if sample_size is None or sample_size >= self.size:
+            combinations = self._all()
+        else:
+            combinations = self._sample(random.Random(seed))
+        count = 0
+        for construct in combinations:
+            if sample_size is not None and count >= sample_size:
+                return
+            parts = set(construct.values())
+            if any(rule <= parts for rule in exclusions):
+                continue
+            count += 1
+            yield construct
+
+
+def _permutation(size, rng, rounds=4):
+    """
+    Iterate over range(size) in a random order, one index at a time. A small
+    Feistel network shuffles the bits of each position over the next power of
+    four, and values out of range are skipped, so nothing needs to be kept but
+    the round keys.
+    """
+    half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+    mask = (1 << half_bits) - 1
+    keys = [rng.getrandbits(64) for i in range(rounds)]
+    for position in range(1 << (2 * half_bits)):
+        left, right = position >> half_bits, position & mask
+        for key in keys:
+            # The top bits of a 64 bit multiplicative hash of the half and key
+            mixed = ((right + key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+            left, right = right, left ^ (mixed >> (64 - half_bits))
+        index = (left << half_bits) | right
+        if index < size:
+            yield index
+
+
+def read_exclusions(file_object):
+    """
+    Read exclusion rules from a CSV file with one rule of part names per row
+    """
+    rules = []
+    for row in csv.reader(file_object):
+        rule = frozenset(name.strip() for name in row if name.strip())
+        if rule:
+            rules.append(rule)
+    return rules
@@ -1,37 +1,130 @@
 import io
 import csv
-from tempfile import NamedTemporaryFile
+import pickle
+from heapq import merge
+from itertools import islice
 from math import ceil
-from string import ascii_uppercase
 from operator import itemgetter
-import pprint
+
+from .transfers import TransferTable
+from ..filestore import as_store
+from ..metrics import stage, count
+
+
+# Default maximum number of rows held in memory when sorting
+SORT_BUFFER = 100000
+
+
+def _spill(rows):
+    """
+    Write rows to an anonymous temporary file, returning the file
+    """
+    # Only imported when a worklist is too large to sort in memory
+    from tempfile import TemporaryFile
+    with stage('spill'):
+        spill_file = TemporaryFile()
+        for row in rows:
+            pickle.dump(row, spill_file, pickle.HIGHEST_PROTOCOL)
+        count('bytes_spilled', spill_file.tell())
+        spill_file.seek(0)
+    return spill_file
+
+
+def _unspill(spill_file):
+    with spill_file:
+        while True:
+            try:
+                yield pickle.load(spill_file)
+            except EOFError:
+                return
+
+
+def external_sort(rows, key, buffer_size=None):
+    """
+    Stable sort of an iterable of rows holding no more than buffer_size rows
+    (default SORT_BUFFER) in memory at a time.
+
+    Rows are sorted in chunks, any chunks beyond the first are spilled to
+    temporary files and the sorted chunks are then merged back together.
+    """
+    buffer_size = int(buffer_size or SORT_BUFFER)
+    rows = iter(rows)
+    chunk = list(islice(rows, buffer_size))
+    chunk.sort(key=key)
+    if len(chunk) < buffer_size:
+        return iter(chunk)
+    spilled = [_spill(chunk)]
+    while True:
+        chunk = list(islice(rows, buffer_size))
+        if not chunk:
+            break
+        chunk.sort(key=key)
+        spilled.append(_spill(chunk))
+    del chunk
+    # Merge is stable across its inputs, so equal rows keep their original order
+    return merge(*[_unspill(f) for f in spilled], key=key)
 
 
 class FileFormat(object):
-    def __init__(self, plates, substances, ordering=None, write_to=None):
+
+    # Whether every transfer into a well has to be in the same worklist, as
+    # the well is made as one reaction
+    KEEP_WELLS_TOGETHER = False
+
+    def __init__(self, plates, substances, ordering=None, write_to=None, sort_buffer=None,
+                 transfers=None, run=None, locations=None, write=True):
         self.plates = plates
         self.substances = substances
-        self.write_to = write_to
+        # Transfers to render, shared between formats where more than one is made
+        if transfers is None:
+            transfers = TransferTable.from_plates(plates)
+        self.transfers = transfers
+        # Deck position of each plate where it differs from its location
+        self.locations = locations or {}
+        self.write_to = as_store(write_to)
+        # Files from the same run are kept together in the store
+        if self.write_to and run is None:
+            run = self.write_to.new_run()
+        self.run = run
         self.output_files = {}
         self.ordering = ordering
+        # Maximum number of rows held in memory when sorting a worklist
+        self.sort_buffer = sort_buffer
+        # Formats made only to work out the order of their rows write nothing
+        if not write:
+            return
         self.make_file()
+        count('transfers_emitted', len(self.transfers))
+        for f in self.output_files.values():
+            # Characters, which are bytes as the files are ASCII
+            count('bytes_written', f.tell())
+            if self.write_to:
+                f.close()
+
+    def well_name(self, plate, well):
+        return plate.well_index.names[well]
 
-    def char_to_num(self, char):
-        return ascii_uppercase.index(char) + 1
+    def column_row(self, plate, well):
+        """
+        Get the (column, row) of a well, counting from 1
+        """
+        return plate.well_index.column_of[well] + 1, plate.well_index.row_of[well] + 1
 
     def get_file(self):
         if self.write_to:
-            return NamedTemporaryFile(mode='w', dir=self.write_to, delete=False)
+            return self.write_to.create(self.run)
         return io.StringIO()
 
-    def get_locations(self):
-        locations = {}
-        for plate in filter(lambda x: x.function != 'destination', self.plates):
-            filled = plate.get_filled_wells()
-            for loc, well in filled.items():
-                locations[well.contents[0].substance.name] = [plate.location, list(loc)[0],
-                                                              list(loc)[1]]
-        return locations
+    def location(self, plate):
+        return self.locations.get(plate, plate.location)
+
+    def get_source(self, plate, substance):
+        """
+        Get the location of the plate a transfer is made from
+        """
+        if plate is None:
+            raise Exception('Source location for {} not available!'.format(substance.name))
+        return self.location(plate)
 
     @property
     def output(self):
@@ -41,6 +134,38 @@ class FileFormat(object):
             data = self.output_files
         return data
 
+    def write_rows(self, writer, rows):
+        """
+        Write rows as they are produced, sorting them on the way if an
+        ordering has been requested
+        """
+        if self.ordering:
+            rows = external_sort(rows, itemgetter(*self.ordering), self.sort_buffer)
+        writer.writerows(rows)
+
+    def transfer_rows(self, source_plate, source_well, plate, well, substance, amount):
+        """
+        Rows written for a single transfer
+        """
+        raise NotImplementedError
+
+    def make_rows(self):
+        for transfer in self.transfers:
+            yield from self.transfer_rows(*transfer)
+
+    def fixed_order(self):
+        """
+        Index of the transfer each row is made from, in the order the rows
+        are written with the fixed ordering
+        """
+        rows = [(row, i) for i, transfer in enumerate(self.transfers)
+                for row in self.transfer_rows(*transfer)]
+        if self.ordering:
+            key = itemgetter(*self.ordering)
+            # A stable sort, as external_sort is
+            rows.sort(key=lambda row: key(row[0]))
+        return [i for row, i in rows]
+
     def make_file(self):
         pass
 
@@ -49,38 +174,33 @@ class MosquitoFileFormat(FileFormat):
 
     HEADERS = ['Position', 'Column', 'Row', 'Position', 'Column', 'Row', 'Nanolitres', '', '']
 
-    def make_row(self, amount, plate_location, well_location, substance_locations):
+    def make_row(self, source, amount, plate_location, well_location):
+        """
+        Rows for a transfer from source [location, column, row] to the well at
+        (column, row) of a plate
+        """
         rows = []
-        source = substance_locations[amount.substance.name]
-        if amount.amount > 1200:
-            redistribute = ceil(amount.amount/1200)
-            new_amount = ceil(amount.amount/redistribute)
+        if amount > 1200:
+            redistribute = ceil(amount/1200)
+            new_amount = ceil(amount/redistribute)
             for i in range(0, redistribute):
-                rows.append([source[0], source[2], self.char_to_num(source[1]),
-                             plate_location, well_location[1], self.char_to_num(well_location[0]),
-                             new_amount])
+                rows.append(source + [plate_location, well_location[0], well_location[1],
+                                      new_amount])
         else:
-            rows.append([source[0], source[2], self.char_to_num(source[1]),
-                         plate_location, well_location[1], self.char_to_num(well_location[0]),
-                         amount.amount])
+            rows.append(source + [plate_location, well_location[0], well_location[1], amount])
         return rows
 
+    def transfer_rows(self, source_plate, source_well, plate, well, substance, amount):
+        source = [self.get_source(source_plate, substance)]
+        source.extend(self.column_row(source_plate, source_well))
+        return self.make_row(source, amount, self.location(plate), self.column_row(plate, well))
+
     def make_file(self):
-        substance_locations = self.get_locations()
         output_file = self.get_file()
         writer = csv.writer(output_file)
-        worklist = []
-        for plate in filter(lambda x: x.function == 'destination', self.plates):
-            filled = plate.get_filled_wells()
-            for loc, well in filled.items():
-                for amount in well.contents:
-                    worklist.extend(self.make_row(amount, plate.location,
-                                                  loc, substance_locations))
-        if self.ordering:
-            worklist.sort(key=itemgetter(*self.ordering))
         writer.writerow(self.HEADERS)
         writer.writerow(['Worklist'] + [''] * (len(self.HEADERS) - 1))
-        writer.writerows(worklist)
+        self.write_rows(writer, self.make_rows())
         self.output_files['worklist'] = output_file
 
 
@@ -88,64 +208,79 @@ class EchoFileFormat(FileFormat):
 
     HEADERS = ['Source Barcode', 'Source', 'Destination Barcode', 'Destination', 'Volume']
 
+    def transfer_rows(self, source_plate, source_well, plate, well, substance, amount):
+        return [[self.get_source(source_plate, substance),
+                 self.well_name(source_plate, source_well),
+                 self.location(plate), self.well_name(plate, well), amount]]
+
     def make_file(self):
-        substance_locations = self.get_locations()
         output_file = self.get_file()
         writer = csv.writer(output_file)
-        worklist = []
-        for plate in filter(lambda x: x.function == 'destination', self.plates):
-            filled = plate.get_filled_wells()
-            for loc, well in filled.items():
-                for amount in well.contents:
-                    source = substance_locations[amount.substance.name]
-                    worklist.append([source[0], '{}{}'.format(source[1], source[2]),
-                                     plate.location, '{}{}'.format(loc[0], loc[1]), amount.amount])
-        if self.ordering:
-            worklist.sort(key=itemgetter(*self.ordering))
         writer.writerow(self.HEADERS)
-        writer.writerows(worklist)
+        self.write_rows(writer, self.make_rows())
         self.output_files['worklist'] = output_file
 
 
 class FelixFileFormat(FileFormat):
 
+    KEEP_WELLS_TOGETHER = True
+
     HEADERS_REACTION = ['Reaction_Number', 'Sample_Name', 'Volume']
     HEADERS_SOURCE = ['Well', 'Sample_Name']
 
-    def make_file(self):
-        substance_locations = self.get_locations()
+    def make_reaction(self, reaction_number, contents):
+        # REACTION
+        yield [reaction_number, 'REACTION', sum(amount for name, amount in contents)]
+        for name, amount in contents:
+            if name == 'Master Mix':
+                yield [reaction_number, 'MIX', amount]
+            elif name != 'Water':
+                yield [reaction_number, name, amount]
 
+    def make_reaction_rows(self):
+        # Transfers into the same well are adjacent, each well is one reaction
+        reaction_number = 0
+        current = None
+        contents = []
+        for source_plate, source_well, plate, well, substance, amount in self.transfers:
+            if (plate, well) != current:
+                if contents:
+                    yield from self.make_reaction(reaction_number, contents)
+                reaction_number += 1
+                current = (plate, well)
+                contents = []
+            contents.append((substance.name, amount))
+        if contents:
+            yield from self.make_reaction(reaction_number, contents)
+
+    def fixed_order(self):
+        # Reactions are written in the order of the transfers, the ordering
+        # only sorts the rows within a reaction
+        return list(range(len(self.transfers)))
+
+    def make_source_rows(self):
+        for plate in self.plates.labelled('Parts'):
+            for well in plate.occupancy:
+                yield [self.well_name(plate, well), plate.well_at(well).contents[0].substance.name]
+
+    def make_file(self):
         reactions_file = self.get_file()
         source_file = self.get_file()
 
         reaction_writer = csv.writer(reactions_file)
-        reaction_worklist = []
-        reaction_number = 1
-        for plate in filter(lambda x: x.function == 'destination', self.plates):
-            filled = plate.get_filled_wells()
-            for loc, well in filled.items():
-                # REACTION
-                reaction_worklist.append([reaction_number, 'REACTION', well.total()])
-                for amount in well.contents:
-                    if amount.substance.name == 'Master Mix':
-                        reaction_worklist.append([reaction_number, 'MIX', amount.amount])
-                    elif amount.substance.name != 'Water':
-                        reaction_worklist.append([reaction_number, amount.substance.name,
-                                                  amount.amount])
-                reaction_number += 1
-        if self.ordering:
-            reaction_worklist.sort(key=itemgetter(*self.ordering))
         reaction_writer.writerow(self.HEADERS_REACTION)
-        reaction_writer.writerows(reaction_worklist)
+        self.write_rows(reaction_writer, self.make_reaction_rows())
         self.output_files['reactions'] = reactions_file
 
         source_writer = csv.writer(source_file)
-        source_worklist = []
-        for plate in filter(lambda x: x.label == 'Parts', self.plates):
-            filled = plate.get_filled_wells()
-            for loc, well in filled.items():
-                source_worklist.append(["{}{}".format(*loc), well.contents[0].substance.name])
         source_writer.writerow(self.HEADERS_SOURCE)
-        source_writer.writerows(source_worklist)
+        source_writer.writerows(self.make_source_rows())
         self.output_files['sources'] = source_file
 
+
+# Equipment a worklist can be generated for
+FORMATS = {
+    'mosquito': MosquitoFileFormat,
+    'echo': EchoFileFormat,
+    'felix': FelixFileFormat,
+}
@@ -1,78 +1,235 @@
+import io
 import csv
-from tempfile import NamedTemporaryFile
-from string import ascii_uppercase
+from itertools import count
+from collections.abc import Mapping
 
-from .formatters import MosquitoFileFormat, EchoFileFormat, FelixFileFormat
+import numpy as np
+
+from .formatters import FORMATS
+from .storage import PlateStore, Occupancy
+from .transfers import TransferTable
+from .optimiser import OPTIMISE_CHOICES, optimise_transfers
+from .scheduler import schedule_loads, load_plan
+from .wells import WellIndex
+from ..filestore import as_store
+from .. import metrics
 
 
 class Generator(object):
 
+    # Schema of each supplied CSV file
+    FILE_SCHEMAS = {}
+    # Whether runs can read from and change the part inventory
+    USES_INVENTORY = False
+    # Files that, when supplied, are read instead of the inventory
+    INVENTORY_FILES = ()
+
     def __init__(self, *args, **kwargs):
         # Any files required to generate the file(s)
         self.supplied_files = kwargs.get('supplied_files', {})
+        # SHA-256 of the content of each supplied file, where known
+        self.file_hashes = kwargs.get('file_hashes', {})
+        # Cache of parsed files shared between runs
+        self.catalogues = kwargs.get('catalogues', None)
         # Starting well coordinates
         self.current_well = kwargs.get('starting_well', 'A1')
-        # Write files to given location. Default to return as StringIO.
-        self.write_to = kwargs.get('write_to', None)
+        # Write files to given store (or directory). Default to return as StringIO.
+        self.write_to = as_store(kwargs.get('write_to', None))
+        # All files written by the run are grouped together in the store
+        self.run = self.write_to.new_run() if self.write_to else None
+        # Part inventory (or the path of its database) to read parts from
+        self.inventory = kwargs.get('inventory', None)
+        if self.inventory is not None:
+            # Only imported when needed, to keep sqlite3 out of plain runs
+            from ..inventory import as_inventory
+            self.inventory = as_inventory(self.inventory)
+        # Whether the run adds its parts files to the inventory and takes the
+        # volumes it uses off once its files are made. Off unless asked for.
+        self.update_inventory = str(kwargs.get('update_inventory', '')).lower() in \
+            ('1', 'on', 'true', 'yes')
+        # Maximum number of rows to hold in memory when sorting worklists
+        self.sort_buffer = kwargs.get('sort_buffer', None)
         # Any other files that are required e.g. extra info
         self.other_files = {}
         # Master list of all substances in wells
         self.substances = {}
-        # List of plates needed for the process to take place
-        self.plates = []
+        # Plates needed for the process to take place
+        self.plates = PlateRegistry()
+        # Transfers between the plates, built when first needed
+        self._transfers = None
+        # Order to make the transfers in; 'none' for the fixed ordering or
+        # 'time' for the quickest order found for the instrument
+        self.optimise = kwargs.get('optimise', 'none')
+        if self.optimise not in OPTIMISE_CHOICES:
+            raise Exception('Transfer order {} not recognised'.format(self.optimise))
+        # Estimated run time before and after optimising, by equipment
+        self.estimates = {}
+        # Number of plate positions on the deck. If given, runs needing more
+        # plates than fit are split into loads with one worklist per load.
+        deck_positions = kwargs.get('deck_positions', None)
+        self.deck_positions = int(deck_positions) if deck_positions else None
+        # Keep wells together -> deck loads, made when first needed
+        self._loads = {}
         # Build the data needed to generate the file
-        self.setup(**kwargs)
+        with metrics.stage('setup'):
+            self.setup(**kwargs)
+        metrics.count('wells_filled', sum(p.filled_count() for p in self.plates.destinations))
 
     def setup(self, **kwargs):
         pass
 
-    def generate(self, equipment_format):
-        output_files = []
-        if equipment_format == 'mosquito':
-            f = MosquitoFileFormat(self.plates, self.substances,
-                                   ordering=self.ordering, write_to=self.write_to)
-        elif equipment_format == 'echo':
-            f = EchoFileFormat(self.plates, self.substances,
-                               ordering=self.ordering, write_to=self.write_to)
-        elif equipment_format == 'felix':
-            f = FelixFileFormat(self.plates, self.substances,
-                                ordering=self.ordering, write_to=self.write_to)
-        else:
-            raise Exception('File format not recognised')
+    def parsed_file(self, key, load):
+        """
+        Parse a supplied file with load, reusing the result of an earlier
+        run with the same file if there is a cache. The result is shared
+        between runs and must not be changed.
+        """
+        digest = self.file_hashes.get(key)
+        if self.catalogues is None or digest is None:
+            return load()
+        return self.catalogues.get(key, digest, load)
+
+    def record_run(self):
+        """
+        Record the effects of a run once its files have been generated, e.g.
+        the volumes it takes from the inventory
+        """
+        pass
+
+    @property
+    def transfers(self):
+        """
+        Table of every transfer in the run, built once and shared by every format
+        """
+        if self._transfers is None:
+            with metrics.stage('transfers'):
+                self._transfers = TransferTable.from_plates(self.plates)
+        return self._transfers
+
+    @property
+    def loads(self):
+        """
+        Deck loads the run is split into, or None if the deck size is not set
+        """
+        return self.format_loads(None)
+
+    def format_loads(self, equipment_format):
+        """
+        Deck loads for an equipment format. Formats that make each well as one
+        reaction have every transfer into a well in the same load, with a
+        load plan of their own.
+        """
+        if not self.deck_positions:
+            return None
+        keep = getattr(FORMATS.get(equipment_format), 'KEEP_WELLS_TOGETHER', False)
+        if keep not in self._loads:
+            self._loads[keep] = schedule_loads(self.transfers, range(1, self.deck_positions + 1),
+                                               keep_wells_together=keep)
+            plan = 'load_plan_{}'.format(equipment_format) if keep else 'load_plan'
+            self.other_files[plan] = load_plan(self._loads[keep], self.transfers)
+        return self._loads[keep]
+
+    def parse_locations(self, locations):
+        """
+        Get a list of locations from a comma separated list
+        """
+        pool = [l.strip() for l in str(locations).split(',') if l.strip()]
+        return [int(l) if l.isdigit() else l for l in pool]
 
+    def location_pool(self, locations, first):
+        """
+        Locations for plates allocated as they are needed; either a comma
+        separated list or every location counting up from first
+        """
+        if locations:
+            return self.parse_locations(locations)
+        return count(int(first))
+
+    def make_format(self, equipment_format, transfers=None, locations=None):
+        try:
+            FormatClass = FORMATS[equipment_format]
+        except KeyError:
+            raise Exception('File format not recognised')
+        if transfers is None:
+            transfers = self.transfers
+        ordering = self.ordering
+        if self.optimise == 'time':
+            with metrics.stage('optimise'):
+                # The rows the fixed ordering would write, to compare with
+                fixed = FormatClass(self.plates, self.substances, ordering=ordering,
+                                    transfers=transfers, locations=locations, write=False)
+                transfers, estimate = optimise_transfers(transfers, equipment_format,
+                                                         fixed.fixed_order())
+            # Loads are run one after another, so their times add up
+            total = self.estimates.setdefault(equipment_format, {'before': 0, 'after': 0})
+            for key in total:
+                total[key] = round(total[key] + estimate[key], 1)
+            # The optimised order replaces the fixed ordering
+            ordering = None
+        with metrics.stage('format_{}'.format(equipment_format)):
+            return FormatClass(self.plates, self.substances, ordering=ordering,
+                               write_to=self.write_to, sort_buffer=self.sort_buffer,
+                               transfers=transfers, run=self.run, locations=locations)
+
+    def make_outputs(self, equipment_format):
+        """
+        Make the files for an equipment format, with a set of files for each
+        deck load when the run is split into more than one
+        """
+        self.estimates.pop(equipment_format, None)
+        loads = self.format_loads(equipment_format)
+        if not loads or len(loads) == 1:
+            return self.make_format(equipment_format,
+                                    locations=loads[0].locations if loads else None).output
+        outputs = {}
+        for load in loads:
+            f = self.make_format(equipment_format, self.transfers.take(load.transfers),
+                                 load.locations)
+            for file_name, output in f.output.items():
+                outputs['{}_load_{}'.format(file_name, load.number)] = output
+        return outputs
+
+    def make_other_files(self):
         other_files = []
         # Loop through and build other files
         for file_name, output in self.other_files.items():
-            created_file = self.to_output_file(file_name, output, write_to=self.write_to)
+            with metrics.stage('other_files'):
+                created_file = self.to_output_file(file_name, output, write_to=self.write_to)
+            metrics.count('bytes_written', created_file[1].tell())
             if self.write_to:
+                created_file[1].close()
                 other_files.append((created_file[0], created_file[1].name))
             else:
                 other_files.append(created_file)
+        return other_files
+
+    def generate(self, equipment_format):
+        output = self.make_outputs(equipment_format)
+        other_files = self.make_other_files()
         # Make plate diagram data
-        plate_data = self.make_plate_layout_data()
+        with metrics.stage('layout'):
+            plate_data = self.make_plate_layout_data()
+        self.record_run()
 
-        return f.output, other_files, plate_data
+        return output, other_files, plate_data
 
-    def validate_csv_file(self, file_object, headers, file_name):
+    def generate_all(self):
         """
-        Check a file is a valid CSV file with correct headers
+        Generate the files for every supported equipment format from the one
+        transfer table. Output files are returned keyed by equipment format.
         """
-        csv_file = csv.DictReader(file_object)
-        if csv_file.fieldnames is None:
-            raise Exception('The {} file is invalid; No headers present.'.format(file_name))
-        csv_headers = set(csv_file.fieldnames)
-        required_headers = set(headers)
-        has_headers = required_headers <= csv_headers
-        missing_headers = required_headers - csv_headers
-        if not has_headers:
-            exception_text = 'The file {} is missing the following headers: {}' \
-                .format(file_name, ", ".join(missing_headers))
-            raise Exception(exception_text)
-        return csv_file
+        outputs = {equipment_format: self.make_outputs(equipment_format)
+                   for equipment_format in FORMATS}
+        other_files = self.make_other_files()
+        with metrics.stage('layout'):
+            plate_data = self.make_plate_layout_data()
+        self.record_run()
+
+        return outputs, other_files, plate_data
 
     def get_file(self, write_to):
         if write_to:
-            return NamedTemporaryFile(mode='w', dir=write_to, delete=False)
+            return write_to.create(self.run)
         return io.StringIO()
 
     def to_output_file(self, file_name, output, write_to=None):
@@ -84,17 +241,30 @@ class Generator(object):
         return (file_name, output_file)
 
     def make_plate_layout_data(self):
-        layout_data = {'plates': []}
-        layout_data['substances'] = [s for s in self.substances]
+        """
+        Layout of every plate for the plate diagrams, in a sparse columnar
+        form. Substances are listed once and referred to by index. Each plate
+        lists only its filled wells (as well indices, in row order) with the
+        contents of well i being entries offsets[i] to offsets[i + 1] of the
+        substance and amount lists.
+        """
+        substances = list(self.substances)
+        substance_ids = {name: i for i, name in enumerate(substances)}
+        layout_data = {'substances': substances, 'plates': []}
         for p in self.plates:
-            well_data = []
-            for coord, well in p.wells.items():
-                contents = [(a.amount, a.substance.name) for a in well.contents]
-                well_data.append({
-                    'coord': coord,
-                    'contents': contents,
-                    'total': well.total(),
-                })
+            store = p.store
+            # Interned substances of the plate -> index in the substance list
+            ids = []
+            for substance in store.substances:
+                if substance.name not in substance_ids:
+                    substance_ids[substance.name] = len(substances)
+                    substances.append(substance.name)
+                ids.append(substance_ids[substance.name])
+            entry_well = store._column(store.entry_well)
+            # Entries grouped by well, keeping the order they were added in
+            # (mergesort is the stable sort)
+            order = np.argsort(entry_well, kind='mergesort')
+            wells, counts = np.unique(entry_well[order], return_counts=True)
             layout_data['plates'].append({
                 'label': p.label,
                 'location': p.location,
@@ -102,16 +272,38 @@ class Generator(object):
                 'layout': p.layout,
                 'function': p.function,
                 'spacing': p.spacing,
-                'wells': well_data,
-            });
+                'wells': wells.tolist(),
+                'offsets': [0] + np.cumsum(counts).tolist(),
+                'substances': np.take(np.array(ids, dtype=np.int64),
+                                      store._column(store.entry_substance)[order]).tolist(),
+                'amounts': store.amounts(order),
+                'totals': store.well_totals_of(wells),
+            })
         return layout_data
 
 
+def layout_summary(layout_data):
+    """
+    The plate layout data without the contents of the wells, for showing the
+    plates before their layouts are fetched
+    """
+    plates = []
+    for plate in layout_data['plates']:
+        summary = {key: value for key, value in plate.items()
+                   if key not in ('wells', 'offsets', 'substances', 'amounts', 'totals')}
+        summary['filled'] = len(plate['wells'])
+        plates.append(summary)
+    return {'substances': layout_data['substances'], 'plates': plates}
+
+
 class Substance(object):
 
     def __init__(self, substance_name, group=None):
         self.name = substance_name
         self.group = None
+        # Where the substance can be drawn from; (plate, well index) of the
+        # first non destination well it was added to.
+        self.source = None
 
     def __str__(self):
         return self.name
@@ -125,27 +317,55 @@ class Amount(object):
 
 
 class Well(object):
+    """
+    View of a single well, backed by the storage of the plate it belongs to
+    """
 
     max_96 = 100000
     max_384 = 30000
 
-    def __init__(self, *args, **kwargs):
-        self.contents = []
+    def __init__(self, plate, index):
+        self.plate = plate
+        self.index = index
+
+    @property
+    def coord(self):
+        return self.plate.coords[self.index]
+
+    @property
+    def contents(self):
+        store = self.plate.store
+        return [Amount(store.amount(e), store.substance(e)) for e in store.entries(self.index)]
 
     def add(self, value, substance):
-        self.contents.append(Amount(value, substance))
+        self.plate.store.add(self.index, value, substance)
+        self.plate.occupancy.fill(self.index)
+        if substance.source is None and self.plate.function != 'destination':
+            substance.source = (self.plate, self.index)
 
     def total(self):
-        total = 0
-        for item in self.contents:
-            total += item.amount
-        return total
+        return self.plate.store.total(self.index)
 
 
-class Plate(object):
+class Wells(Mapping):
+    """
+    Read only mapping of (row letter, column) to wells, in row order
+    """
+
+    def __init__(self, plate):
+        self.plate = plate
 
-    plate_96 = (12, 8)
-    plate_384 = (24, 16)
+    def __getitem__(self, coord):
+        return Well(self.plate, self.plate.indices[coord])
+
+    def __iter__(self):
+        return iter(self.plate.coords)
+
+    def __len__(self):
+        return self.plate.well_count
+
+
+class Plate(object):
 
     def __init__(self, well_count, label, location, function='source', spacing=1,
                  placement='row', **kwargs):
@@ -161,77 +381,243 @@ class Plate(object):
         # Set placement - row or column
         self.placement = placement
 
-        self.wells = {}
-
-        if self.well_count == 96:
-            self.divisor = self.plate_96[0]
-            self.layout = self.plate_96
-        elif self.well_count == 384:
-            self.divisor = self.plate_384[0]
-            self.layout = self.plate_384
-
-        self._make_wells()
-
-    def _make_wells(self):
+        # Lookup tables between well indices, names and positions
+        self.well_index = WellIndex.get(self.well_count)
+        self.layout = (self.well_index.columns, self.well_index.rows)
+        self.coords = self.well_index.coords
+        self.indices = self.well_index.coord_index
+        # Contents of all wells
+        self.store = PlateStore(self.well_count)
+        # Filled wells, in placement order
+        self.occupancy = Occupancy(*self.well_index.placement_order(self.placement))
+        self.wells = Wells(self)
+
+    def index_of(self, location):
         """
-        Build a list of wells, set indexed by A1 notation
+        Index of a well from its name, e.g. "A1"
         """
-        w = 1
-        for i in range(0, self.well_count):
-            if i % self.divisor == 0:
-                letter = ascii_uppercase[int(i/self.divisor)]
-                w = 1
-            self.wells[(letter, w)] = Well()
-            w += 1
+        try:
+            return self.well_index.name_index[location]
+        except KeyError:
+            pass
+        # Allow zero padded columns, e.g. "A01"
+        label = location.rstrip('0123456789')
+        try:
+            return self.indices[(label, int(location[len(label):]))]
+        except (KeyError, ValueError):
+            raise Exception('Location chosen is out of range')
 
-    def _to_well_coord(self, coord_string):
-        return (coord_string[0], int(coord_string[1:]))
+    def well_at(self, index):
+        return Well(self, index)
 
     def get_well(self, location):
-        lookup = self._to_well_coord(location)
-        try:
-            well = self.wells[lookup]
-        except KeyError as e:
-            raise Exception('Location chosen is out of range')
-        return well
+        return Well(self, self.index_of(location))
 
     def get_next_well(self, previous_coordinates):
-        row = ascii_uppercase.index(previous_coordinates[0])
-        col = int(previous_coordinates[1:])
-        if self.placement == 'column':
-            # Select next well by column (going down the plate)
-            if (row != 0 and (row + self.spacing) % self.layout[1] == 0) or row > self.layout[1]:
-                next_row = ascii_uppercase[0]
-                next_col = col + self.spacing
-            else:
-                next_row = ascii_uppercase[row + self.spacing]
-                next_col = int(previous_coordinates[1:])
-        else:
-            # Select next well by row (across the plate)
-            if col % self.divisor == 0 or col > self.divisor:
-                next_row = ascii_uppercase[row + self.spacing]
-                next_col = self.spacing
-            else:
-                next_row = previous_coordinates[0]
-                next_col = col + self.spacing
-        lookup = (next_row, next_col)
-        try:
-            well = self.wells[lookup]
-        except KeyError as e:
+        """
+        Get the well after the given one for the plates placement and spacing.
+        Returns the well and its coordinates.
+        """
+        following = self.well_index.next_wells(self.placement, self.spacing)
+        index = following[self.index_of(previous_coordinates)]
+        if index is None:
             raise Exception('Location chosen is out of range')
-        return well, '{}{}'.format(next_row, next_col)
+        return Well(self, index), self.well_index.names[index]
 
     def to_well_coord(self, row, col):
-        string_row = ascii_uppercase[row + self.spacing]
-        return '{}{}'.format(string_row, col)
+        return '{}{}'.format(self.well_index.row_labels[row + self.spacing], col)
 
     def get_filled_wells(self):
-        filled = {}
-        for coord, well in self.wells.items():
-            if len(well.contents) > 0:
-                filled[coord] = well
-        return filled
+        """
+        Filled wells keyed by coordinate, in placement order
+        """
+        return {self.coords[index]: Well(self, index) for index in self.occupancy}
+
+    def filled_count(self):
+        return len(self.occupancy)
+
+    def get_first_free_well(self, start=None):
+        """
+        Get the first empty well in placement order, optionally from a given
+        coordinate onwards. Returns the well and its coordinates.
+        """
+        if start is not None:
+            start = self.index_of(start)
+        index = self.occupancy.first_free(start)
+        if index is None:
+            raise Exception('No free wells left on plate {}'.format(self.label))
+        return Well(self, index), self.well_index.names[index]
+
+    def totals(self):
+        """
+        Total amount in each well, indexed as self.coords
+        """
+        return self.store.totals()
+
+    def filled_mask(self):
+        """
+        Boolean array indexed as self.coords, true where the well is filled
+        """
+        return self.store.filled_mask()
+
+    def substance_usage(self):
+        return self.store.usage()
 
     def add_amount(self, location, value, substance):
         well = self.get_well(location)
-        well.contents.append(Amount(value, substance))
+        well.add(value, substance)
+
+
+class PlateRegistry(object):
+    """
+    The plates of a run, indexed by location, function and label.
+
+    Plates are created and fetched through the registry so that the indexes
+    are always up to date. Iterating over the registry gives the plates in
+    the order they were created. Locations are compared as strings, so a
+    plate at location 1 is found whether it is looked up as 1 or "1".
+    """
+
+    def __init__(self):
+        self._plates = []
+        self._by_location = {}
+        self._by_function = {}
+        self._by_label = {}
+
+    def __iter__(self):
+        return iter(self._plates)
+
+    def __len__(self):
+        return len(self._plates)
+
+    def __getitem__(self, index):
+        return self._plates[index]
+
+    def create(self, well_count, label, location, function='source', **kwargs):
+        """
+        Create a plate, raising an exception if its location is already taken
+        """
+        if str(location) in self._by_location:
+            raise Exception('Location {} already has the {} plate on it'
+                            .format(location, self._by_location[str(location)].label))
+        plate = Plate(well_count, label, location, function=function, **kwargs)
+        self._plates.append(plate)
+        self._by_location[str(location)] = plate
+        self._by_function.setdefault(function, []).append(plate)
+        self._by_label.setdefault(label, []).append(plate)
+        return plate
+
+    def get(self, location):
+        """
+        Get the plate at a location, or None if there isn't one
+        """
+        return self._by_location.get(str(location))
+
+    def get_or_create(self, well_count, label, location, function='source', **kwargs):
+        plate = self._by_location.get(str(location))
+        if plate is None:
+            plate = self.create(well_count, label, location, function=function, **kwargs)
+        return plate
+
+    def with_function(self, function):
+        return tuple(self._by_function.get(function, ()))
+
+    def labelled(self, label):
+        return tuple(self._by_label.get(label, ()))
+
+    @property
+    def sources(self):
+        return self.with_function('source')
+
+    @property
+    def destinations(self):
+        return self.with_function('destination')
+
+
+class PlateSeries(object):
+    """
+    Destination plates allocated as they are needed.
+
+    Wells are handed out in placement order from the starting well, carrying
+    on from the first well of a new plate when one is full. Each new plate is
+    given the next location from the pool that no other plate of the run is
+    using, and is created through the run's plate registry.
+    """
+
+    def __init__(self, plates, well_count, label, locations, placement='row', spacing=1,
+                 start='A1'):
+        # Registry of every plate of the run, new plates are created in it
+        self.run_plates = plates
+        self.well_count = well_count
+        self.label = label
+        self.locations = iter(locations)
+        self.placement = placement
+        self.spacing = spacing
+        self.start = start
+        # Plates of the series, in order
+        self.plates = []
+        self.current = None
+
+    def add_plate(self):
+        for location in self.locations:
+            if self.run_plates.get(location) is None:
+                break
+        else:
+            raise Exception('No locations left for another {} plate'.format(self.label))
+        label = self.label
+        if self.plates:
+            label = '{} {}'.format(self.label, len(self.plates) + 1)
+        plate = self.run_plates.create(self.well_count, label, location, function='destination',
+                                       spacing=self.spacing, placement=self.placement)
+        self.plates.append(plate)
+        return plate
+
+    def plate(self, number):
+        """
+        Get the plate numbered from 1, adding plates up to it if needed
+        """
+        while len(self.plates) < number:
+            self.add_plate()
+        return self.plates[number - 1]
+
+    def next_well(self):
+        """
+        Get the next well to fill, starting a new plate when the last is full.
+        Wells already filled are passed over.
+        """
+        if self.current is None:
+            plate = self.plate(1)
+            index = self.free_from(plate, plate.index_of(self.start))
+        else:
+            plate, index = self.current
+            index = self.free_from(plate,
+                                   plate.well_index.next_wells(self.placement, self.spacing)[index])
+        if index is None:
+            plate = self.add_plate()
+            index = plate.occupancy.first_free()
+        self.current = (plate, index)
+        return Well(plate, index)
+
+    def free_from(self, plate, index):
+        """
+        The first empty well of a plate from the given well on, or None
+        """
+        if index is None:
+            return None
+        if self.spacing == 1:
+            return plate.occupancy.first_free(index)
+        # Spaced wells are stepped through one at a time
+        following = plate.well_index.next_wells(self.placement, self.spacing)
+        while index is not None and index in plate.occupancy:
+            index = following[index]
+        return index
+
+    @property
+    def current_well(self):
+        """
+        Coordinates of the last well handed out
+        """
+        if self.current is None:
+            return self.start
+        plate, index = self.current
+        return plate.well_index.names[index]
@@ -1,3 +1,6 @@
+from ..loader import Schema
+
+
 # Headers required for input files
 CONSTRUCTS_CSV = ['Promoter', 'RBS', 'N-Tag', 'CDS',
                   'C-Tag', 'Terminator', 'Backbone', 'Master Mix']
@@ -5,3 +8,41 @@ CONSTRUCTS_CSV = ['Promoter', 'RBS', 'N-Tag', 'CDS',
 PARTS_CSV = ['Part Name', 'Concentration', 'Barcode', 'Volume']
 
 PARTS_LOCATION_CSV = ['location', 'barcode']
+
+VOLUMES_CSV = ['source plate', 'source well', 'sample ID', 'volume', 'destination well']
+
+SOURCES_CSV = ['plate', 'well', 'identifier']
+
+PLACEMENTS_CSV = ['plate', 'well', 'substance']
+
+# Types of the columns that are not text
+CONSTRUCTS_TYPES = {'Master Mix': float}
+
+PARTS_TYPES = {'Concentration': float, 'Volume': float}
+
+VOLUMES_TYPES = {'volume': float, 'destination plate': int}
+
+SOURCES_TYPES = {'plate': int}
+
+PLACEMENTS_TYPES = {'plate': int}
+
+# Schemas the input files are loaded with
+CONSTRUCTS_SCHEMA = Schema('Constructs', CONSTRUCTS_CSV, CONSTRUCTS_TYPES)
+
+# Candidate parts for each slot of a combinatorial library, read as text as
+# slots have different numbers of candidates
+DESIGN_SCHEMA = Schema('Design', CONSTRUCTS_CSV)
+
+# Volumes are echoed in the new volumes file as they were given
+PARTS_SCHEMA = Schema('Parts', PARTS_CSV, PARTS_TYPES, keep_text=['Volume'])
+
+PARTS_LOCATION_SCHEMA = Schema('Parts location', PARTS_LOCATION_CSV)
+
+# Pools go on the first pooling plate unless a destination plate is given
+VOLUMES_SCHEMA = Schema('Volumes', VOLUMES_CSV, VOLUMES_TYPES, optional=['destination plate'],
+                        defaults={'destination plate': 1})
+
+SOURCES_SCHEMA = Schema('Sources', SOURCES_CSV, SOURCES_TYPES)
+
+# Wells without a mix get the default mix, if there is one
+PLACEMENTS_SCHEMA = Schema('Placements', PLACEMENTS_CSV, PLACEMENTS_TYPES, optional=['mix'])
@@ -1,12 +1,17 @@
 from math import ceil
-from functools import reduce
-from operator import attrgetter
 
-from .generators import Generator, Plate, Amount, Substance
+from .generators import Generator, PlateSeries, Substance
+from .formatters import external_sort
+from .headers import VOLUMES_SCHEMA
+from ..loader import iter_rows
 
 
 class LibraryPoolingGenerator(Generator):
 
+    FILE_SCHEMAS = {
+        'volumes': VOLUMES_SCHEMA,
+    }
+
     def __init__(self, *args, **kwargs):
         self.ordering = [0,1]
         super().__init__(*args, **kwargs)
@@ -16,42 +21,44 @@ class LibraryPoolingGenerator(Generator):
 
         if not 'volumes' in self.supplied_files:
             raise Exception('Missing volumes file')
-        volumes_file = self.validate_csv_file(self.supplied_files['volumes'],
-                                              ('source plate', 'source well', 'sample ID',
-                                               'volume', 'destination well'),
-                                              'Volumes')
+        volumes_file = iter_rows(self.supplied_files['volumes'], self.FILE_SCHEMAS['volumes'])
 
-        pooling_plate = Plate(number_of_wells, 'Pools',
-                              kwargs.get('pooling_location', 3), function='destination')
-        self.plates.extend([pooling_plate])
+        # Pools plates are added as the destination plates of the file need them
+        pooling_locations = self.parse_locations(kwargs.get('pooling_locations') or
+                                                 kwargs.get('pooling_location', 3))
+        pooling_plates = PlateSeries(self.plates, number_of_wells, 'Pools', pooling_locations)
+        pooling_plates.plate(1)
 
-        # Sort file by destination as to group pooled samples into same
-        volumes_file = sorted(volumes_file, key=lambda x: x['destination well'])
+        # Sort file by destination as to group pooled samples into same. Large
+        # files are sorted in chunks so they are never held in memory at once.
+        volumes_file = external_sort(volumes_file,
+                                     lambda s: (s.get('destination plate', 1),
+                                                s['destination well']),
+                                     self.sort_buffer)
 
         for sample in volumes_file:
-            if reduce(lambda x, y: x + y, sample.values()) != '':
-                sample_name = sample['sample ID']
-
-                if int(sample['source plate']) == 3:
-                    raise Exception('Source plates cannot be placed in position 3')
-                try:
-                    samples_plate = next((x for x in self.plates
-                                          if x.location == sample['source plate']))
-                except:
-                    samples_plate = Plate(number_of_wells, 'Source '+sample['source plate'],
-                                          sample['source plate'], function='source')
-                    self.plates.extend([samples_plate])
-
-                try:
-                    sub = self.substances[sample_name]
-                except KeyError:
-                    sub = Substance(sample_name)
-                    self.substances[sample_name] = sub
-                    volume = ceil(float(sample['volume']) * 1000)
-                    if len(samples_plate.get_well(sample['source well']).contents) > 0:
-                        raise Exception('Well {} in plate {} contains multiple samples. Check file.'
-                                        .format(sample['source well'], sample['source plate']))
-                    samples_plate.add_amount(sample['source well'], volume, sub)
-
-                well = pooling_plate.get_well(sample['destination well'])
-                well.add(volume, sub)
+            sample_name = sample['sample ID']
+
+            if sample['source plate'] in map(str, pooling_locations):
+                raise Exception('Source plates cannot be placed in position {}'
+                                .format(sample['source plate']))
+            samples_plate = self.plates.get_or_create(number_of_wells,
+                                                      'Source ' + sample['source plate'],
+                                                      sample['source plate'], function='source')
+
+            try:
+                sub = self.substances[sample_name]
+            except KeyError:
+                sub = Substance(sample_name)
+                self.substances[sample_name] = sub
+                volume = ceil(sample['volume'] * 1000)
+                if len(samples_plate.get_well(sample['source well']).contents) > 0:
+                    raise Exception('Well {} in plate {} contains multiple samples. Check file.'
+                                    .format(sample['source well'], sample['source plate']))
+                samples_plate.add_amount(sample['source well'], volume, sub)
+
+            destination_plate = sample.get('destination plate', 1)
+            if destination_plate < 1:
+                raise Exception('Destination plate {} is not valid'.format(destination_plate))
+            well = pooling_plates.plate(destination_plate).get_well(sample['destination well'])
+            well.add(volume, sub)
@@ -1,18 +1,88 @@
 import csv
-from math import ceil
-from functools import reduce
-from operator import attrgetter
-from string import ascii_uppercase
 
-from .generators import Generator, Plate, Amount, Substance
+from .generators import Generator, PlateSeries, Substance
+from .headers import SOURCES_SCHEMA, PLACEMENTS_SCHEMA
+from .wells import WellIndex
+from ..loader import load_csv, iter_matrices, parse_cell
 
 
 class PlateMatrixGenerator(Generator):
 
+    FILE_SCHEMAS = {
+        'sources': SOURCES_SCHEMA,
+        'placements': PLACEMENTS_SCHEMA,
+    }
+
     def __init__(self, *args, **kwargs):
         self.ordering = [0,1]
         super().__init__(*args, **kwargs)
 
+    def read_matrix(self, well_index):
+        """
+        Placements (plate number, well index, cell) of the filled wells of a
+        stacked plate matrix file
+        """
+        try:
+            matrices = list(iter_matrices(csv.reader(self.supplied_files['matrix']),
+                                          well_index.rows))
+        except csv.Error:
+            raise Exception('Plate matrix is not a valid CSV file')
+        placements = []
+        for number, matrix in enumerate(matrices, 1):
+            for row, line in enumerate(matrix):
+                extra = line[well_index.columns:]
+                if any(c.strip() for c in extra):
+                    raise Exception('Plate {} of the matrix has more columns than a {} well plate'
+                                    .format(number, well_index.well_count))
+                for col, cell in enumerate(line[:well_index.columns]):
+                    # Empty wells are left empty
+                    if cell.strip():
+                        placements.append((number, well_index.at(row, col), parse_cell(cell)))
+        return placements
+
+    def read_placements(self, well_index):
+        """
+        Placements (plate number, well index, cell) from a long form file
+        with one row per filled well
+        """
+        table = load_csv(self.supplied_files['placements'], self.FILE_SCHEMAS['placements'])
+        mixes = table['mix'] if 'mix' in table else [''] * len(table)
+        placements = []
+        for number, well, name, mix, line in zip(table['plate'], table['well'], table['substance'],
+                                                 mixes, table.line_numbers):
+            if number < 1:
+                raise Exception('Line {}: plate numbers start at 1'.format(line))
+            # Allow zero padded columns, e.g. "A01"
+            well = well.strip().upper()
+            label = well.rstrip('0123456789')
+            try:
+                index = well_index.coord_index[(label, int(well[len(label):]))]
+            except (KeyError, ValueError):
+                raise Exception('Line {}: {} is not a well of a {} well plate'
+                                .format(line, well, well_index.well_count))
+            placements.append((number, index, (name.strip(), mix.strip())))
+        return placements
+
+    def resolve(self, cells, default_mix):
+        """
+        Look up the substance and mix of each different cell once, reporting
+        every missing source together
+        """
+        names = set(name for name, mix in cells)
+        mixes = set(mix or default_mix for name, mix in cells) - {None, ''}
+        missing = sorted(names - set(self.substances))
+        if missing:
+            raise Exception('Source location for {} not available!'.format(', '.join(missing)))
+        missing = sorted(mixes - set(self.substances))
+        if missing:
+            raise Exception('Mix location for {} not available!'.format(', '.join(missing)))
+        resolved = {}
+        for name, mix in cells:
+            mix = mix or default_mix
+            resolved[(name, mix)] = (self.substances[name],
+                                     self.substances[mix] if mix else None)
+        return resolved
+
     def setup(self, **kwargs):
         number_of_wells = int(kwargs.get('number_of_wells', 384))
         amount_substance = float(kwargs.get('amount_substance', 50))
@@ -21,70 +91,42 @@ class PlateMatrixGenerator(Generator):
 
         initial_mix_amount = 10000
 
-        if number_of_wells == 384:
-            rows = 16
-            cols = 24
-        else:
-            rows = 8
-            cols = 12
-
         if not 'sources' in self.supplied_files:
             raise Exception('Missing source locations file')
 
-        if not 'matrix' in self.supplied_files:
+        layouts = set(self.supplied_files) & set(['matrix', 'placements'])
+        if not layouts:
             raise Exception('Missing plate matrix file')
+        if len(layouts) > 1:
+            raise Exception('Supply either a plate matrix file or a placements file, not both')
 
-        sources_file = self.validate_csv_file(self.supplied_files['sources'],
-                                              ('plate', 'well', 'identifier'),
-                                              'Sources')
-        try:
-            matrix_file = csv.reader(self.supplied_files['matrix'])
-            matrix_list = list(matrix_file)
-        except:
-            raise Exception('Plate matrix is not a valid CSV file')
+        sources_file = load_csv(self.supplied_files['sources'], self.FILE_SCHEMAS['sources'])
 
         # Parse source plates
-        for source in sources_file:
+        for source in sources_file.rows():
             sub = Substance(source['identifier'])
             self.substances[source['identifier']] = sub
-            try:
-                source_plate = next((plate for plate in self.plates
-                                        if plate.location == int(source['plate'])))
-            except:
-                source_plate = Plate(number_of_wells, 'Sources',
-                                     int(source['plate']), function='source')
-                self.plates.extend([source_plate])
+            source_plate = self.plates.get_or_create(number_of_wells, 'Sources', source['plate'],
+                                                     function='source')
             source_plate.add_amount(source['well'], initial_mix_amount, sub)
 
-        destination_plate = Plate(number_of_wells, 'Destination',
-                                  int(kwargs.get('destination_location', 5)),
-                                  function='destination')
-        self.plates.extend([destination_plate])
-
-        for row in range(rows):
-            letter = ascii_uppercase[int(row)]
-            for col in range(1, cols + 1):
-                cell = matrix_list[row][col-1]
-                name, p, mix = cell.rstrip(')').partition('(')
-                name = name.strip()
-
-                try:
-                    sub = self.substances[name]
-                except KeyError as e:
-                    raise Exception('Source location for {} not available!'.format(name))
-
-                mix_sub = None
-                if mix:
-                    mix = mix.strip()
-                    try:
-                        mix_sub = self.substances[mix]
-                    except KeyError:
-                        raise Exception('Mix location for {} not available!'.format(mix))
-                else:
-                    if default_mix:
-                        mix_sub = self.substances[default_mix]
-
-                well = destination_plate.get_well('{}{}'.format(letter, col))
-                well.add(amount_substance, sub)
-                if mix_sub:
-                    well.add(amount_mix, mix_sub)
+        well_index = WellIndex.get(number_of_wells)
+        if 'matrix' in layouts:
+            placements = self.read_matrix(well_index)
+        else:
+            placements = self.read_placements(well_index)
+        resolved = self.resolve(set(cell for number, index, cell in placements), default_mix)
+
+        # One destination plate for each plate of the matrix, in free locations
+        # counting up from the destination location
+        destination_plates = PlateSeries(self.plates, number_of_wells, 'Destination',
+                                         self.location_pool(kwargs.get('destination_locations'),
+                                                            kwargs.get('destination_location', 5)))
+        destination_plates.plate(1)
+
+        for number, index, (name, mix) in placements:
+            sub, mix_sub = resolved[(name, mix or default_mix)]
+            well = destination_plates.plate(number).well_at(index)
+            well.add(amount_substance, sub)
+            if mix_sub:
+                well.add(amount_mix, mix_sub)
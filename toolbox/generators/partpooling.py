@@ -1,12 +1,24 @@
+import os
 from math import ceil
-from functools import reduce
 
-from .generators import Generator, Plate, Amount, Substance
-from .headers import CONSTRUCTS_CSV, PARTS_CSV, PARTS_LOCATION_CSV
+from .generators import Generator, Plate, PlateSeries, Amount, Substance
+from .headers import CONSTRUCTS_CSV, CONSTRUCTS_SCHEMA, DESIGN_SCHEMA, PARTS_SCHEMA, \
+    PARTS_LOCATION_SCHEMA
+from .combinatorial import CombinatorialDesign, read_exclusions
+from ..loader import load_csv
 
 
 class PartPoolingGenerator(Generator):
 
+    FILE_SCHEMAS = {
+        'constructs_file': CONSTRUCTS_SCHEMA,
+        'design_file': DESIGN_SCHEMA,
+        'parts_file': PARTS_SCHEMA,
+        'parts_location_file': PARTS_LOCATION_SCHEMA,
+    }
+    USES_INVENTORY = True
+    INVENTORY_FILES = ('parts_file', 'parts_location_file')
+
     def __init__(self, *args, **kwargs):
         self.ordering = [0,1]
         super().__init__(*args, **kwargs)
@@ -21,28 +33,62 @@ class PartPoolingGenerator(Generator):
         amount_of_part = float(kwargs.get('amount_of_part', '10'))
         amount_of_backbone = float(kwargs.get('amount_of_backbone', '40'))
         final_reaction_volume = float(kwargs.get('final_reaction_volume', 10))
-
-        required_files = set(['constructs_file', 'parts_file', 'parts_location_file'])
-        if not required_files == set(self.supplied_files.keys()):
+        # Combinatorial designs can be sampled rather than made in full
+        sample_size = int(kwargs['sample_size']) if kwargs.get('sample_size') else None
+        seed = int(kwargs['seed']) if kwargs.get('seed') else None
+
+        # Constructs are listed one per row, or as a combinatorial design.
+        # Parts come from the parts files, or the inventory if they are not
+        # supplied.
+        supplied = set(self.supplied_files.keys())
+        parts_files = set(self.INVENTORY_FILES)
+        construct_files = supplied & set(['constructs_file', 'design_file'])
+        if len(construct_files) != 1:
+            raise Exception('Missing required files')
+        if not parts_files <= supplied and (self.inventory is None or supplied & parts_files):
             raise Exception('Missing required files')
-        constructs_file = self.validate_csv_file(self.supplied_files['constructs_file'],
-                                                 CONSTRUCTS_CSV,
-                                                 'Constructs')
-        parts_file = self.validate_csv_file(self.supplied_files['parts_file'],
-                                            PARTS_CSV,
-                                            'Parts')
-        parts_location_file = self.validate_csv_file(self.supplied_files['parts_location_file'],
-                                                     PARTS_LOCATION_CSV,
-                                                     'Parts location')
-
-        part_locations = {l['barcode'].strip(): l['location'].strip() for l in parts_location_file}
-        part_data = {p['Part Name'].strip(): p for p in parts_file}
+        if 'exclusions_file' in supplied and 'design_file' not in supplied:
+            raise Exception('Exclusions can only be applied to a design file')
+        if 'design_file' in supplied:
+            design = CombinatorialDesign.from_table(
+                load_csv(self.supplied_files['design_file'], self.FILE_SCHEMAS['design_file']))
+            exclusions = []
+            if 'exclusions_file' in supplied:
+                exclusions = read_exclusions(self.supplied_files['exclusions_file'])
+            # Expanded one construct at a time as wells are filled
+            constructs = design.constructs(sample_size, seed, exclusions)
+            part_names = [part_name for location, candidates in design.slots
+                          if location != 'Master Mix' for part_name in candidates]
+        else:
+            constructs_file = load_csv(self.supplied_files['constructs_file'],
+                                       self.FILE_SCHEMAS['constructs_file'])
+            constructs = constructs_file.rows()
+            part_names = [part_name for location, column in constructs_file.columns.items()
+                          if location in CONSTRUCTS_CSV and location != 'Master Mix'
+                          for part_name in column]
+
+        # Parts files to add to the inventory once the run has succeeded
+        self.parts_import = None
+        if parts_files <= supplied:
+            # The same catalogue is usually uploaded run after run
+            parts_file, part_data = self.parsed_file('parts_file', self.load_parts)
+            parts_location_file, part_locations = self.parsed_file('parts_location_file',
+                                                                   self.load_part_locations)
+            self.parts_import = (parts_file, parts_location_file)
+        else:
+            # Only the parts the constructs use are read from the inventory
+            part_data = self.inventory.parts(name for name in part_names if name != '')
+            part_locations = {p['Barcode']: p['location'] for p in part_data.values()
+                              if p['location']}
+        # Volume of each part used by the run, by barcode
+        self.part_usage = {}
 
         # Register the output files
         self.other_files['new_volumes'] = {}
 
         # Create plate defs
-        reagents_plate = Plate(number_of_wells, 'Reagents', kwargs.get('reagents_location', 1))
+        reagents_plate = self.plates.create(number_of_wells, 'Reagents',
+                                            kwargs.get('reagents_location', 1))
         # Create substance types
         water = Substance('Water')
         master_mix = Substance('Master Mix')
@@ -52,74 +98,101 @@ class PartPoolingGenerator(Generator):
         reagents_plate.add_amount(kwargs.get('water_well', 'A1'), 0, water)
         reagents_plate.add_amount(kwargs.get('master_mix_well', 'B1'), 0, master_mix)
 
-        parts_plate = Plate(number_of_wells, 'Parts', kwargs.get('parts_location', 2))
-        constructs_plate = Plate(number_of_wells, 'Constructs',
-                                 kwargs.get('constructs_location', 3),
-                                 function='destination',
-                                 placement=kwargs.get('placement', 'row'))
-
-        self.plates.extend([reagents_plate, parts_plate, constructs_plate])
-
-        well = constructs_plate.get_well(self.current_well)
-        for construct in constructs_file:
-            # Ignore empty lines
-            if reduce(lambda x, y: x + y, construct.values()) != '':
-                for location, part_name in construct.items():
-                    if location in CONSTRUCTS_CSV and part_name != '' and location != 'Master Mix':
-                        try:
-                            part = part_data[part_name]
-                        except KeyError:
-                            raise Exception('{} was not supplied in the parts file' \
-                                    .format(part_name))
-                        try:
-                            part_coordinates = part_locations[part['Barcode']]
-                        except KeyError:
-                            raise Exception('{} was not supplied a location'.format(part_name))
-
-                        try:
-                            sub = self.substances[part_name]
-                        except KeyError:
-                            sub = Substance(part_name)
-                            self.substances[part_name] = sub
-                            volume = float(part['Volume']) * 1000
-                            parts_plate.add_amount(part_coordinates, volume, sub)
-
-                        if location == 'Backbone':
-                            part_volume = ceil(amount_of_backbone / float(part['Concentration']) \
-                                          * 1000)
-                        else:
-                            part_volume = ceil(amount_of_part / float(part['Concentration']) \
-                                          * 1000)
-
-                        if part_volume <= 25:
-                            raise Exception('Volume {} to small for construct {}' \
-                                            .format(part_volume, part_name))
-
-                        well.add(part_volume, sub)
-
-                        # Calculate new volumes file
-                        if part_name in self.other_files['new_volumes']:
-                            curr_volume = self.other_files['new_volumes'][part_name]['new_volume']
-                            new_volume = ((curr_volume * 1000) - part_volume) / 1000;
-                            self.other_files['new_volumes'][part_name]['new_volume'] = new_volume
-                        else:
-                            new_volume = ((float(part['Volume']) * 1000) - part_volume) / 1000;
-                            self.other_files['new_volumes'][part_name] = {
-                                'part_name': part_name,
-                                'barcode': part['Barcode'],
-                                'old_volume': part['Volume'],
-                                'new_volume': new_volume,
-                            }
-
-                    elif location == 'Master Mix':
-                        master_mix_volume = float(part_name) * 1000
-                        well.add(master_mix_volume, master_mix)
-                # Now add the water to make it up to final reaction volume
-                reaction_volume = well.total()
-                water_volume = (final_reaction_volume * 1000) - reaction_volume
-                if water_volume < 0:
-                    raise Exception('Final reaction volume is larger than specified')
-                well.add(water_volume, water)
-                # Increment to next well
-                well, coordinates = constructs_plate.get_next_well(self.current_well)
-                self.current_well = coordinates
+        parts_plate = self.plates.create(number_of_wells, 'Parts', kwargs.get('parts_location', 2))
+        # Further constructs plates are added when one is full
+        constructs_plates = PlateSeries(self.plates, number_of_wells, 'Constructs',
+                                        self.location_pool(kwargs.get('destination_locations'),
+                                                           kwargs.get('constructs_location', 3)),
+                                        placement=kwargs.get('placement', 'row'),
+                                        start=self.current_well)
+        constructs_plates.plate(1)
+
+        # Blank lines have already been dropped by the loader
+        for construct in constructs:
+            well = constructs_plates.next_well()
+            self.current_well = constructs_plates.current_well
+            for location, part_name in construct.items():
+                if location in CONSTRUCTS_CSV and part_name != '' and location != 'Master Mix':
+                    try:
+                        part = part_data[part_name]
+                    except KeyError:
+                        raise Exception('{} was not supplied in the parts file' \
+                                .format(part_name))
+                    try:
+                        part_coordinates = part_locations[part['Barcode']]
+                    except KeyError:
+                        raise Exception('{} was not supplied a location'.format(part_name))
+
+                    try:
+                        sub = self.substances[part_name]
+                    except KeyError:
+                        sub = Substance(part_name)
+                        self.substances[part_name] = sub
+                        volume = part['Volume'] * 1000
+                        parts_plate.add_amount(part_coordinates, volume, sub)
+
+                    if location == 'Backbone':
+                        part_volume = ceil(amount_of_backbone / part['Concentration'] * 1000)
+                    else:
+                        part_volume = ceil(amount_of_part / part['Concentration'] * 1000)
+
+                    if part_volume <= 25:
+                        raise Exception('Volume {} to small for construct {}' \
+                                        .format(part_volume, part_name))
+
+                    well.add(part_volume, sub)
+                    self.part_usage[part['Barcode']] = \
+                        self.part_usage.get(part['Barcode'], 0) + part_volume
+
+                    # Calculate new volumes file
+                    if part_name in self.other_files['new_volumes']:
+                        curr_volume = self.other_files['new_volumes'][part_name]['new_volume']
+                        new_volume = ((curr_volume * 1000) - part_volume) / 1000;
+                        self.other_files['new_volumes'][part_name]['new_volume'] = new_volume
+                    else:
+                        new_volume = ((part['Volume'] * 1000) - part_volume) / 1000;
+                        self.other_files['new_volumes'][part_name] = {
+                            'part_name': part_name,
+                            'barcode': part['Barcode'],
+                            'old_volume': part.get('Volume text', part['Volume']),
+                            'new_volume': new_volume,
+                        }
+
+                elif location == 'Master Mix':
+                    master_mix_volume = part_name * 1000
+                    well.add(master_mix_volume, master_mix)
+            # Now add the water to make it up to final reaction volume
+            reaction_volume = well.total()
+            water_volume = (final_reaction_volume * 1000) - reaction_volume
+            if water_volume < 0:
+                raise Exception('Final reaction volume is larger than specified')
+            well.add(water_volume, water)
+
+    def load_parts(self):
+        """
+        The parts file and its parts by name
+        """
+        parts_file = load_csv(self.supplied_files['parts_file'], self.FILE_SCHEMAS['parts_file'])
+        return parts_file, {p['Part Name']: p for p in parts_file.rows()}
+
+    def load_part_locations(self):
+        """
+        The parts location file and its locations by barcode
+        """
+        parts_location_file = load_csv(self.supplied_files['parts_location_file'],
+                                       self.FILE_SCHEMAS['parts_location_file'])
+        return parts_location_file, dict(zip(parts_location_file['barcode'],
+                                              parts_location_file['location']))
+
+    def record_run(self):
+        """
+        Add the parts files to the inventory and take the volumes used off,
+        once per run and only if the run asked to update the inventory
+        """
+        if self.inventory is None or not self.update_inventory:
+            return
+        used = {barcode: volume / 1000 for barcode, volume in self.part_usage.items()}
+        parts, locations = self.parts_import or (None, None)
+        self.inventory.record_run(self.run or os.urandom(16).hex(), used, parts, locations)
+        self.part_usage = {}
+        self.parts_import = None
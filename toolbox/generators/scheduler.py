@@ -0,0 +1,173 @@
+"""
+Splitting of runs that need more plates than the deck has positions.
+
+The transfers of a run are split into deck loads ("swap sets"), each of which
+fits on the deck. Destination plates stay on the deck for every load while the
+source plates are loaded in turn, so each source plate is placed only once and
+a source plate already on the deck carries over to the next load. If the
+destination plates do not all fit alongside a source plate the run is split by
+destination plate first. For instruments that make each well as one reaction,
+the transfers into a well are all kept in the same load.
+
+Plates keep their own location as the deck position where it is free,
+otherwise they are given the first free position.
+"""
+import numpy as np
+
+
+class DeckLoad(object):
+
+    def __init__(self, number, plates, locations, transfers):
+        self.number = number
+        # Plate ids in the transfer table of the plates on the deck
+        self.plates = plates
+        # Plate object -> deck position for this load
+        self.locations = locations
+        # Indices of the transfers made with this load
+        self.transfers = transfers
+
+
+def _position(plate):
+    try:
+        return int(plate.location)
+    except (TypeError, ValueError):
+        return None
+
+
+def _place(plate_ids, table, positions, previous):
+    """
+    Give each plate a deck position, keeping plates that were on the deck in
+    the previous load where they were
+    """
+    placed = {p: previous[p] for p in plate_ids if p in previous}
+    free = [p for p in positions if p not in placed.values()]
+    for plate_id in plate_ids:
+        if plate_id in placed:
+            continue
+        own = _position(table.plates[plate_id])
+        placed[plate_id] = own if own in free else free[0]
+        free.remove(placed[plate_id])
+    return placed
+
+
+def _source_chunks(source_plate, in_group, room, on_deck):
+    """
+    Source plates to load alongside a group of destinations, room at a time,
+    with the transfers each set of plates makes
+    """
+    sources = list(dict.fromkeys(source_plate[in_group & (source_plate >= 0)].tolist()))
+    # Plates left on the deck by the last load are used first
+    sources.sort(key=lambda s: s not in on_deck)
+    for start in range(0, max(len(sources), 1), room):
+        chunk = sources[start:start + room]
+        uses = in_group & np.isin(source_plate, chunk)
+        if start == 0:
+            # Transfers with no source are left to the formatters to report
+            uses |= in_group & (source_plate < 0)
+        yield chunk, uses
+
+
+def _well_chunks(table, in_group, room, on_deck):
+    """
+    As _source_chunks, but with every transfer into a destination well in the
+    same load, filling each load with the wells whose source plates fit
+    """
+    source_plate = table.column('source_plate')
+    destination_plate = table.column('destination_plate')
+    destination_well = table.column('destination_well')
+    indices = np.flatnonzero(in_group)
+    # Destination well -> (source plates, transfers into it)
+    wells = {}
+    for i, plate, well, source in zip(indices.tolist(), destination_plate[indices].tolist(),
+                                      destination_well[indices].tolist(),
+                                      source_plate[indices].tolist()):
+        sources, transfers = wells.setdefault((plate, well), (set(), []))
+        if source >= 0:
+            sources.add(source)
+        transfers.append(i)
+    for (plate, well), (sources, transfers) in wells.items():
+        if len(sources) > room:
+            plate = table.plates[plate]
+            raise Exception('Well {} of plate {} needs {} source plates, but only {} fit on the '
+                            'deck beside the destination plates'
+                            .format(plate.well_index.names[well], plate.label, len(sources), room))
+
+    def plates_key(item):
+        # Wells drawing on the same plates go together, those on the deck first
+        return sorted((s not in on_deck, s) for s in item[1][0])
+    chunk = []
+    members = []
+    for (plate, well), (sources, transfers) in sorted(wells.items(), key=plates_key):
+        new = [s for s in sorted(sources) if s not in chunk]
+        if members and len(chunk) + len(new) > room:
+            yield chunk, _mask(len(table), members)
+            chunk, members = [], []
+            new = sorted(sources)
+        chunk.extend(new)
+        members.extend(transfers)
+    yield chunk, _mask(len(table), members)
+
+
+def _mask(size, members):
+    mask = np.zeros(size, dtype=bool)
+    mask[members] = True
+    return mask
+
+
+def schedule_loads(table, positions, keep_wells_together=False):
+    """
+    Split the transfers of a table into deck loads for the given deck
+    positions. If keep_wells_together is set every transfer into a well is
+    made in the same load.
+    """
+    positions = list(positions)
+    if len(positions) < 2:
+        raise Exception('The deck needs at least two positions')
+    source_plate = table.column('source_plate')
+    destination_plate = table.column('destination_plate')
+    destinations = list(dict.fromkeys(destination_plate.tolist()))
+    if len(destinations) < len(positions):
+        groups = [destinations]
+    else:
+        groups = [[d] for d in destinations]
+
+    loads = []
+    on_deck = {}
+    for group in groups:
+        in_group = np.isin(destination_plate, group)
+        room = len(positions) - len(group)
+        if keep_wells_together:
+            chunks = _well_chunks(table, in_group, room, on_deck)
+        else:
+            chunks = _source_chunks(source_plate, in_group, room, on_deck)
+        for chunk, uses in chunks:
+            plate_ids = group + chunk
+            on_deck = _place(plate_ids, table, positions, on_deck)
+            loads.append(DeckLoad(len(loads) + 1, plate_ids,
+                                  {table.plates[p]: on_deck[p] for p in plate_ids},
+                                  np.flatnonzero(uses)))
+    return loads
+
+
+def load_plan(loads, table):
+    """
+    Rows of the load plan file, saying which plate goes in each deck position
+    for each load and whether it is already there
+    """
+    plan = {}
+    previous = {}
+    for load in loads:
+        current = {}
+        for plate_id in load.plates:
+            plate = table.plates[plate_id]
+            position = load.locations[plate]
+            current[position] = plate_id
+            plan[(load.number, position)] = {
+                'load': load.number,
+                'position': position,
+                'plate': plate.label,
+                'plate location': plate.location,
+                'action': 'keep' if previous.get(position) == plate_id else 'place',
+            }
+        previous = current
+    return {key: plan[key] for key in sorted(plan)}
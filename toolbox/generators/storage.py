@@ -0,0 +1,188 @@
+from array import array
+from bisect import insort
+
+import numpy as np
+
+
+class PlateStore(object):
+    """
+    Compact storage for everything added to a plate.
+
+    Each addition is recorded as one entry in a set of parallel typed arrays
+    (well index, substance index, amount) rather than as an object, with the
+    substances interned to integer indices. Per well running totals are kept
+    so that a single well can be queried cheaply while filling, and whole
+    plate totals, filled well masks, substance usage and amounts are read out
+    in vectorised form.
+    """
+
+    def __init__(self, well_count):
+        self.well_count = well_count
+        # Interned substances; index -> substance and substance -> index
+        self.substances = []
+        self._substance_ids = {}
+        # One entry per addition
+        self.entry_well = array('l')
+        self.entry_substance = array('l')
+        self.entry_amount = array('d')
+        # Amounts are stored as doubles, remember which ones were integers so
+        # that they are handed back exactly as they were given.
+        self.entry_is_int = array('b')
+        # Entry indices for each well in order of addition
+        self.well_entries = {}
+        self.well_totals = array('d', bytes(8 * well_count))
+        self.well_is_float = array('b', bytes(well_count))
+
+    def __len__(self):
+        return len(self.entry_amount)
+
+    def intern(self, substance):
+        """
+        Return the index of a substance, registering it if it is new
+        """
+        try:
+            return self._substance_ids[substance]
+        except KeyError:
+            index = len(self.substances)
+            self.substances.append(substance)
+            self._substance_ids[substance] = index
+            return index
+
+    def add(self, well_index, value, substance):
+        is_int = isinstance(value, int)
+        entry = len(self.entry_amount)
+        self.entry_well.append(well_index)
+        self.entry_substance.append(self.intern(substance))
+        self.entry_amount.append(value)
+        self.entry_is_int.append(is_int)
+        try:
+            self.well_entries[well_index].append(entry)
+        except KeyError:
+            self.well_entries[well_index] = [entry]
+        self.well_totals[well_index] += value
+        if not is_int:
+            self.well_is_float[well_index] = 1
+        return entry
+
+    def amount(self, entry):
+        value = self.entry_amount[entry]
+        if self.entry_is_int[entry]:
+            return int(value)
+        return value
+
+    def substance(self, entry):
+        return self.substances[self.entry_substance[entry]]
+
+    def entries(self, well_index):
+        return self.well_entries.get(well_index, [])
+
+    def total(self, well_index):
+        value = self.well_totals[well_index]
+        if self.well_is_float[well_index]:
+            return value
+        return int(value)
+
+    def _column(self, column):
+        if len(column) == 0:
+            return np.zeros(0, dtype=column.typecode)
+        return np.frombuffer(column, dtype=column.typecode)
+
+    def totals(self):
+        """
+        Total amount in every well as an array indexed by well
+        """
+        return np.bincount(self._column(self.entry_well),
+                           weights=self._column(self.entry_amount),
+                           minlength=self.well_count)
+
+    def filled_mask(self):
+        """
+        Boolean array indexed by well, true where the well has any contents
+        """
+        return np.bincount(self._column(self.entry_well), minlength=self.well_count) > 0
+
+    def usage(self):
+        """
+        Total amount of each substance used across the plate
+        """
+        used = np.bincount(self._column(self.entry_substance),
+                           weights=self._column(self.entry_amount),
+                           minlength=len(self.substances))
+        return {substance: used[i] for i, substance in enumerate(self.substances)}
+
+    def matrix(self):
+        """
+        Dense (wells x substances) matrix of amounts
+        """
+        volumes = np.zeros((self.well_count, len(self.substances)))
+        np.add.at(volumes, (self._column(self.entry_well), self._column(self.entry_substance)),
+                  self._column(self.entry_amount))
+        return volumes
+
+    def amounts(self, entries):
+        """
+        Amounts of an array of entries as a list, as they were given
+        """
+        return _as_given(self._column(self.entry_amount)[entries],
+                         self._column(self.entry_is_int)[entries])
+
+    def well_totals_of(self, wells):
+        """
+        Totals of an array of wells as a list, as ints where only ints were
+        added
+        """
+        return _as_given(self.totals()[wells], self._column(self.well_is_float)[wells] == 0)
+
+
+def _as_given(values, is_int):
+    values = values.tolist()
+    for i in np.flatnonzero(is_int).tolist():
+        values[i] = int(values[i])
+    return values
+
+
+class Occupancy(object):
+    """
+    Track which wells of a plate are filled.
+
+    Wells are held in placement order (row or column) as a bitmap, together
+    with a sorted list of the filled positions so that iterating and counting
+    the filled wells only costs as much as the number of filled wells.
+    """
+
+    def __init__(self, order, positions):
+        # Well index at each position in placement order, and the reverse
+        self.order = order
+        self.positions = positions
+        self.bitmap = bytearray(len(order))
+        self.filled = []
+
+    def __len__(self):
+        return len(self.filled)
+
+    def __iter__(self):
+        order = self.order
+        return (order[position] for position in self.filled)
+
+    def __contains__(self, index):
+        return self.bitmap[self.positions[index]] == 1
+
+    def fill(self, index):
+        position = self.positions[index]
+        if not self.bitmap[position]:
+            self.bitmap[position] = 1
+            # Wells are usually filled in placement order, making this an append
+            if not self.filled or position > self.filled[-1]:
+                self.filled.append(position)
+            else:
+                insort(self.filled, position)
+
+    def first_free(self, start=None):
+        """
+        Index of the first empty well in placement order, optionally starting
+        from the given well. None if the rest of the plate is full.
+        """
+        position = self.bitmap.find(0, 0 if start is None else self.positions[start])
+        if position == -1:
+            return None
+        return self.order[position]
@@ -0,0 +1,131 @@
+from array import array
+
+import numpy as np
+
+
+class TransferTable(object):
+    """
+    Every transfer needed for a run, stored column wise in typed arrays.
+
+    The table is built once from the plates of a run and shared by all of the
+    formatters, so the plates only need walking once however many instrument
+    files are made from it. Plates and substances are referred to by their
+    index in self.plates and self.substances; a source plate of -1 means the
+    substance has no source location.
+    """
+
+    COLUMNS = ('source_plate', 'source_well', 'destination_plate', 'destination_well',
+               'substance', 'volume')
+
+    def __init__(self):
+        self.plates = []
+        self.substances = []
+        self._plate_ids = {}
+        self._substance_ids = {}
+        self.source_plate = array('l')
+        self.source_well = array('l')
+        self.destination_plate = array('l')
+        self.destination_well = array('l')
+        self.substance = array('l')
+        self.volume = array('d')
+        # Volumes given as integers are handed back as integers
+        self.volume_is_int = array('b')
+
+    @classmethod
+    def from_plates(cls, plates):
+        """
+        Build the table from the contents of the destination plates of a
+        plate registry
+        """
+        table = cls()
+        for plate in plates:
+            table.plate_id(plate)
+        for plate in plates.destinations:
+            destination = table.plate_id(plate)
+            store = plate.store
+            for well in plate.occupancy:
+                for entry in store.entries(well):
+                    table.append(store.substance(entry), destination, well,
+                                 store.entry_amount[entry], store.entry_is_int[entry])
+        return table
+
+    def __len__(self):
+        return len(self.volume)
+
+    def plate_id(self, plate):
+        try:
+            return self._plate_ids[id(plate)]
+        except KeyError:
+            index = len(self.plates)
+            self.plates.append(plate)
+            self._plate_ids[id(plate)] = index
+            return index
+
+    def substance_id(self, substance):
+        try:
+            return self._substance_ids[substance]
+        except KeyError:
+            index = len(self.substances)
+            self.substances.append(substance)
+            self._substance_ids[substance] = index
+            return index
+
+    def append(self, substance, destination_plate, destination_well, volume, is_int):
+        if substance.source is None:
+            source_plate, source_well = -1, -1
+        else:
+            source_plate = self.plate_id(substance.source[0])
+            source_well = substance.source[1]
+        self.source_plate.append(source_plate)
+        self.source_well.append(source_well)
+        self.destination_plate.append(destination_plate)
+        self.destination_well.append(destination_well)
+        self.substance.append(self.substance_id(substance))
+        self.volume.append(volume)
+        self.volume_is_int.append(is_int)
+
+    def take(self, order):
+        """
+        Copy of the table with the transfers in the given order
+        """
+        table = TransferTable()
+        table.plates = self.plates
+        table.substances = self.substances
+        table._plate_ids = self._plate_ids
+        table._substance_ids = self._substance_ids
+        for name in self.COLUMNS + ('volume_is_int',):
+            getattr(table, name).frombytes(self.column(name)[order].tobytes())
+        return table
+
+    def get_volume(self, i):
+        if self.volume_is_int[i]:
+            return int(self.volume[i])
+        return self.volume[i]
+
+    def __iter__(self):
+        """
+        Iterate over the transfers as (source plate, source well, destination
+        plate, destination well, substance, volume), with the plates and
+        substance as objects and the wells as indices. Source plate and well
+        are None when the substance has no source.
+        """
+        plates = self.plates
+        substances = self.substances
+        for i in range(len(self.volume)):
+            source_id = self.source_plate[i]
+            if source_id == -1:
+                source, source_well = None, None
+            else:
+                source, source_well = plates[source_id], self.source_well[i]
+            yield (source, source_well,
+                   plates[self.destination_plate[i]], self.destination_well[i],
+                   substances[self.substance[i]], self.get_volume(i))
+
+    def column(self, name):
+        """
+        NumPy view of one of the columns
+        """
+        values = getattr(self, name)
+        if len(values) == 0:
+            return np.zeros(0, dtype=values.typecode)
+        return np.frombuffer(values, dtype=values.typecode)
@@ -0,0 +1,134 @@
+"""
+Integer indexing of the wells of a plate.
+
+Wells are numbered across each row in turn from 0 (A1). The lookup tables
+between well indices, names ("A1"), (row letter, column) coordinates and
+(row, column) positions, and the next well for each placement and spacing,
+are built once for each plate format and shared by every plate of that size.
+Rows after Z are lettered AA, AB and so on, as on 1536 well plates.
+"""
+
+
+# Number of wells -> (columns, rows)
+PLATE_FORMATS = {
+    96: (12, 8),
+    384: (24, 16),
+    1536: (48, 32),
+}
+
+
+def row_label(row):
+    """
+    Letter(s) of a row, counting from 0 (A) and carrying on from Z to AA
+    """
+    label = ''
+    row += 1
+    while row:
+        row, remainder = divmod(row - 1, 26)
+        label = chr(65 + remainder) + label
+    return label
+
+
+class WellIndex(object):
+
+    _indexes = {}
+
+    @classmethod
+    def get(cls, well_count):
+        """
+        Get the shared index for a plate format
+        """
+        try:
+            return cls._indexes[well_count]
+        except KeyError:
+            pass
+        if well_count not in PLATE_FORMATS:
+            raise Exception('Plates with {} wells are not supported'.format(well_count))
+        index = cls(well_count)
+        cls._indexes[well_count] = index
+        return index
+
+    def __init__(self, well_count):
+        self.well_count = well_count
+        self.columns, self.rows = PLATE_FORMATS[well_count]
+        self.row_labels = tuple(row_label(r) for r in range(self.rows))
+        # Row letter(s) -> row, counting from 0
+        self.row_numbers = {label: r for r, label in enumerate(self.row_labels)}
+        # Row and column of each well, counting from 0
+        self.row_of = tuple(i // self.columns for i in range(well_count))
+        self.column_of = tuple(i % self.columns for i in range(well_count))
+        # (row letter, column) and "A1" style name of each well, and back
+        self.coords = tuple((self.row_labels[r], c + 1)
+                            for r, c in zip(self.row_of, self.column_of))
+        self.names = tuple('{}{}'.format(*coord) for coord in self.coords)
+        self.coord_index = {coord: i for i, coord in enumerate(self.coords)}
+        self.name_index = {name: i for i, name in enumerate(self.names)}
+        self._orders = {}
+        self._next = {}
+
+    def __len__(self):
+        return self.well_count
+
+    def index(self, name):
+        """
+        Index of a well from its name, raising KeyError if there is no such well
+        """
+        return self.name_index[name]
+
+    def at(self, row, column):
+        """
+        Index of the well at a row and column, counting from 0
+        """
+        if not (0 <= row < self.rows and 0 <= column < self.columns):
+            raise KeyError((row, column))
+        return row * self.columns + column
+
+    def placement_order(self, placement):
+        """
+        Well indices in the order wells are filled for a placement, and the
+        position of each well in that order
+        """
+        try:
+            return self._orders[placement]
+        except KeyError:
+            pass
+        if placement == 'column':
+            order = tuple(row * self.columns + col for col in range(self.columns)
+                          for row in range(self.rows))
+        else:
+            order = tuple(range(self.well_count))
+        tables = (order, tuple(sorted(range(self.well_count), key=order.__getitem__)))
+        self._orders[placement] = tables
+        return tables
+
+    def next_wells(self, placement, spacing):
+        """
+        The well after each well for a placement and spacing, or None where
+        the next well would be off the plate
+        """
+        key = (placement, spacing)
+        try:
+            return self._next[key]
+        except KeyError:
+            pass
+        following = []
+        for row, col in zip(self.row_of, self.column_of):
+            col += 1
+            if placement == 'column':
+                # Down the plate, moving to the top of the next column at the bottom
+                if (row != 0 and (row + spacing) % self.rows == 0) or row > self.rows:
+                    next_row, next_col = 0, col + spacing
+                else:
+                    next_row, next_col = row + spacing, col
+            else:
+                # Across the plate, moving to the start of the next row at the end
+                if col % self.columns == 0 or col > self.columns:
+                    next_row, next_col = row + spacing, spacing
+                else:
+                    next_row, next_col = row, col + spacing
+            try:
+                following.append(self.at(next_row, next_col - 1))
+            except KeyError:
+                following.append(None)
+        self._next[key] = tuple(following)
+        return self._next[key]
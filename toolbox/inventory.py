@@ -0,0 +1,198 @@
+"""
+Part inventory kept in a SQLite database.
+
+The inventory holds the concentration, volume and location of every part,
+indexed by barcode and by part name, so that generators can look parts up
+directly rather than the whole parts catalogue being uploaded and parsed for
+every run.
+
+Runs only change the inventory when asked to. Once such a run has made its
+files, its parts files are merged in and the volumes it used are taken off in
+a single transaction, and every change of volume is recorded in a ledger
+against the run that made it. Importing a parts file adds new parts but never
+resets the volume of a part already held.
+
+The inventory has a version number that goes up with every change which,
+with an id drawn when the database is made, stamps the stock runs are made
+against, so that cached runs made against different stock are told apart
+without the parts being read.
+"""
+import time
+import uuid
+import sqlite3
+from contextlib import closing
+
+
+# Most parameters SQLite accepts in one statement, with some to spare
+BATCH_SIZE = 500
+
+
+def as_inventory(inventory):
+    """
+    Get an inventory from an inventory, the path of its database or None
+    """
+    if inventory is None or isinstance(inventory, PartInventory):
+        return inventory
+    return PartInventory(inventory)
+
+
+class PartInventory(object):
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as db:
+            db.execute('CREATE TABLE IF NOT EXISTS parts ('
+                       'barcode TEXT PRIMARY KEY, part_name TEXT NOT NULL, '
+                       'concentration REAL, volume REAL NOT NULL, location TEXT, '
+                       'updated REAL NOT NULL)')
+            db.execute('CREATE UNIQUE INDEX IF NOT EXISTS parts_name ON parts (part_name)')
+            db.execute('CREATE TABLE IF NOT EXISTS ledger ('
+                       'id INTEGER PRIMARY KEY, run TEXT, barcode TEXT NOT NULL, '
+                       'change REAL NOT NULL, volume REAL NOT NULL, created REAL NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS ledger_barcode ON ledger (barcode, id)')
+            db.execute('CREATE TABLE IF NOT EXISTS version ('
+                       'id TEXT NOT NULL, number INTEGER NOT NULL)')
+            db.execute('INSERT INTO version (id, number) SELECT ?, 0 '
+                       'WHERE NOT EXISTS (SELECT 1 FROM version)', (uuid.uuid4().hex,))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _transaction(self, db, *steps):
+        """
+        Run steps, each called with the database, in one transaction, bumping
+        the version
+        """
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            for step in steps:
+                step(db)
+            db.execute('UPDATE version SET number = number + 1')
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+    def version(self):
+        with closing(self._connect()) as db:
+            return db.execute('SELECT number FROM version').fetchone()[0]
+
+    def stamp(self):
+        """
+        Id of the database and its version, which changes with every change
+        to the inventory and is read without reading the parts
+        """
+        with closing(self._connect()) as db:
+            return '{}-{}'.format(*db.execute('SELECT id, number FROM version').fetchone())
+
+    def __len__(self):
+        with closing(self._connect()) as db:
+            return db.execute('SELECT COUNT(*) FROM parts').fetchone()[0]
+
+    def import_parts(self, parts, locations=None):
+        """
+        Add the parts of a loaded parts file that are not in the inventory,
+        and update the name and concentration of those that are, with their
+        locations from a loaded parts location file. The volume of a part
+        already in the inventory is never changed by an import, as it has
+        been kept up to date by the runs since. Parts keep their location if
+        the locations file does not give one.
+        """
+        with closing(self._connect()) as db:
+            self._transaction(db, self._importer(parts, locations))
+
+    def _importer(self, parts, locations):
+        now = time.time()
+        rows = [(barcode, name, float(concentration), float(volume), now)
+                for name, barcode, concentration, volume
+                in zip(parts['Part Name'], parts['Barcode'], parts['Concentration'],
+                       parts['Volume'])]
+
+        def import_rows(db):
+            try:
+                db.executemany('INSERT INTO parts (barcode, part_name, concentration, volume, '
+                               'updated) VALUES (?, ?, ?, ?, ?) ON CONFLICT (barcode) DO UPDATE '
+                               'SET part_name = excluded.part_name, '
+                               'concentration = excluded.concentration, '
+                               'updated = excluded.updated', rows)
+            except sqlite3.IntegrityError:
+                raise Exception('A part name in the parts file is already used by a part '
+                                'with another barcode')
+            if locations is not None:
+                db.executemany('UPDATE parts SET location = ?, updated = ? WHERE barcode = ?',
+                               [(location, now, barcode) for location, barcode
+                                in zip(locations['location'], locations['barcode'])])
+        return import_rows
+
+    def parts(self, names):
+        """
+        Look up parts by name, returning a dict of part name to a dict with
+        the columns of a parts file and the part's location. Names that are
+        not in the inventory are left out.
+        """
+        names = list(set(names))
+        found = {}
+        with closing(self._connect()) as db:
+            for start in range(0, len(names), BATCH_SIZE):
+                batch = names[start:start + BATCH_SIZE]
+                rows = db.execute('SELECT part_name, barcode, concentration, volume, location '
+                                  'FROM parts WHERE part_name IN ({})'
+                                  .format(', '.join('?' * len(batch))), batch)
+                for name, barcode, concentration, volume, location in rows:
+                    found[name] = {
+                        'Part Name': name,
+                        'Barcode': barcode,
+                        'Concentration': concentration,
+                        'Volume': volume,
+                        'location': location,
+                    }
+        return found
+
+    def deduct(self, run, used):
+        """
+        Take the volume used of each part (a dict of barcode to volume) off
+        the inventory in one transaction, recording the changes in the ledger
+        """
+        with closing(self._connect()) as db:
+            self._transaction(db, self._deducter(run, used))
+
+    def record_run(self, run, used, parts=None, locations=None):
+        """
+        Import the parts files of a finished run, if given, and take the
+        volumes it used off, all in one transaction
+        """
+        steps = [self._deducter(run, used)]
+        if parts is not None:
+            steps.insert(0, self._importer(parts, locations))
+        with closing(self._connect()) as db:
+            self._transaction(db, *steps)
+
+    def _deducter(self, run, used):
+        now = time.time()
+        used = [(barcode, float(volume)) for barcode, volume in used.items()]
+
+        def deduct_rows(db):
+            volumes = {}
+            for start in range(0, len(used), BATCH_SIZE):
+                batch = [barcode for barcode, volume in used[start:start + BATCH_SIZE]]
+                volumes.update(db.execute('SELECT barcode, volume FROM parts '
+                                          'WHERE barcode IN ({})'
+                                          .format(', '.join('?' * len(batch))), batch))
+            missing = [barcode for barcode, volume in used if barcode not in volumes]
+            if missing:
+                raise Exception('Parts {} are not in the inventory'.format(', '.join(missing)))
+            db.executemany('UPDATE parts SET volume = volume - ?, updated = ? WHERE barcode = ?',
+                           [(volume, now, barcode) for barcode, volume in used])
+            db.executemany('INSERT INTO ledger (run, barcode, change, volume, created) '
+                           'VALUES (?, ?, ?, ?, ?)',
+                           [(run, barcode, -volume, volumes[barcode] - volume, now)
+                            for barcode, volume in used])
+        return deduct_rows
+
+    def history(self, barcode):
+        """
+        Ledger entries of a part as (run, change, volume after, time), oldest first
+        """
+        with closing(self._connect()) as db:
+            return db.execute('SELECT run, change, volume, created FROM ledger '
+                              'WHERE barcode = ? ORDER BY id', (barcode,)).fetchall()
@@ -0,0 +1,301 @@
+"""
+Background job queues for running worklist generation outside of requests.
+
+A job is submitted with a JSON serialisable payload and gets an id straight
+away. A fixed number of worker threads take jobs off the queue and pass the
+payload to the runner; the result (or the error) is then stored against the
+job. The number of jobs waiting is capped, submitting to a full queue raises
+QueueFull so that callers can turn clients away rather than pile up work.
+
+If the queue is given a ResultCache, a job whose payload matches one that has
+already been run is finished straight away with the cached result.
+
+MemoryJobQueue keeps everything in process. SQLiteJobQueue keeps the jobs in
+a SQLite database so that they can be shared between server processes and
+survive a restart.
+"""
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+import traceback
+from collections import OrderedDict
+from contextlib import closing
+
+from toolbox.registry import VALID_WORKLIST_FUNCTIONS, load_class
+from toolbox.cache import make_key
+from toolbox.metrics import record
+from toolbox.uploads import discard_uploads
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFull(Exception):
+    pass
+
+
+def run_worklist(payload, write_to=None, inventory=None, catalogues=None):
+    """
+    Run a worklist generator from a job payload of the generator function
+    name, the form data and the paths of the spooled uploads, writing the
+    output files to the given store and reading parts from the given
+    inventory. Parsed files are shared through the catalogues cache, if
+    given. The uploads are read as streams and removed afterwards. The run is
+    profiled if the payload asks for it. Returns the results as shown on the
+    worklist page.
+    """
+    GeneratorClass = load_class(VALID_WORKLIST_FUNCTIONS[payload['function']])
+    data = dict(payload['form'])
+    data['supplied_files'] = {}
+    try:
+        with record(payload['function'], profile=payload.get('profile', False)) as recorder:
+            for key, path in payload['files'].items():
+                data['supplied_files'][key] = open(path, encoding='utf-8', newline='')
+            m = GeneratorClass(**data, write_to=write_to, inventory=inventory,
+                               file_hashes=payload.get('file_hashes', {}), catalogues=catalogues)
+            generated_data = m.generate(data.get('equipment', 'mosquito'))
+    finally:
+        for f in data['supplied_files'].values():
+            f.close()
+        discard_uploads(payload['files'].values())
+    result = {
+        'output_files': generated_data[0],
+        'plates': generated_data[2],
+        'other_files': dict(generated_data[1]),
+        'estimates': m.estimates,
+        'timings': recorder.as_dict(),
+    }
+    if recorder.profile:
+        result['profile'] = recorder.profile
+    return result
+
+
+class JobQueue(object):
+
+    def __init__(self, runner=run_worklist, workers=2, max_queue=50, cache=None):
+        self.runner = runner
+        self.workers = workers
+        self.max_queue = max_queue
+        self.cache = cache
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        # Workers are started on first use so that they are created in the
+        # process that serves requests rather than one that forks later
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, daemon=True,
+                                          name='job-worker-{}'.format(i))
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job_id, payload = self._claim()
+            try:
+                result = self.runner(payload)
+            except Exception as e:
+                traceback.print_exc()
+                status, result, error = FAILED, None, str(e)
+            else:
+                status, error = DONE, None
+                if self.cache is not None:
+                    self.cache.put(payload['cache_key'], result)
+            # Uploaded files are not needed once the job has run
+            payload = {key: value for key, value in payload.items() if key != 'files'}
+            self._finish(job_id, status, payload, result=result, error=error)
+
+    def submit(self, payload):
+        """
+        Queue a job, returning its id. Raises QueueFull if too many jobs are
+        already waiting.
+        """
+        job_id = uuid.uuid4().hex
+        if self.cache is not None:
+            payload['cache_key'] = make_key(payload['function'], payload['form'],
+                                            payload['file_hashes'])
+            result = self.cache.get(payload['cache_key'])
+            if result is not None:
+                discard_uploads(payload.pop('files').values())
+                self._put(job_id, payload, DONE, result)
+                return job_id
+        self._start()
+        try:
+            self._put(job_id, payload)
+        except QueueFull:
+            discard_uploads(payload['files'].values())
+            raise
+        return job_id
+
+    def get(self, job_id):
+        """
+        Get a job as a dict of id, status, payload, result and error, or None
+        if there is no such job
+        """
+        raise NotImplementedError
+
+    def _put(self, job_id, payload, status=QUEUED, result=None):
+        """
+        Store a new job; only queued jobs count towards and wait in the queue
+        """
+        raise NotImplementedError
+
+    def _claim(self):
+        """
+        Block until a job is available, mark it as running and return it
+        """
+        raise NotImplementedError
+
+    def _finish(self, job_id, status, payload, result=None, error=None):
+        raise NotImplementedError
+
+
+class MemoryJobQueue(JobQueue):
+    """
+    Job queue held in memory by a single process. Only the most recent
+    finished jobs are kept.
+    """
+
+    def __init__(self, runner=run_worklist, workers=2, max_queue=50, cache=None, keep=1000):
+        super().__init__(runner, workers, max_queue, cache)
+        self.keep = keep
+        self._jobs = OrderedDict()
+        self._finished = 0
+        self._waiting = queue.Queue(maxsize=max_queue)
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    def _put(self, job_id, payload, status=QUEUED, result=None):
+        job = {'id': job_id, 'status': status, 'payload': payload, 'result': result,
+               'error': None, 'created': time.time()}
+        with self._lock:
+            if status == QUEUED:
+                try:
+                    self._waiting.put_nowait(job_id)
+                except queue.Full:
+                    raise QueueFull('Too many jobs are waiting, please try again later')
+            else:
+                self._finished += 1
+            self._jobs[job_id] = job
+
+    def _claim(self):
+        job_id = self._waiting.get()
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = RUNNING
+        return job_id, job['payload']
+
+    def _finish(self, job_id, status, payload, result=None, error=None):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(status=status, payload=payload, result=result, error=error)
+            self._finished += 1
+            # Forget the oldest finished jobs
+            if self._finished > self.keep:
+                for old_id, old in list(self._jobs.items()):
+                    if old['status'] in (DONE, FAILED):
+                        del self._jobs[old_id]
+                        self._finished -= 1
+                        if self._finished <= self.keep:
+                            break
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Job queue stored in a SQLite database, which several processes may
+    share. Unless requeue is False, jobs left running when a server stopped
+    are queued again when it next starts; turn this off when processes are
+    started independently of each other. Finished jobs are deleted keep_for
+    seconds after they finish, as jobs are claimed.
+    """
+
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, path, runner=run_worklist, workers=2, max_queue=50, cache=None,
+                 requeue=True, keep_for=24 * 60 * 60):
+        super().__init__(runner, workers, max_queue, cache)
+        self.path = path
+        self.keep_for = keep_for
+        self._available = threading.Event()
+        with closing(self._connect()) as db:
+            db.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                       'id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, '
+                       'result TEXT, error TEXT, created REAL NOT NULL, updated REAL NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)')
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (status, updated)')
+            if requeue:
+                db.execute('UPDATE jobs SET status = ? WHERE status = ?', (QUEUED, RUNNING))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def get(self, job_id):
+        with closing(self._connect()) as db:
+            row = db.execute('SELECT id, status, payload, result, error, created FROM jobs '
+                             'WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'status': row[1], 'payload': json.loads(row[2]),
+                'result': json.loads(row[3]) if row[3] else None, 'error': row[4],
+                'created': row[5]}
+
+    def _put(self, job_id, payload, status=QUEUED, result=None):
+        now = time.time()
+        db = self._connect()
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            waiting = db.execute('SELECT COUNT(*) FROM jobs WHERE status = ?',
+                                 (QUEUED,)).fetchone()[0]
+            if status == QUEUED and waiting >= self.max_queue:
+                db.execute('ROLLBACK')
+                raise QueueFull('Too many jobs are waiting, please try again later')
+            db.execute('INSERT INTO jobs (id, status, payload, result, created, updated) '
+                       'VALUES (?, ?, ?, ?, ?, ?)',
+                       (job_id, status, json.dumps(payload),
+                        json.dumps(result) if result else None, now, now))
+            db.execute('COMMIT')
+        finally:
+            db.close()
+        if status == QUEUED:
+            self._available.set()
+
+    def _claim(self):
+        while True:
+            db = self._connect()
+            try:
+                db.execute('BEGIN IMMEDIATE')
+                row = db.execute('SELECT id, payload FROM jobs WHERE status = ? '
+                                 'ORDER BY created LIMIT 1', (QUEUED,)).fetchone()
+                now = time.time()
+                if row:
+                    db.execute('UPDATE jobs SET status = ?, updated = ? WHERE id = ?',
+                               (RUNNING, now, row[0]))
+                if self.keep_for is not None:
+                    db.execute('DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?',
+                               (DONE, FAILED, now - self.keep_for))
+                db.execute('COMMIT')
+            finally:
+                db.close()
+            if row:
+                return row[0], json.loads(row[1])
+            # Other processes may add jobs too, so poll as well as waiting
+            self._available.wait(self.POLL_INTERVAL)
+            self._available.clear()
+
+    def _finish(self, job_id, status, payload, result=None, error=None):
+        with closing(self._connect()) as db:
+            db.execute('UPDATE jobs SET status = ?, payload = ?, result = ?, error = ?, '
+                       'updated = ? WHERE id = ?',
+                       (status, json.dumps(payload), json.dumps(result) if result else None,
+                        error, time.time(), job_id))
@@ -0,0 +1,273 @@
+"""
+Typed loading of CSV input files against a declared schema.
+
+A schema names the headers a file must have and the type of any columns
+that are not text. Files are read in chunks of rows; blank rows are dropped,
+text is stripped, empty cells take their column's default if it has one and
+numeric columns are converted a whole column at a time into NumPy arrays.
+Every bad value in the file is collected and reported together once the
+file has been read, rather than stopping at the first.
+
+Plate matrices, bare grids of cells stacked one plate under another, are
+split into plates here too, as both the plate matrix generator and the plate
+format converters read them.
+"""
+import csv
+from itertools import islice
+
+import numpy as np
+
+from .metrics import stage, count
+
+
+# Number of rows converted at a time
+CHUNK_ROWS = 10000
+
+# Most errors listed in one message
+MAX_ERRORS = 50
+
+NUMPY_TYPES = {
+    float: np.float64,
+    int: np.int64,
+}
+
+
+class Schema(object):
+
+    def __init__(self, name, headers, types=None, optional=None, keep_text=None,
+                 defaults=None):
+        # Name of the file as shown to users
+        self.name = name
+        # Headers the file must have
+        self.headers = list(headers)
+        # Headers that are read if the file has them
+        self.optional = list(optional or [])
+        # Column name -> float or int, for the columns that are not text
+        self.types = types or {}
+        # Numeric columns whose text is also kept, as "<name> text"
+        self.keep_text = list(keep_text or [])
+        # Column name -> value of the cells left empty in optional columns
+        self.defaults = defaults or {}
+
+    def check_headers(self, fieldnames):
+        """
+        Check the headers of a file include those required by the schema
+        """
+        if not fieldnames:
+            raise Exception('The {} file is invalid; No headers present.'.format(self.name))
+        missing_headers = [h for h in self.headers if h not in fieldnames]
+        if missing_headers:
+            raise Exception('The file {} is missing the following headers: {}'
+                            .format(self.name, ", ".join(missing_headers)))
+
+
+class CSVTable(object):
+    """
+    Columns of a CSV file, in the order they appear in the file. Numeric
+    columns are NumPy arrays and text columns are lists of stripped strings.
+    """
+
+    def __init__(self, columns, line_numbers):
+        self.columns = columns
+        # Line of the file each row came from
+        self.line_numbers = line_numbers
+
+    def __len__(self):
+        return len(self.line_numbers)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def rows(self):
+        """
+        Iterate over the rows as dicts of plain Python values
+        """
+        names = list(self.columns)
+        values = [column.tolist() if isinstance(column, np.ndarray) else column
+                  for column in self.columns.values()]
+        for row in zip(*values):
+            yield dict(zip(names, row))
+
+
+class CSVErrors(Exception):
+
+    def __init__(self, file_name, errors):
+        self.errors = errors
+        lines = errors[:MAX_ERRORS]
+        if len(errors) > MAX_ERRORS:
+            lines.append('... and {} more'.format(len(errors) - MAX_ERRORS))
+        super().__init__('The {} file has errors: {}'.format(file_name, '; '.join(lines)))
+
+
+def _convert(values, line_numbers, name, kind, errors):
+    """
+    Convert a column of strings to a NumPy array, returning the array and a
+    mask of the values that could not be converted
+    """
+    dtype = NUMPY_TYPES[kind]
+    try:
+        return np.array(values, dtype=dtype), None
+    except ValueError:
+        pass
+    # Something in the column is bad, find everything that is
+    converted = np.zeros(len(values), dtype=dtype)
+    bad = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            converted[i] = kind(value)
+        except ValueError:
+            bad[i] = True
+            if value.strip() == '':
+                errors.append('line {}: {} is missing'.format(line_numbers[i], name))
+            else:
+                errors.append('line {}: {} "{}" is not {}'.format(
+                    line_numbers[i], name, value.strip(),
+                    'a number' if kind is float else 'a whole number'))
+    return converted, bad
+
+
+def read_chunks(file_object, schema, chunk_rows=CHUNK_ROWS):
+    """
+    Read a CSV file as a series of CSVTables of at most chunk_rows rows.
+
+    Headers are checked before any rows are read. Rows with bad values are
+    left out of the chunks, and once the whole file has been read CSVErrors
+    is raised listing every bad value.
+    """
+    reader = csv.reader(file_object)
+    fieldnames = next(reader, None)
+    schema.check_headers(fieldnames)
+    # Keep the schema columns, in file order
+    positions = {}
+    for i, name in enumerate(fieldnames):
+        if (name in schema.headers or name in schema.optional) and name not in positions:
+            positions[name] = i
+    errors = []
+    while True:
+        rows = []
+        line_numbers = []
+        read = 0
+        for row in islice(reader, chunk_rows):
+            read += 1
+            if any(field.strip() for field in row):
+                rows.append(row)
+                line_numbers.append(reader.line_num)
+        if read == 0:
+            break
+        count('rows_parsed', len(rows))
+        if not rows:
+            continue
+        columns = {}
+        bad = np.zeros(len(rows), dtype=bool)
+        for name, i in positions.items():
+            values = [row[i] if i < len(row) else '' for row in rows]
+            if name in schema.defaults:
+                default = str(schema.defaults[name])
+                values = [value if value.strip() else default for value in values]
+            kind = schema.types.get(name)
+            if kind is None:
+                columns[name] = [value.strip() for value in values]
+            else:
+                columns[name], bad_values = _convert(values, line_numbers, name, kind, errors)
+                if name in schema.keep_text:
+                    columns['{} text'.format(name)] = [value.strip() for value in values]
+                if bad_values is not None:
+                    bad |= bad_values
+        if bad.any():
+            keep = np.flatnonzero(~bad)
+            columns = {name: column[keep] if isinstance(column, np.ndarray)
+                       else [column[i] for i in keep] for name, column in columns.items()}
+            line_numbers = [line_numbers[i] for i in keep]
+        yield CSVTable(columns, line_numbers)
+    if errors:
+        raise CSVErrors(schema.name, errors)
+
+
+def load_csv(file_object, schema):
+    """
+    Read a whole CSV file into a single CSVTable
+    """
+    with stage('parse'):
+        return _load_csv(file_object, schema)
+
+
+def _load_csv(file_object, schema):
+    chunks = list(read_chunks(file_object, schema))
+    if len(chunks) == 1:
+        return chunks[0]
+    names = [name for name in chunks[0].columns] if chunks else \
+        [name for name in schema.headers]
+    columns = {}
+    for name in names:
+        parts = [chunk[name] for chunk in chunks]
+        if name in schema.types:
+            columns[name] = np.concatenate(parts) if parts else \
+                np.zeros(0, dtype=NUMPY_TYPES[schema.types[name]])
+        else:
+            columns[name] = [value for part in parts for value in part]
+    return CSVTable(columns, [n for chunk in chunks for n in chunk.line_numbers])
+
+
+def iter_rows(file_object, schema, chunk_rows=CHUNK_ROWS):
+    """
+    Stream the typed rows of a CSV file as dicts, without holding more than
+    a chunk of the file in memory. Errors are raised after the last row.
+    """
+    for chunk in read_chunks(file_object, schema, chunk_rows):
+        yield from chunk.rows()
+
+
+def parse_cell(cell):
+    """
+    Split a matrix cell written as "substance" or "substance(mix)"
+    """
+    name, p, mix = cell.rstrip(')').partition('(')
+    return name.strip(), mix.strip()
+
+
+def iter_matrices(lines, rows):
+    """
+    Split the lines of a stacked plate matrix into one matrix per plate, as
+    the lines are read.
+
+    Plates are stacked one under another, either separated by blank lines or
+    straight after each other, so a block of lines longer than a plate is split
+    every rows lines. Trailing empty rows of a plate may be left out.
+
+    Rows with no filled cells (spreadsheets save blank rows as ",,,") are
+    only rows of a plate where they come before or between its filled rows.
+    Straight after a full plate they separate it from the next, and at the
+    end of a plate they are left out like other trailing empty rows.
+    """
+    matrix = []
+    # Rows with no filled cells, held until the next filled row shows whether
+    # they are part of a plate
+    empty = []
+    # Whether the last plate ended by filling up
+    full = False
+    for line in lines:
+        if not line:
+            if matrix:
+                yield matrix
+            elif empty and not full:
+                # A plate with nothing on it
+                yield empty[:rows]
+            matrix, empty, full = [], [], False
+        elif not any(cell.strip() for cell in line):
+            empty.append(line)
+        else:
+            pending = [line] if full and not matrix else empty + [line]
+            empty = []
+            for row in pending:
+                matrix.append(row)
+                if len(matrix) == rows:
+                    yield matrix
+                    matrix = []
+            full = not matrix
+    if matrix:
+        yield matrix
+    elif empty and not full:
+        yield empty[:rows]
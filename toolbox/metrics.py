@@ -0,0 +1,222 @@
+"""
+Timing and counting of the stages of generation runs.
+
+Code times a stage with "with stage('setup'):" and counts things with
+count('rows_parsed', n). Both are recorded against the run that the current
+thread is making, if any, so nothing needs to be passed down to them; a run is
+recorded with "with record('partpooling') as recorder:". A stage that runs
+more than once in a run, e.g. spilling rows to a temporary file, adds up.
+
+When a run finishes its stage times are added to histograms and its counters
+to the totals in METRICS, which are served in the Prometheus text format, and
+the run is logged as one JSON line on the toolbox.metrics logger. A run can also be profiled with
+cProfile, giving the profile as text.
+"""
+import io
+import re
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from collections import OrderedDict
+
+
+logger = logging.getLogger('toolbox.metrics')
+
+# Number of functions shown in a profile
+PROFILE_LINES = 40
+
+# Upper bounds of the stage time histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current = threading.local()
+
+
+def current():
+    """
+    The recorder of the run being made on this thread, or None
+    """
+    return getattr(_current, 'recorder', None)
+
+
+class Recorder(object):
+
+    def __init__(self, name, profile=False):
+        # What is being run, e.g. the generator function
+        self.name = name
+        # Stage -> seconds and counter -> total, in the order first seen
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+        self.status = None
+        self.seconds = None
+        self.profile = None
+        self._profiler = None
+        if profile:
+            # Only imported when profiling
+            import cProfile
+            self._profiler = cProfile.Profile()
+        self._previous = None
+        self._started = None
+
+    def add_time(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0) + seconds
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def start(self):
+        self._previous = current()
+        _current.recorder = self
+        self._started = time.perf_counter()
+        if self._profiler:
+            self._profiler.enable()
+        return self
+
+    def finish(self, status='done', metrics=None, **fields):
+        """
+        Stop recording, add the run to the metrics and log it. Extra fields
+        are added to the log line.
+        """
+        if self._profiler:
+            import pstats
+            self._profiler.disable()
+            output = io.StringIO()
+            pstats.Stats(self._profiler, stream=output).sort_stats('cumulative') \
+                .print_stats(PROFILE_LINES)
+            self.profile = output.getvalue()
+        self.seconds = time.perf_counter() - self._started
+        self.status = status
+        _current.recorder = self._previous
+        (metrics or METRICS).add(self)
+        line = {'event': 'run', 'name': self.name, 'status': status}
+        line.update(fields)
+        line.update(self.as_dict())
+        logger.info(json.dumps(line))
+
+    def as_dict(self):
+        return {
+            'seconds': round(self.seconds or 0, 6),
+            'stages': {stage: round(seconds, 6) for stage, seconds in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+
+@contextmanager
+def record(name, profile=False, metrics=None, **fields):
+    """
+    Record the stages and counters of a run made inside the block
+    """
+    recorder = Recorder(name, profile=profile).start()
+    try:
+        yield recorder
+    except Exception:
+        recorder.finish('failed', metrics, **fields)
+        raise
+    recorder.finish('done', metrics, **fields)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a stage of the current run
+    """
+    recorder = current()
+    if recorder is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add_time(name, time.perf_counter() - started)
+
+
+def count(counter, n=1):
+    """
+    Add to a counter of the current run
+    """
+    recorder = current()
+    if recorder is not None:
+        recorder.count(counter, n)
+
+
+def server_timing(stages, prefix=''):
+    """
+    Value of a Server-Timing header for stage times in seconds
+    """
+    return ', '.join('{}{};dur={:.1f}'.format(prefix, re.sub(r'[^\w-]', '_', stage),
+                                              seconds * 1000)
+                     for stage, seconds in stages.items())
+
+
+class Metrics(object):
+    """
+    Thread safe totals of the runs made by this process
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, status) -> number of runs
+        self.runs = {}
+        # (name, stage) -> [total seconds, times run, runs in each bucket]
+        self.stages = {}
+        # (name, counter) -> total
+        self.counters = {}
+
+    def add(self, recorder):
+        with self._lock:
+            key = (recorder.name, recorder.status)
+            self.runs[key] = self.runs.get(key, 0) + 1
+            for stage, seconds in recorder.stages.items():
+                total = self.stages.setdefault((recorder.name, stage),
+                                               [0.0, 0, [0] * (len(BUCKETS) + 1)])
+                total[0] += seconds
+                total[1] += 1
+                total[2][bisect_left(BUCKETS, seconds)] += 1
+            for counter, n in recorder.counters.items():
+                key = (recorder.name, counter)
+                self.counters[key] = self.counters.get(key, 0) + n
+
+    def render(self):
+        """
+        The metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            runs = sorted(self.runs.items())
+            stages = [(key, (seconds, n, list(buckets)))
+                      for key, (seconds, n, buckets) in sorted(self.stages.items())]
+            counters = sorted(self.counters.items())
+        lines = [
+            '# HELP toolbox_runs_total Runs finished, by status',
+            '# TYPE toolbox_runs_total counter',
+        ]
+        for (name, status), n in runs:
+            lines.append('toolbox_runs_total{{name="{}",status="{}"}} {}'.format(name, status, n))
+        lines.extend([
+            '# HELP toolbox_stage_seconds Time spent in each stage of runs',
+            '# TYPE toolbox_stage_seconds histogram',
+        ])
+        for (name, stage_name), (seconds, n, buckets) in stages:
+            labels = '{{name="{}",stage="{}"}}'.format(name, stage_name)
+            below = 0
+            for bound, in_bucket in zip(BUCKETS + ('+Inf',), buckets):
+                below += in_bucket
+                lines.append('toolbox_stage_seconds_bucket{{name="{}",stage="{}",le="{}"}} {}'
+                             .format(name, stage_name, bound, below))
+            lines.append('toolbox_stage_seconds_sum{} {:.6f}'.format(labels, seconds))
+            lines.append('toolbox_stage_seconds_count{} {}'.format(labels, n))
+        by_counter = OrderedDict()
+        for (name, counter), n in counters:
+            by_counter.setdefault(counter, []).append((name, n))
+        for counter in sorted(by_counter):
+            metric = 'toolbox_{}_total'.format(re.sub(r'\W', '_', counter))
+            lines.append('# TYPE {} counter'.format(metric))
+            for name, n in by_counter[counter]:
+                lines.append('{}{{name="{}"}} {}'.format(metric, name, n))
+        return '\n'.join(lines) + '\n'
+
+
+# Totals for the whole process
+METRICS = Metrics()
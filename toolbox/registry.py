@@ -0,0 +1,21 @@
+from importlib import import_module
+
+
+VALID_WORKLIST_FUNCTIONS = {
+    'partpooling': 'toolbox.generators.partpooling.PartPoolingGenerator',
+    'librarypooling': 'toolbox.generators.librarypooling.LibraryPoolingGenerator',
+    'matrix': 'toolbox.generators.matrix.PlateMatrixGenerator',
+}
+
+VALID_CONVERTER_FUNCTIONS = {
+    'listtoplate': 'toolbox.converters.listtoplate.ListToPlateConverter',
+    'plateformat': 'toolbox.converters.plateformat.PlateFormatConverter',
+}
+
+
+def load_class(path):
+    """
+    Import and return a class from its dotted path
+    """
+    module, class_name = path.rsplit('.', 1)
+    return getattr(import_module(module), class_name)
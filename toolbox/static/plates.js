@@ -3,8 +3,6 @@ $(document).ready(function() {
     var colours = [
 		'#f44336', '#e91e63', '#9c27b0', '#673ab7', '#3f51b5', '#2196f3', '#03a9f4', '#00bcd4', '#009688', '#4caf50', '#8bc34a', '#cddc39', '#ffeb3b', '#ffc107', '#ff9800', '#ff5722', '#795548', '#ef9a9a', '#f48fb1', '#ce93d8', '#b39ddb', '#9fa8da', '#90caf9', '#81d4fa', '#80deea', '#80cbc4', '#a5d6a7', '#c5e1a5', '#e6ee9c', '#fff59d', '#ffecb3', '#ffcc80', '#ffab91', '#bcaaa4', '#c62828', '#ad1457', '#6a1b9a', '#4527a0', '#283593', '#1565c0', '#0277bd', '#00838f', '#00695c', '#2e7d32', '#558b2f', '#9e9d24', '#f9a825', '#ff8f00', '#ef6c00', '#d84315', '#4e342e'];
 
-    var positions = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'.split('');
-
     var platePadding = 10;
     var wellPadding = 8;
 
@@ -26,8 +24,9 @@ $(document).ready(function() {
         .attr('class', 'hover')
         .style('opacity', 0);
 
+    // Wells are numbered across each row in turn from 0
     var getTopPosition = function(d) {
-        var row = positions.indexOf(d.coord[0]) + 1;
+        var row = Math.floor(d.index / d.columns) + 1;
         if (row == 1) {
             return wellPadding + 'px'; //((row * wellDiameter)) + 'px';
         } else {
@@ -36,7 +35,7 @@ $(document).ready(function() {
     };
 
     var getLeftPosition = function(d) {
-        var col = d.coord[1];
+        var col = (d.index % d.columns) + 1;
         if (col == 1) {
             return wellPadding + 'px';
         } else {
@@ -45,8 +44,7 @@ $(document).ready(function() {
     };
 
     var getContentsColour = function(d) {
-        var substance = d[1];
-        var substanceIdx = plate_data.plates.substances.indexOf(substance);
+        var substanceIdx = d[2];
         var colourId = substanceIdx;
         if (substanceIdx >= colours.length) {
             colourId = substanceIdx % colours.length;
@@ -96,39 +94,100 @@ $(document).ready(function() {
     plates.append('div')
         .attr('class', 'title')
         .html(function(d) {
-            var detail = ' <span class="detail">Position: ' + d.location + '</span>';
+            var detail = ' <span class="detail">Position: ' + d.location + ', ' +
+                d.filled + ' wells filled</span>';
             return '<span class="ui label">' + d.label + detail + '</span>';
         })
 
-    var wells = plates.selectAll('div.well')
-        .data(function(d) { return d.wells; })
-        .enter().append('div')
-        .attr('class', 'well')
-        .style('width', wellDiameter + 'px')
-        .style('height', wellDiameter + 'px')
-        .style('top', function(d) { return getTopPosition(d); })
-        .style('left', function(d) { return getLeftPosition(d); })
-        .on('mouseover', function(d) {
-            if (d.contents.length > 0) {
+    // Every well of the plate, empty until the layout is fetched
+    var makeWells = function(plate) {
+        var wells = [];
+        var columns = plate.layout[0];
+        for (var i = 0; i < plate.well_count; i++) {
+            wells.push({index: i, columns: columns, contents: [], total: 0});
+        }
+        return wells;
+    };
+
+    // Fill the wells from a plate layout; the contents of the ith filled well
+    // are entries offsets[i] to offsets[i + 1]
+    var fillWells = function(wells, layout) {
+        $.each(layout.wells, function(i, index) {
+            var contents = [];
+            for (var e = layout.offsets[i]; e < layout.offsets[i + 1]; e++) {
+                var substance = layout.substances[e];
+                contents.push([layout.amounts[e], plate_data.plates.substances[substance],
+                               substance]);
+            }
+            wells[index].contents = contents;
+            wells[index].total = layout.totals[i];
+        });
+    };
+
+    var drawWells = function(element, plate) {
+        d3.select(element).selectAll('div.well')
+            .data(makeWells(plate))
+            .enter().append('div')
+            .attr('class', 'well')
+            .style('width', wellDiameter + 'px')
+            .style('height', wellDiameter + 'px')
+            .style('top', function(d) { return getTopPosition(d); })
+            .style('left', function(d) { return getLeftPosition(d); });
+    };
+
+    var showLayout = function(element, layout) {
+        var wells = d3.select(element).selectAll('div.well');
+        fillWells(wells.data(), layout);
+        wells
+            .on('mouseover', function(d) {
+                if (d.contents.length > 0) {
+                    hover.transition()
+                        .duration(200)
+                        .style('opacity', 1);
+                    hover.html(makeHoverHTML(d))
+                        .style('top', (d3.event.pageY) + 'px')
+                        .style('left', (d3.event.pageX) + 'px')
+                }
+            })
+            .on('mouseout', function(d) {
                 hover.transition()
                     .duration(200)
-                    .style('opacity', 1);
-                hover.html(makeHoverHTML(d))
-                    .style('top', (d3.event.pageY) + 'px')
-                    .style('left', (d3.event.pageX) + 'px')
-            }
-        })
-        .on('mouseout', function(d) {
-            hover.transition()
-                .duration(200)
-                .style('opacity', 0)
-        })
-        .html(function(d) {
-            if (d.contents.length > 1) {
-                return '<span class="contents number">' + d.contents.length + '</span>'
-            } else if (d.contents.length == 1) {
-                var colour = getContentsColour(d.contents[0]);
-                return '<span class="contents" style="background: ' + colour + '"></span>'
-            }
+                    .style('opacity', 0)
+            })
+            .html(function(d) {
+                if (d.contents.length > 1) {
+                    return '<span class="contents number">' + d.contents.length + '</span>'
+                } else if (d.contents.length == 1) {
+                    var colour = getContentsColour(d.contents[0]);
+                    return '<span class="contents" style="background: ' + colour + '"></span>'
+                }
+            });
+    };
+
+    // Layouts are fetched when their plate is scrolled into view
+    var loadLayout = function(element, plate) {
+        if (plate.filled == 0 || element.loading) {
+            return;
+        }
+        element.loading = true;
+        $.getJSON(plate.url, function(layout) {
+            showLayout(element, layout);
+        });
+    };
+
+    plates.each(function(d) { drawWells(this, d); });
+
+    if ('IntersectionObserver' in window) {
+        var observer = new IntersectionObserver(function(entries) {
+            $.each(entries, function(i, entry) {
+                if (entry.isIntersecting) {
+                    observer.unobserve(entry.target);
+                    loadLayout(entry.target, d3.select(entry.target).datum());
+                }
+            });
         });
+        plates.each(function() { observer.observe(this); });
+    } else {
+        plates.each(function(d) { loadLayout(this, d); });
+    }
 });
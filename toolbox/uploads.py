@@ -0,0 +1,143 @@
+"""
+Stream uploaded files rather than reading them into memory.
+
+Uploads are read a chunk at a time through LimitedReader, which aborts as
+soon as a file goes over its size limit. Files for background jobs are
+spooled to disk, checking the CSV headers from the first line before the
+rest of the file is read and hashing the contents on the way through.
+"""
+import io
+import os
+import csv
+import hashlib
+import tempfile
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadBudget(object):
+    """
+    Number of bytes that may be read across all of the files of a request
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+
+    def remaining(self):
+        return self.limit - self.count
+
+    def charge(self, size):
+        self.count += size
+        if self.count > self.limit:
+            raise UploadTooLarge('The uploaded files are larger than the {} byte limit'
+                                 .format(self.limit))
+
+
+class LimitedReader(io.RawIOBase):
+    """
+    Binary stream that raises UploadTooLarge once more than limit bytes
+    have been read from the underlying stream, or the request's budget has
+    been used up
+    """
+
+    def __init__(self, stream, limit=None, name='upload', budget=None):
+        self.stream = stream
+        self.limit = limit
+        self.name = name
+        self.budget = budget
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def _counted(self, data):
+        self.count += len(data)
+        if self.limit is not None and self.count > self.limit:
+            raise UploadTooLarge('The {} file is larger than the {} byte limit'
+                                 .format(self.name, self.limit))
+        if self.budget is not None:
+            self.budget.charge(len(data))
+        return data
+
+    def readinto(self, buffer):
+        data = self._counted(self.stream.read(len(buffer)))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def remaining(self):
+        """
+        Bytes that may still be read, or None if there is no limit
+        """
+        left = [self.limit - self.count] if self.limit is not None else []
+        if self.budget is not None:
+            left.append(self.budget.remaining())
+        return min(left) if left else None
+
+    def readline(self, size=-1):
+        # A line is read no further than one byte past the limit, so a file
+        # without line breaks is never held in memory whole
+        remaining = self.remaining()
+        if remaining is not None and (size < 0 or size > remaining):
+            size = max(remaining, 0) + 1
+        return self._counted(self.stream.readline(size))
+
+
+def open_upload(stream, limit=None, name='upload', budget=None):
+    """
+    Open an uploaded binary stream as text, ready for csv to read a row at a
+    time
+    """
+    return io.TextIOWrapper(io.BufferedReader(LimitedReader(stream, limit, name, budget)),
+                            encoding='utf-8', newline='')
+
+
+def check_headers(line, schema):
+    """
+    Check the header line of a CSV file includes the headers of its schema
+    """
+    try:
+        fieldnames = next(csv.reader([line.decode('utf-8')]), None)
+    except UnicodeDecodeError:
+        raise Exception('The {} file is not a valid UTF-8 CSV file.'.format(schema.name))
+    schema.check_headers(fieldnames)
+
+
+def spool_upload(stream, limit=None, schema=None, budget=None, directory=None):
+    """
+    Copy an upload to a temporary file a chunk at a time, checking the
+    headers of the first line if a schema is given. Returns the path of the
+    file and the SHA-256 hex digest of its contents.
+    """
+    name = schema.name if schema is not None else 'upload'
+    source = LimitedReader(stream, limit, name, budget)
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(suffix='.csv', prefix='upload-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as spooled:
+            # Read no more of the first line than the limits allow
+            first = source.readline()
+            if schema is not None:
+                check_headers(first, schema)
+            digest.update(first)
+            spooled.write(first)
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                spooled.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def discard_uploads(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass